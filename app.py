@@ -1,12 +1,379 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, stream_template, stream_with_context
+from flask import send_file
 from flask_migrate import Migrate
 from datetime import datetime, timedelta
 import os
+import re
 import calendar
-from sqlalchemy import extract, and_, or_, func
+import tempfile
+import numpy as np
+from sqlalchemy import extract, and_, or_, func, case, cast, literal, select, union_all, type_coerce, text, tuple_, event
+from sqlalchemy.orm import joinedload, contains_eager
 from models import db, ItemType, Location, InventoryItem, Tank, BCD, Regulator, Mask, MaintenanceRecord, CheckoutRecord
+from models import TankMaintenanceRecord, InventoryMaintenanceRecord
+from models import ensure_due_date_columns, ensure_indexes, backfill_due_dates
+from models import ensure_bcd_counter_columns, refresh_bcd_maintenance_counters
+from maintenance_rules import build_rules, current_rules, get_rule, rule_for_label, due_filter
+from maintenance_rules import changed_rules, stale_due_dates
+from search_index import SEARCH_MODES, TRIGRAM_MIN_LENGTH, search_index_exists, create_search_index, rebuild_search_index, match_expression
+from export import EXPORT_FORMATS, export_format_or_fallback, export_extension, write_export
+from checkouts import check_out_item, check_in_item, run_checkout_stress
+from checkouts import (parse_item_tokens, resolve_items, items_out_to, check_in_items, check_out_kit, check_in_kit,
+                       describe_item, kit_summary)
+from maintenance_batch import BATCH_EQUIPMENT, record_maintenance_batch, batch_summary
+from storage import DEFAULT_PRAGMAS, BASELINE_PRAGMAS, configure_storage, read_pragmas, WalCheckpointer, run_benchmark
+from cache import ModalDataCache, MODAL_EQUIPMENT_TYPES, modal_equipment_query, modal_equipment_id_column, modal_equipment_row
 import sys
+import threading
+import time
 import webbrowser
+import click
+
+def upcoming_maintenance_query(start, end):
+    """Build one UNION ALL select of every maintenance rule coming due in (start, end]"""
+    selects = []
+    for rule in current_rules():
+        due_date = rule.next_due_expr()
+        selects.append(select(
+            rule.model.id.label('id'),
+            literal(rule.item_type_id).label('type_id'),
+            InventoryItem.manufacturer.label('manufacturer'),
+            InventoryItem.model.label('model'),
+            literal(rule.item_type).label('type_name'),
+            literal(rule.label).label('maintenance_type'),
+            due_date.label('due_date')
+        ).join(InventoryItem, rule.model.inventory_item_id == InventoryItem.id).where(
+            rule.upcoming_filter(start, end)))
+
+    upcoming = union_all(*selects).subquery()
+    return select(upcoming).order_by(upcoming.c.due_date, upcoming.c.type_id, upcoming.c.id)
+
+
+# Columns pulled for the tanks list, in the order of TANK_COLUMN_NAMES. Dates come
+# back as the raw ISO strings SQLite stores so NumPy can parse them in bulk.
+TANK_COLUMNS = (
+    Tank.id, InventoryItem.id, Tank.tank_number, InventoryItem.manufacturer, InventoryItem.serial_number,
+    type_coerce(Tank.hydro_date, db.String), type_coerce(Tank.vip_date, db.String),
+    Tank.tank_material, Tank.working_pressure, Tank.gas_type,
+    InventoryItem.location_id, InventoryItem.condition_code, InventoryItem.currently_checked_out,
+    type_coerce(Tank.next_hydro_due, db.String), type_coerce(Tank.next_vip_due, db.String),
+    type_coerce(Tank.next_due, db.String)
+)
+TANK_DATE_COLUMNS = ('Hydro_Date', 'VIP_Date', 'next_hydro_date', 'next_vip_date', 'next_maintenance_date')
+TANK_COLUMN_NAMES = (
+    'id', 'inventory_id', 'Tank_Number', 'Manufacturer', 'Serial_Number',
+    'Hydro_Date', 'VIP_Date', 'Tank_Material', 'Working_Pressure', 'Gas_Type',
+    'location', 'condition_code', 'currently_checked_out',
+    'next_hydro_date', 'next_vip_date', 'next_maintenance_date'
+)
+
+
+def to_datetime64(values):
+    """Parse a column of ISO date strings (None allowed) into a datetime64 array with NaT"""
+    return np.array(values, dtype='datetime64[us]')
+
+
+def format_dates(values):
+    """Format a datetime64 array as MM/DD/YYYY strings, 'Not Available' for NaT"""
+    iso = np.datetime_as_string(values, unit='D').astype('U10')
+    # Reorder the characters of YYYY-MM-DD into MM/DD/YYYY
+    chars = iso.view('U1').reshape(-1, 10)[:, [5, 6, 4, 8, 9, 7, 0, 1, 2, 3]]
+    chars[:, 2] = '/'
+    chars[:, 5] = '/'
+    formatted = np.ascontiguousarray(chars).view('U10').ravel()
+    return np.where(np.isnat(values), 'Not Available', formatted).tolist()
+
+
+def month_end_boundaries(start_year, end_year):
+    """Last day of every month from January start_year through December end_year"""
+    boundaries = []
+    for year in range(start_year, end_year + 1):
+        for month_num in range(1, 13):
+            boundaries.append(datetime(year, month_num, calendar.monthrange(year, month_num)[1]))
+    return boundaries
+
+
+def due_counts_by_boundary(model, boundaries):
+    """Count records of a model due on or before each boundary
+
+    Loads the materialized due dates once and sweeps the boundaries over them
+    with searchsorted, so the cost does not grow with the number of months.
+    """
+    rows = db.session.query(type_coerce(model.next_due, db.String)).filter(model.next_due.isnot(None)).all()
+    due_dates = np.sort(to_datetime64([row[0] for row in rows]))
+    return np.searchsorted(due_dates, to_datetime64(boundaries), side='right').tolist()
+
+
+def maintenance_due_by_month(start_year, end_year):
+    """BCD and tank maintenance due counts at each month end of a range of years"""
+    boundaries = month_end_boundaries(start_year, end_year)
+    bcd_due_counts = due_counts_by_boundary(BCD, boundaries)
+    tank_due_counts = due_counts_by_boundary(Tank, boundaries)
+    return [{
+        'year': month_end.year,
+        'month': month_end.month,
+        'bcd_maintenance_due': bcd_due,
+        'tank_maintenance_due': tank_due,
+        'total_maintenance_due': bcd_due + tank_due
+    } for month_end, bcd_due, tank_due in zip(boundaries, bcd_due_counts, tank_due_counts)]
+
+
+def tank_status_table(rows, now, upcoming_end):
+    """Classify and format tank rows column-wise
+
+    Produces the same dictionaries as tank_display_data() and a parallel
+    list of 'due', 'upcoming' or 'current' statuses.
+    """
+    if not rows:
+        return [], []
+    columns = dict(zip(TANK_COLUMN_NAMES, zip(*rows)))
+
+    dates = {key: to_datetime64(columns[key]) for key in TANK_DATE_COLUMNS}
+    for key, values in dates.items():
+        # NaT becomes None, everything else a datetime like the ORM returns
+        columns[key] = values.tolist()
+    hydro = dates['Hydro_Date']
+    vip = dates['VIP_Date']
+    next_hydro = dates['next_hydro_date']
+    next_vip = dates['next_vip_date']
+    next_due = dates['next_maintenance_date']
+
+    # NaT never compares true, so tanks without dates stay current
+    due = next_due <= np.datetime64(now, 'us')
+    upcoming = ~due & (next_due <= np.datetime64(upcoming_end, 'us'))
+    statuses = np.where(due, 'due', np.where(upcoming, 'upcoming', 'current')).tolist()
+
+    hydro_first = ~np.isnat(next_hydro) & (np.isnat(next_vip) | (next_hydro <= next_vip))
+    next_type = np.where(due, np.where(hydro_first, 'Hydro Test', 'VIP Inspection'), '').tolist()
+
+    formatted = {
+        'Hydro_Date_Formatted': format_dates(hydro),
+        'VIP_Date_Formatted': format_dates(vip),
+        'next_hydro_date_Formatted': format_dates(next_hydro),
+        'next_vip_date_Formatted': format_dates(next_vip),
+        'next_maintenance_date_Formatted': format_dates(next_due)
+    }
+
+    # Assemble the template dictionaries from whole columns in one pass
+    columns['Tank_ID'] = columns['id']
+    columns['maintenance_due'] = due.tolist()
+    columns['next_maintenance_type'] = [value or None for value in next_type]
+    columns.update(formatted)
+    keys = list(columns)
+    tanks = [dict(zip(keys, values)) for values in zip(*columns.values())]
+    return tanks, statuses
+
+
+def group_tanks_by_status(tanks, statuses):
+    """Bucket tank dictionaries into 'due', 'upcoming' and 'current', keeping their order"""
+    tanks_by_status = {
+        'due': [],
+        'upcoming': [],
+        'current': []
+    }
+    for tank_data, tank_status in zip(tanks, statuses):
+        tanks_by_status[tank_status].append(tank_data)
+    return tanks_by_status
+
+
+# Sortable columns for the inventory list
+INVENTORY_SORT_COLUMNS = {
+    'id': InventoryItem.id,
+    'manufacturer': InventoryItem.manufacturer,
+    'model': InventoryItem.model,
+    'serial_number': InventoryItem.serial_number,
+    'location': Location.name,
+    'condition': InventoryItem.condition_code,
+    'intake_date': InventoryItem.intake_date
+}
+
+
+def maintenance_status(next_due, now, upcoming_end):
+    """Classify a record as 'due', 'upcoming' or 'current' by its next_due date"""
+    if next_due and next_due <= now:
+        return 'due'
+    if next_due and next_due <= upcoming_end:
+        return 'upcoming'
+    return 'current'
+
+
+def checkout_filter_conditions(filters):
+    """SQL conditions for the checkout history filters"""
+    conditions = []
+    if filters['person']:
+        # Prefix range on lower(person_name) so the expression index is used
+        prefix = filters['person'].lower()
+        person = func.lower(CheckoutRecord.person_name)
+        conditions.append(and_(person >= prefix, person < prefix + '\U0010ffff'))
+    if filters['type'] is not None:
+        conditions.append(CheckoutRecord.inventory_item_id.in_(
+            select(InventoryItem.id).where(InventoryItem.item_type_id == filters['type'])))
+    if filters['status'] == 'open':
+        conditions.append(CheckoutRecord.checkin_date.is_(None))
+    elif filters['status'] == 'closed':
+        conditions.append(CheckoutRecord.checkin_date.isnot(None))
+    if filters['start']:
+        conditions.append(CheckoutRecord.checkout_date >= filters['start'])
+    if filters['end']:
+        conditions.append(CheckoutRecord.checkout_date < filters['end'] + timedelta(days=1))
+    return conditions
+
+
+def encode_checkout_cursor(checkout):
+    return f"{checkout.checkout_date.isoformat()}_{checkout.id}"
+
+
+def decode_checkout_cursor(cursor):
+    """Parse a 'checkout_date_id' cursor, returning None if it is malformed"""
+    try:
+        checkout_date, checkout_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(checkout_date), int(checkout_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def iter_checkout_page(query, per_page, pager):
+    """Yield up to per_page checkouts, recording the cursor of the next page in pager"""
+    last = None
+    for count, checkout in enumerate(query.limit(per_page + 1).yield_per(500)):
+        if count == per_page:
+            pager['next_cursor'] = encode_checkout_cursor(last)
+            break
+        last = checkout
+        yield checkout
+
+
+def checkout_summary(conditions=()):
+    """Total, currently out and average returned duration over matching checkouts, in one query"""
+    total, currently_out, average_days = db.session.query(
+        func.count(CheckoutRecord.id),
+        func.count(CheckoutRecord.id).filter(CheckoutRecord.checkin_date.is_(None)),
+        func.avg(cast(func.julianday(CheckoutRecord.checkin_date) - func.julianday(CheckoutRecord.checkout_date),
+                      db.Integer))
+    ).filter(*conditions).one()
+    return {
+        'total': total,
+        'currently_out': currently_out,
+        'average_days': round(average_days) if average_days is not None else None
+    }
+
+
+# Tables small enough that scanning them is the best plan
+QUERY_PLAN_SCAN_ALLOWED = ('item_types', 'locations')
+
+# Hot pages whose queries must use indexes; ids are filled in by query_plan_page_ids()
+QUERY_PLAN_PAGES = (
+    '/', '/inventory', '/inventory?checked_out=1', '/inventory?type=1', '/tanks',
+    '/maintenance', '/checkouts', '/checkouts?status=open', '/checkouts?person=a',
+    '/reports/monthly/{year}/{month}', '/reports/yearly/{year}',
+    '/api/quick-maintenance/items?type=bcd&q=1',
+    '/checkout/{item_id}', '/checkin/{item_id}',
+    # The BCD's item page shows its maintenance history
+    '/maintenance/{bcd_id}', '/item/{bcd_item_id}', '/tank/{tank_id}',
+)
+
+
+def full_table_scans(statement, plan):
+    """Steps of an EXPLAIN QUERY PLAN result that scan a whole table instead of using an index
+
+    Statements without a WHERE clause aggregate or list the whole table anyway,
+    so only filtered statements are checked.
+    """
+    if not re.search(r'(?<!FILTER \()\bWHERE\b', statement):
+        return []
+    scans = []
+    for row in plan:
+        match = re.fullmatch(r'SCAN (\w+)', row[3])
+        if not match:
+            continue
+        # Strip the _1 suffix SQLAlchemy gives aliased tables
+        table = match.group(1)
+        if table not in db.metadata.tables:
+            table = re.sub(r'_\d+$', '', table)
+        if table in db.metadata.tables and table not in QUERY_PLAN_SCAN_ALLOWED:
+            scans.append(row[3])
+    return scans
+
+
+def query_plan_page_ids():
+    """Values for the QUERY_PLAN_PAGES placeholders: this month and the first record of each kind"""
+    now = datetime.now()
+    bcd = db.session.query(BCD.id, BCD.inventory_item_id).order_by(BCD.id).first()
+    return {
+        'year': now.year,
+        'month': now.month,
+        'item_id': db.session.query(func.min(InventoryItem.id)).scalar(),
+        'bcd_id': bcd.id if bcd else None,
+        'bcd_item_id': bcd.inventory_item_id if bcd else None,
+        'tank_id': db.session.query(func.min(Tank.id)).scalar()
+    }
+
+
+def explain_page_queries(client, page):
+    """GET a page and return its response and (statement, EXPLAIN QUERY PLAN rows) for each SELECT it ran"""
+    statements = {}
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.setdefault(statement, parameters)
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        response = client.get(page)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    with db.engine.connect() as conn:
+        plans = [(statement, conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall())
+                 for statement, parameters in statements.items()]
+    return response, plans
+
+
+def tank_display_data(tank, item, status):
+    """Build the template dictionary for a tank from its materialized due dates"""
+    next_hydro = tank.next_hydro_due
+    next_vip = tank.next_vip_due
+    maintenance_due = status == 'due'
+
+    next_maintenance_type = None
+    if maintenance_due:
+        if next_hydro and next_vip:
+            next_maintenance_type = "Hydro Test" if next_hydro <= next_vip else "VIP Inspection"
+        elif next_hydro:
+            next_maintenance_type = "Hydro Test"
+        else:
+            next_maintenance_type = "VIP Inspection"
+
+    def formatted(value):
+        return value.strftime('%m/%d/%Y') if value else 'Not Available'
+
+    return {
+        'id': tank.id,
+        'inventory_id': item.id,
+        'Tank_ID': tank.id,
+        'Tank_Number': tank.tank_number,
+        'Manufacturer': item.manufacturer,
+        'Serial_Number': item.serial_number,
+        'Hydro_Date': tank.hydro_date,
+        'VIP_Date': tank.vip_date,
+        'Tank_Material': tank.tank_material,
+        'Working_Pressure': tank.working_pressure,
+        'Gas_Type': tank.gas_type,
+        'location': item.location_id,
+        'condition_code': item.condition_code,
+        'maintenance_due': maintenance_due,
+        'next_maintenance_type': next_maintenance_type,
+        'next_maintenance_date': tank.next_due,
+        'currently_checked_out': item.currently_checked_out,
+        'Hydro_Date_Formatted': formatted(tank.hydro_date),
+        'VIP_Date_Formatted': formatted(tank.vip_date),
+        'next_hydro_date': next_hydro,
+        'next_hydro_date_Formatted': formatted(next_hydro),
+        'next_vip_date': next_vip,
+        'next_vip_date_Formatted': formatted(next_vip),
+        'next_maintenance_date_Formatted': formatted(tank.next_due)
+    }
+
 
 def create_app(test_config=None):
     # Create and configure the app
@@ -42,12 +409,80 @@ def create_app(test_config=None):
         SECRET_KEY='inventory_management_secret_key',
         SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.join(app.instance_path, "inventory.db")}',
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # Seconds before the maintenance modal snapshot is rebuilt even without writes
+        GLOBAL_DATA_CACHE_SECONDS=300,
+        # 'lazy' loads the maintenance modal pickers from /api/quick-maintenance/items,
+        # 'preload' renders every item into the modal on each page
+        QUICK_MAINTENANCE_MODE='lazy',
+        QUICK_MAINTENANCE_PAGE_SIZE=20,
+        # Length of the dashboard's upcoming maintenance window
+        DASHBOARD_UPCOMING_DAYS=30,
+        # Interval overrides in months keyed by 'ItemType.kind', e.g. {'Tank.hydro': 60}
+        MAINTENANCE_INTERVALS={},
+        INVENTORY_PAGE_SIZE=100,
+        # Use the FTS5 trigram index for /search when SQLite supports it
+        SEARCH_FTS_ENABLED=True,
+        SEARCH_PAGE_SIZE=50,
+        # Checkout history rows per page, and the cap for streamed pages
+        CHECKOUT_PAGE_SIZE=100,
+        CHECKOUT_STREAM_PAGE_SIZE=5000,
+        # Longest range /api/reports/maintenance-due will compute
+        MAINTENANCE_TREND_MAX_YEARS=50,
+        # Overrides of storage.DEFAULT_PRAGMAS set on every SQLite connection,
+        # e.g. {'synchronous': 'FULL'}; None leaves a pragma at SQLite's default
+        SQLITE_PRAGMAS={},
+        # Seconds between background WAL checkpoints (0 disables them), and the
+        # -wal file size above which a checkpoint truncates it
+        SQLITE_CHECKPOINT_INTERVAL=60,
+        SQLITE_CHECKPOINT_TRUNCATE_BYTES=64 * 1024 * 1024,
+        # Seconds between checks of the database file for an import swapped in by another process
+        DATABASE_SWAP_CHECK_SECONDS=2.0,
     )
 
+    if test_config:
+        app.config.update(test_config)
+
+    # Each app resolves rules from its own copy, so interval overrides don't leak between apps
+    app.extensions['maintenance_rules'] = build_rules(app.config['MAINTENANCE_INTERVALS'])
+
     # Initialize Flask extensions
     db.init_app(app)
     migrate = Migrate(app, db)
 
+    # Connection pragmas have to be registered before the first connection is opened
+    storage_pragmas = {**DEFAULT_PRAGMAS, **app.config['SQLITE_PRAGMAS']}
+    with app.app_context():
+        configure_storage(db.engine, storage_pragmas)
+
+    def upgrade_existing_database():
+        """Bring a database built elsewhere (e.g. by migration.py) up to the current schema"""
+        # Create tables added since the database was built
+        db.create_all()
+
+        # Bring databases created before the due date columns up to date
+        added_columns = ensure_due_date_columns()
+        if added_columns:
+            print(f"Added due date columns {added_columns}, backfilling...")
+            backfill_due_dates()
+        added_columns = ensure_bcd_counter_columns()
+        if added_columns:
+            print(f"Added BCD maintenance counters {added_columns}, backfilling...")
+            with db.engine.begin() as conn:
+                refresh_bcd_maintenance_counters(conn)
+        added_indexes = ensure_indexes()
+        if added_indexes:
+            print(f"Created indexes {added_indexes}")
+
+    def database_file_id():
+        """Identity of the SQLite database file, or None when there is no file to watch"""
+        if db.engine.dialect.name != 'sqlite' or db.engine.url.database in (None, '', ':memory:'):
+            return None
+        try:
+            stat = os.stat(db.engine.url.database)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
     # Create database tables if they don't exist
     with app.app_context():
         from sqlalchemy import inspect
@@ -102,219 +537,154 @@ def create_app(test_config=None):
             if app.debug:
                 print(f"Using existing database tables: {existing_tables}")
 
+            upgrade_existing_database()
+
+        # Interval overrides only reach stored due dates through a backfill
+        stale = stale_due_dates(changed_rules(app.extensions['maintenance_rules']))
+        if stale:
+            print(f"Maintenance intervals changed for {', '.join(map(repr, stale))} but stored due dates "
+                  "still follow the old ones; run 'flask backfill-due-dates'")
+
+        # Full-text search index, falling back to LIKE search when SQLite lacks FTS5 trigram
+        app.extensions['search_fts'] = False
+        if app.config['SEARCH_FTS_ENABLED'] and db.engine.dialect.name == 'sqlite':
+            try:
+                with db.engine.begin() as conn:
+                    index_exists = search_index_exists(conn.exec_driver_sql)
+                    create_search_index(conn.exec_driver_sql)
+                    if not index_exists:
+                        rebuild_search_index(conn.exec_driver_sql)
+                app.extensions['search_fts'] = True
+            except Exception as e:
+                print(f"Full-text search unavailable, using LIKE search: {e}")
+
+        # Keep the WAL from growing under steady traffic
+        app.extensions['wal_checkpointer'] = None
+        if app.config['SQLITE_CHECKPOINT_INTERVAL'] and database_file_id() is not None:
+            with db.engine.connect() as conn:
+                journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+            if journal_mode == 'wal':
+                checkpointer = WalCheckpointer(db.engine, app.config['SQLITE_CHECKPOINT_INTERVAL'],
+                                               app.config['SQLITE_CHECKPOINT_TRUNCATE_BYTES'])
+                checkpointer.start()
+                app.extensions['wal_checkpointer'] = checkpointer
+
     @app.context_processor
     def inject_now():
         """Add current datetime to all templates"""
         return {'now': datetime.now()}
 
+    # Process-level snapshot of the maintenance modal picker data
+    with app.app_context():
+        modal_cache = ModalDataCache(db.engine, max_age=app.config['GLOBAL_DATA_CACHE_SECONDS'])
+    app.extensions['modal_cache'] = modal_cache
+
+    # migration.py builds imports in a shadow file and either swaps it in with
+    # os.replace, which pooled connections don't see until they are reopened, or
+    # copies it into a WAL database in place. Both bump PRAGMA user_version.
+    def database_version():
+        """Identity of the database file and its import stamp, or None when there is no file to watch"""
+        file_id = database_file_id()
+        if file_id is None:
+            return None
+        with db.engine.connect() as conn:
+            return file_id, conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+    def database_stat():
+        """Identity, size and modification time of the database file and its WAL, from os.stat alone"""
+        fingerprint = []
+        for path in (db.engine.url.database, f"{db.engine.url.database}-wal"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                fingerprint.append(None)
+            else:
+                fingerprint.append((stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(fingerprint)
+
+    with app.app_context():
+        database_swap = {'version': database_version(), 'lock': threading.Lock(), 'next_check': 0.0}
+        database_swap['stat'] = database_stat() if database_swap['version'] is not None else None
+
+    @app.before_request
+    def reopen_swapped_database():
+        """Reconnect when the database has been replaced by an import
+
+        Most requests return after a clock check. Every
+        DATABASE_SWAP_CHECK_SECONDS the file and its WAL are stat'ed, and
+        PRAGMA user_version is only read when they changed on disk; an import
+        copied into a WAL database in place shows up as a WAL change.
+        """
+        if database_swap['stat'] is None:
+            return
+        now = time.monotonic()
+        if now < database_swap['next_check']:
+            return
+        database_swap['next_check'] = now + app.config['DATABASE_SWAP_CHECK_SECONDS']
+
+        stat = database_stat()
+        if stat == database_swap['stat']:
+            return
+        version = database_version()
+        with database_swap['lock']:
+            if version is not None and version != database_swap['version']:
+                db.engine.dispose()
+                upgrade_existing_database()
+                modal_cache.invalidate()
+                database_swap['version'] = database_version()
+                print("Database was replaced by an import, reconnected")
+            database_swap['stat'] = database_stat()
+
     @app.context_processor
     def inject_global_data():
         """Add global data to all templates, like BCDs for maintenance modal"""
-        global_data = {}
+        if app.config['QUICK_MAINTENANCE_MODE'] == 'lazy':
+            # The modal fetches its pickers on demand, so pages ship no item lists
+            return {'quick_maintenance_lazy': True}
         try:
-            # Get all BCDs with necessary details for the maintenance modal
-            bcds = BCD.query.all()
-            global_bcds = []
-
-            for bcd in bcds:
-                item = InventoryItem.query.get(bcd.inventory_item_id)
-                if not item:
-                    continue
-
-                bcd_data = {
-                    'id': bcd.id,
-                    'manufacturer': item.manufacturer,
-                    'model': item.model,
-                    'serial_number': item.serial_number,
-                    'is_maintenance_due': bcd.is_maintenance_due()
-                }
-                global_bcds.append(bcd_data)
-
-            global_data['global_bcds'] = global_bcds
-
-            # Get all Tanks with necessary details for the maintenance modal
-            tanks = Tank.query.all()
-            global_tanks = []
-
-            for tank in tanks:
-                item = InventoryItem.query.get(tank.inventory_item_id)
-                if not item:
-                    continue
-
-                tank_data = {
-                    'id': tank.id,
-                    'manufacturer': item.manufacturer,
-                    'model': item.model,
-                    'serial_number': item.serial_number,
-                    'maintenance_due': tank.maintenance_due()
-                }
-                global_tanks.append(tank_data)
-
-            global_data['global_tanks'] = global_tanks
-
-            # Get all Regulators with necessary details for the maintenance modal
-            regulators = Regulator.query.all()
-            global_regulators = []
-
-            for regulator in regulators:
-                item = InventoryItem.query.get(regulator.inventory_item_id)
-                if not item:
-                    continue
-
-                regulator_data = {
-                    'id': regulator.id,
-                    'manufacturer': item.manufacturer,
-                    'model': item.model,
-                    'serial_number': item.serial_number
-                }
-                global_regulators.append(regulator_data)
-
-            global_data['global_regulators'] = global_regulators
-
-            # Get other items (not BCDs, Tanks, or Regulators)
-            other_items = InventoryItem.query.filter(
-                ~InventoryItem.id.in_(
-                    db.session.query(BCD.inventory_item_id).filter(BCD.inventory_item_id.isnot(None))
-                ),
-                ~InventoryItem.id.in_(
-                    db.session.query(Tank.inventory_item_id).filter(Tank.inventory_item_id.isnot(None))
-                ),
-                ~InventoryItem.id.in_(
-                    db.session.query(Regulator.inventory_item_id).filter(Regulator.inventory_item_id.isnot(None))
-                )
-            ).all()
-
-            global_other_items = []
-            for item in other_items:
-                if item.item_type:
-                    type_name = item.item_type.name
-                else:
-                    type_name = "Unknown"
-
-                other_item_data = {
-                    'id': item.id,
-                    'manufacturer': item.manufacturer,
-                    'model': item.model,
-                    'serial_number': item.serial_number,
-                    'type_name': type_name
-                }
-                global_other_items.append(other_item_data)
-
-            global_data['global_other_items'] = global_other_items
-
+            return modal_cache.get()
         except Exception as e:
             # In case of error, provide empty lists
-            global_data['global_bcds'] = []
-            global_data['global_tanks'] = []
-            global_data['global_regulators'] = []
-            global_data['global_other_items'] = []
             print(f"Error in global data context processor: {str(e)}")
-
-        return global_data
+            return {
+                'global_bcds': [],
+                'global_tanks': [],
+                'global_regulators': [],
+                'global_other_items': []
+            }
     # Routes
 
     @app.route('/')
     def home():
         """Dashboard homepage"""
+        upcoming_days = request.args.get('days', app.config['DASHBOARD_UPCOMING_DAYS'], type=int)
         try:
-            # Count total items
-            total_items = InventoryItem.query.count()
-
-            # Count BCDs due for maintenance
-            bcds_due = BCD.query.filter(BCD.next_maintenance <= datetime.now()).count()
-
-            # Count tanks due for maintenance
-            tanks_due = 0
-            tanks = Tank.query.all()
-            for tank in tanks:
-                if tank.maintenance_due():
-                    tanks_due += 1
-
-            # Count regulators due for maintenance
-            regulators_due = 0
-            regulators = Regulator.query.all()
-            for regulator in regulators:
-                if regulator.last_service_date:
-                    next_service = regulator.last_service_date.replace(year=regulator.last_service_date.year + 1)
-                    if next_service <= datetime.now():
-                        regulators_due += 1
-
-            # Count items checked out
-            items_checked_out = InventoryItem.query.filter_by(currently_checked_out=True).count()
-
-            # Get upcoming maintenance (next 30 days)
-            upcoming_maintenance = []
+            now = datetime.now()
+            window_end = now + timedelta(days=upcoming_days)
+
+            # Count total items and items checked out
+            total_items, items_checked_out = db.session.query(
+                func.count(InventoryItem.id),
+                func.coalesce(func.sum(case((InventoryItem.currently_checked_out == True, 1), else_=0)), 0)
+            ).one()
+
+            # Count BCDs, tanks and regulators due for maintenance
+            bcds_due = db.session.query(func.count(BCD.id)).filter(due_filter(BCD, now)).scalar()
+            tanks_due = db.session.query(func.count(Tank.id)).filter(due_filter(Tank, now)).scalar()
+            regulators_due = db.session.query(func.count(Regulator.id)).filter(due_filter(Regulator, now)).scalar()
 
-            # Check upcoming BCD maintenance
-            thirty_days_from_now = datetime.now() + timedelta(days=30)
-            bcds = BCD.query.filter(
-                BCD.next_maintenance > datetime.now(),
-                BCD.next_maintenance <= thirty_days_from_now
-            ).all()
-
-            for bcd in bcds:
-                item = InventoryItem.query.get(bcd.inventory_item_id)
-                if item:
-                    upcoming_maintenance.append({
-                        'id': bcd.id,
-                        'type_id': 1,  # BCD type_id
-                        'manufacturer': item.manufacturer,
-                        'model': item.model,
-                        'type_name': 'BCD',
-                        'maintenance_type': 'Annual Service',
-                        'due_date': bcd.next_maintenance.strftime('%m/%d/%Y')
-                    })
-
-            # Check upcoming Tank maintenance (VIP and Hydro tests)
-            for tank in tanks:
-                # Check for upcoming VIP
-                if tank.vip_date:
-                    next_vip = tank.get_next_vip_date()
-                    if next_vip > datetime.now() and next_vip <= thirty_days_from_now:
-                        item = InventoryItem.query.get(tank.inventory_item_id)
-                        if item:
-                            upcoming_maintenance.append({
-                                'id': tank.id,
-                                'type_id': 7,  # Tank type_id
-                                'manufacturer': item.manufacturer,
-                                'model': item.model,
-                                'type_name': 'Tank',
-                                'maintenance_type': 'VIP Inspection',
-                                'due_date': next_vip.strftime('%m/%d/%Y')
-                            })
-
-                # Check for upcoming Hydro test
-                if tank.hydro_date:
-                    next_hydro = tank.get_next_hydro_date()
-                    if next_hydro > datetime.now() and next_hydro <= thirty_days_from_now:
-                        item = InventoryItem.query.get(tank.inventory_item_id)
-                        if item:
-                            upcoming_maintenance.append({
-                                'id': tank.id,
-                                'type_id': 7,  # Tank type_id
-                                'manufacturer': item.manufacturer,
-                                'model': item.model,
-                                'type_name': 'Tank',
-                                'maintenance_type': 'Hydro Test',
-                                'due_date': next_hydro.strftime('%m/%d/%Y')
-                            })
-
-            # Check upcoming Regulator maintenance
-            for regulator in regulators:
-                if regulator.last_service_date:
-                    next_service = regulator.last_service_date.replace(year=regulator.last_service_date.year + 1)
-                    if next_service > datetime.now() and next_service <= thirty_days_from_now:
-                        item = InventoryItem.query.get(regulator.inventory_item_id)
-                        if item:
-                            upcoming_maintenance.append({
-                                'id': regulator.id,
-                                'type_id': 2,  # Regulator type_id
-                                'manufacturer': item.manufacturer,
-                                'model': item.model,
-                                'type_name': 'Regulator',
-                                'maintenance_type': 'Annual Service',
-                                'due_date': next_service.strftime('%m/%d/%Y')
-                            })
+            # Get upcoming maintenance in one joined query
+            upcoming_maintenance = []
+            for row in db.session.execute(upcoming_maintenance_query(now, window_end)):
+                upcoming_maintenance.append({
+                    'id': row.id,
+                    'type_id': row.type_id,
+                    'manufacturer': row.manufacturer,
+                    'model': row.model,
+                    'type_name': row.type_name,
+                    'maintenance_type': row.maintenance_type,
+                    'due_date': row.due_date.strftime('%m/%d/%Y')
+                })
 
             return render_template('home.html',
                                    total_items=total_items,
@@ -323,7 +693,8 @@ def create_app(test_config=None):
                                    regulator_maintenance_due=regulators_due,
                                    total_maintenance_due=bcds_due + tanks_due + regulators_due,
                                    items_checked_out=items_checked_out,
-                                   upcoming_maintenance=upcoming_maintenance)
+                                   upcoming_maintenance=upcoming_maintenance,
+                                   upcoming_days=upcoming_days)
         except Exception as e:
             import traceback
             trace = traceback.format_exc()
@@ -332,144 +703,116 @@ def create_app(test_config=None):
             return render_template('home.html', total_items=0, bcd_maintenance_due=0,
                                    tank_maintenance_due=0, regulator_maintenance_due=0,
                                    total_maintenance_due=0, items_checked_out=0,
-                                   upcoming_maintenance=[])
+                                   upcoming_maintenance=[], upcoming_days=upcoming_days)
 
     @app.route('/inventory')
     def inventory_list():
-        """Display all items in inventory"""
-        try:
-            # Get all item types for grouping
-            item_types = ItemType.query.all()
+        """Display inventory items grouped by type, one page at a time"""
+        filters = {
+            'type': request.args.get('type', type=int),
+            'location': request.args.get('location', type=int),
+            'condition': request.args.get('condition', type=int),
+            'checked_out': request.args.get('checked_out', ''),
+            'disposed': request.args.get('disposed', '')
+        }
+        sort = request.args.get('sort', 'id')
+        if sort not in INVENTORY_SORT_COLUMNS:
+            sort = 'id'
+        order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', app.config['INVENTORY_PAGE_SIZE'], type=int), 1), 500)
 
-            # Create a dictionary to hold items by type
+        try:
+            # Filters shared by the page query and the per-type counts
+            conditions = []
+            if filters['location'] is not None:
+                conditions.append(InventoryItem.location_id == filters['location'])
+            if filters['condition'] is not None:
+                conditions.append(InventoryItem.condition_code == filters['condition'])
+            if filters['checked_out'] in ('0', '1'):
+                conditions.append(InventoryItem.currently_checked_out == (filters['checked_out'] == '1'))
+            if filters['disposed'] == '1':
+                conditions.append(InventoryItem.disposal_date.isnot(None))
+            elif filters['disposed'] == '0':
+                conditions.append(InventoryItem.disposal_date.is_(None))
+
+            # One grouped count query drives the section headers and the total
+            type_counts = db.session.query(
+                ItemType.id, ItemType.name, func.count(InventoryItem.id)
+            ).join(InventoryItem, InventoryItem.item_type_id == ItemType.id).filter(
+                *conditions).group_by(ItemType.id, ItemType.name).order_by(ItemType.id).all()
+
+            if filters['type'] is not None:
+                conditions.append(InventoryItem.item_type_id == filters['type'])
+                total_items = sum(count for type_id, _, count in type_counts if type_id == filters['type'])
+            else:
+                total_items = sum(count for _, _, count in type_counts)
+            counts_by_type = {name: count for _, name, count in type_counts}
+
+            # One query for the page, with type and location eager-loaded
+            sort_column = INVENTORY_SORT_COLUMNS[sort]
+            sort_column = sort_column.desc() if order == 'desc' else sort_column.asc()
+            items = InventoryItem.query.outerjoin(InventoryItem.location_info).options(
+                joinedload(InventoryItem.item_type),
+                contains_eager(InventoryItem.location_info)
+            ).filter(
+                *conditions
+            ).order_by(InventoryItem.item_type_id, sort_column, InventoryItem.id).offset(
+                (page - 1) * per_page).limit(per_page).all()
+
+            # Group the page's items by type, keeping query order
             items_by_type = {}
-
-            # For each item type, get all items
-            for item_type in item_types:
-                items = InventoryItem.query.filter_by(item_type_id=item_type.id).all()
-                # Add location name to each item
-                for item in items:
-                    if item.location_info:
-                        item.location_name = item.location_info.name
-                    else:
-                        item.location_name = "Unknown"
-
-                # Only add to dictionary if there are items of this type
-                if items:
-                    items_by_type[item_type.name] = items
-
-            # Get total count
-            total_items = InventoryItem.query.count()
+            for item in items:
+                if item.location_info:
+                    item.location_name = item.location_info.name
+                else:
+                    item.location_name = "Unknown"
+                type_name = item.item_type.name if item.item_type else "Unknown"
+                items_by_type.setdefault(type_name, []).append(item)
+
+            pagination = {
+                'page': page,
+                'per_page': per_page,
+                'pages': max((total_items + per_page - 1) // per_page, 1),
+                'has_prev': page > 1,
+                'has_next': page * per_page < total_items
+            }
 
             return render_template('inventory_list.html',
                                    items_by_type=items_by_type,
-                                   total_items=total_items)
+                                   counts_by_type=counts_by_type,
+                                   total_items=total_items,
+                                   pagination=pagination,
+                                   filters=filters,
+                                   sort=sort,
+                                   order=order,
+                                   item_types=ItemType.query.order_by(ItemType.id).all(),
+                                   locations=Location.query.order_by(Location.id).all())
         except Exception as e:
             import traceback
             trace = traceback.format_exc()
             print(f"Error in inventory list: {trace}")
             flash(f"Error loading inventory: {str(e)}", "error")
-            return render_template('inventory_list.html', items_by_type={}, total_items=0)
+            return render_template('inventory_list.html', items_by_type={}, counts_by_type={}, total_items=0,
+                                   pagination=None, filters=filters, sort=sort, order=order,
+                                   item_types=[], locations=[])
 
 
     @app.route('/tanks')
     def tanks_list():
         """Display all tanks with maintenance information"""
         try:
-            # Get all tanks
-            all_tanks = Tank.query.all()
-            tanks = []
-
-            # Prepare tanks by adding maintenance information
-            for tank in all_tanks:
-                # Get the inventory item associated with the tank
-                item = tank.inventory_item
-                if not item:
-                    continue
-
-                # Create a dictionary with all the needed information
-                tank_data = {
-                    'id': tank.id,
-                    'inventory_id': item.id,
-                    'Tank_ID': tank.id,
-                    'Tank_Number': tank.tank_number,
-                    'Manufacturer': item.manufacturer,
-                    'Serial_Number': item.serial_number,
-                    'Hydro_Date': tank.hydro_date,
-                    'VIP_Date': tank.vip_date,
-                    'Tank_Material': tank.tank_material,
-                    'Working_Pressure': tank.working_pressure,
-                    'Gas_Type': tank.gas_type,
-                    'location': item.location_id,
-                    'condition_code': item.condition_code,
-                    'maintenance_due': tank.maintenance_due(),
-                    'next_maintenance_type': tank.next_maintenance_type(),
-                    'next_maintenance_date': tank.next_maintenance_date(),
-                    'currently_checked_out': item.currently_checked_out
-                }
-
-                # Format dates for display
-                if tank.hydro_date:
-                    tank_data['Hydro_Date_Formatted'] = tank.hydro_date.strftime('%m/%d/%Y')
-                else:
-                    tank_data['Hydro_Date_Formatted'] = 'Not Available'
-
-                if tank.vip_date:
-                    tank_data['VIP_Date_Formatted'] = tank.vip_date.strftime('%m/%d/%Y')
-                else:
-                    tank_data['VIP_Date_Formatted'] = 'Not Available'
-
-                # Next hydro date (5 years after last)
-                if tank.hydro_date:
-                    next_hydro = tank.get_next_hydro_date()
-                    tank_data['next_hydro_date'] = next_hydro
-                    tank_data['next_hydro_date_Formatted'] = next_hydro.strftime('%m/%d/%Y')
-                else:
-                    tank_data['next_hydro_date'] = None
-                    tank_data['next_hydro_date_Formatted'] = 'Not Available'
-
-                # Next VIP date (1 year after last)
-                if tank.vip_date:
-                    next_vip = tank.get_next_vip_date()
-                    tank_data['next_vip_date'] = next_vip
-                    tank_data['next_vip_date_Formatted'] = next_vip.strftime('%m/%d/%Y')
-                else:
-                    tank_data['next_vip_date'] = None
-                    tank_data['next_vip_date_Formatted'] = 'Not Available'
-
-                # Next maintenance date and type
-                next_maint_date = tank.next_maintenance_date()
-                if next_maint_date:
-                    tank_data['next_maintenance_date_Formatted'] = next_maint_date.strftime('%m/%d/%Y')
-                else:
-                    tank_data['next_maintenance_date_Formatted'] = 'Not Available'
-
-                tanks.append(tank_data)
-
-            # Group tanks by maintenance status
-            tanks_by_status = {
-                'due': [],
-                'upcoming': [],
-                'current': []
-            }
-
             now = datetime.now()
             thirty_days_from_now = now + timedelta(days=30)
 
-            for tank in tanks:
-                if tank['maintenance_due']:
-                    tanks_by_status['due'].append(tank)
-                elif tank['next_maintenance_date'] and tank['next_maintenance_date'] <= thirty_days_from_now:
-                    tanks_by_status['upcoming'].append(tank)
-                else:
-                    tanks_by_status['current'].append(tank)
+            # Pull the tank table as columns, sorted by next maintenance date
+            rows = db.session.query(*TANK_COLUMNS).join(
+                InventoryItem, Tank.inventory_item_id == InventoryItem.id
+            ).order_by(Tank.next_due.is_(None), Tank.next_due, Tank.id).all()
+            tanks, statuses = tank_status_table(rows, now, thirty_days_from_now)
 
-            # Sort each group by next maintenance date
-            for status in tanks_by_status:
-                tanks_by_status[status] = sorted(
-                    tanks_by_status[status],
-                    key=lambda x: x['next_maintenance_date'] or datetime(9999, 12, 31)
-                )
+            # Group tanks by maintenance status, keeping the date order
+            tanks_by_status = group_tanks_by_status(tanks, statuses)
 
             # Get count of tanks due for maintenance
             maintenance_due = len(tanks_by_status['due'])
@@ -495,62 +838,11 @@ def create_app(test_config=None):
             tank = Tank.query.get_or_404(tank_id)
             item = tank.inventory_item
 
-            # Create a dictionary with all tank data
-            tank_data = {
-                'id': tank.id,
-                'inventory_id': item.id,
-                'Tank_ID': tank.id,
-                'Tank_Number': tank.tank_number,
-                'Manufacturer': item.manufacturer,
-                'Serial_Number': item.serial_number,
-                'Hydro_Date': tank.hydro_date,
-                'VIP_Date': tank.vip_date,
-                'Tank_Material': tank.tank_material,
-                'Working_Pressure': tank.working_pressure,
-                'Gas_Type': tank.gas_type,
-                'location': item.location_id,
-                'condition_code': item.condition_code,
-                'maintenance_due': tank.maintenance_due(),
-                'next_maintenance_type': tank.next_maintenance_type(),
-                'next_maintenance_date': tank.next_maintenance_date(),
-                'currently_checked_out': item.currently_checked_out
-            }
-
-            # Format dates for display
-            if tank.hydro_date:
-                tank_data['Hydro_Date_Formatted'] = tank.hydro_date.strftime('%m/%d/%Y')
-            else:
-                tank_data['Hydro_Date_Formatted'] = 'Not Available'
-
-            if tank.vip_date:
-                tank_data['VIP_Date_Formatted'] = tank.vip_date.strftime('%m/%d/%Y')
-            else:
-                tank_data['VIP_Date_Formatted'] = 'Not Available'
-
-            # Next hydro date (5 years after last)
-            if tank.hydro_date:
-                next_hydro = tank.get_next_hydro_date()
-                tank_data['next_hydro_date'] = next_hydro
-                tank_data['next_hydro_date_Formatted'] = next_hydro.strftime('%m/%d/%Y')
-            else:
-                tank_data['next_hydro_date'] = None
-                tank_data['next_hydro_date_Formatted'] = 'Not Available'
-
-            # Next VIP date (1 year after last)
-            if tank.vip_date:
-                next_vip = tank.get_next_vip_date()
-                tank_data['next_vip_date'] = next_vip
-                tank_data['next_vip_date_Formatted'] = next_vip.strftime('%m/%d/%Y')
-            else:
-                tank_data['next_vip_date'] = None
-                tank_data['next_vip_date_Formatted'] = 'Not Available'
+            now = datetime.now()
+            tank_status = maintenance_status(tank.next_due, now, now + timedelta(days=30))
 
-            # Next maintenance date and type
-            next_maint_date = tank.next_maintenance_date()
-            if next_maint_date:
-                tank_data['next_maintenance_date_Formatted'] = next_maint_date.strftime('%m/%d/%Y')
-            else:
-                tank_data['next_maintenance_date_Formatted'] = 'Not Available'
+            # Create a dictionary with all tank data
+            tank_data = tank_display_data(tank, item, tank_status)
 
             # Get checkout history
             checkouts = CheckoutRecord.query.filter_by(inventory_item_id=item.id).order_by(
@@ -567,76 +859,58 @@ def create_app(test_config=None):
     @app.route('/checkout/<int:item_id>', methods=['GET', 'POST'])
     def checkout_item(item_id):
         """Checkout an item to a person"""
-        item = InventoryItem.query.get_or_404(item_id)
-
         if request.method == 'POST':
-            if item.currently_checked_out:
-                flash("This item is already checked out.", "error")
-                return redirect(url_for('inventory_list'))
-
             # Get form data
             person_name = request.form.get('person_name')
             notes = request.form.get('notes', '')
 
-            # Create checkout record
-            checkout = CheckoutRecord(
-                inventory_item_id=item.id,
-                person_name=person_name,
-                checkout_date=datetime.now(),
-                checkout_condition=item.condition_code,
-                notes=notes
-            )
-
-            # Update item status
-            item.currently_checked_out = True
-            item.last_check_out_date = datetime.now()
+            # Claim the item and record the checkout in one transaction
+            try:
+                checked_out = check_out_item(db.session, item_id, person_name, notes)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                flash(f"Error checking out item: {str(e)}", "error")
+                return redirect(url_for('inventory_list'))
 
-            # Save to database
-            db.session.add(checkout)
-            db.session.commit()
+            if not checked_out:
+                InventoryItem.query.get_or_404(item_id)
+                flash("This item is already checked out.", "error")
+                return redirect(url_for('inventory_list'))
 
             flash(f"Item checked out to {person_name}", "success")
             return redirect(url_for('inventory_list'))
 
+        item = InventoryItem.query.get_or_404(item_id)
         return render_template('checkout_form.html', item=item)
 
     @app.route('/checkin/<int:item_id>', methods=['GET', 'POST'])
     def checkin_item(item_id):
         """Check in an item"""
-        item = InventoryItem.query.get_or_404(item_id)
-
         if request.method == 'POST':
-            if not item.currently_checked_out:
-                flash("This item is not checked out.", "error")
-                return redirect(url_for('inventory_list'))
-
             # Get form data
             condition_code = int(request.form.get('condition_code'))
             notes = request.form.get('notes', '')
 
-            # Find the active checkout record
-            checkout = CheckoutRecord.query.filter_by(
-                inventory_item_id=item.id,
-                checkin_date=None
-            ).order_by(CheckoutRecord.checkout_date.desc()).first()
-
-            if checkout:
-                # Update checkout record
-                checkout.checkin_date = datetime.now()
-                checkout.checkin_condition = condition_code
-                checkout.notes = checkout.notes + "\n\nCheck-in notes: " + notes if notes else checkout.notes
-
-            # Update item status
-            item.currently_checked_out = False
-            item.last_check_in_date = datetime.now()
-            item.condition_code = condition_code
+            # Release the item and close its open checkout in one transaction
+            try:
+                checked_in = check_in_item(db.session, item_id, condition_code, notes)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                flash(f"Error checking in item: {str(e)}", "error")
+                return redirect(url_for('inventory_list'))
 
-            # Save to database
-            db.session.commit()
+            if not checked_in:
+                InventoryItem.query.get_or_404(item_id)
+                flash("This item is not checked out.", "error")
+                return redirect(url_for('inventory_list'))
 
             flash("Item checked in successfully", "success")
             return redirect(url_for('inventory_list'))
 
+        item = InventoryItem.query.get_or_404(item_id)
+
         # Get the current checkout record for this item
         checkout = CheckoutRecord.query.filter_by(
             inventory_item_id=item.id,
@@ -645,6 +919,137 @@ def create_app(test_config=None):
 
         return render_template('checkin_form.html', item=item, checkout=checkout)
 
+    @app.route('/checkout/kit', methods=['GET', 'POST'])
+    def checkout_kit():
+        """Check out several items to one person in one transaction"""
+        form = {'person_name': '', 'items': '', 'notes': ''}
+        if request.method == 'POST':
+            form = {key: request.form.get(key, '') for key in form}
+            person_name = form['person_name'].strip()
+            tokens = parse_item_tokens(form['items'])
+            if not person_name or not tokens:
+                flash("Enter a name and at least one serial number or item ID.", "error")
+                return render_template('kit_checkout_form.html', form=form)
+
+            try:
+                result = check_out_kit(db.session, tokens, person_name, form['notes'])
+                if result['checked_out']:
+                    db.session.commit()
+                else:
+                    db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                flash(f"Error checking out kit: {str(e)}", "error")
+                return render_template('kit_checkout_form.html', form=form)
+
+            if not result['checked_out']:
+                if result['unknown']:
+                    flash(f"No items found for: {', '.join(result['unknown'])}", "error")
+                if result['unavailable']:
+                    flash("Already checked out: " + ', '.join(describe_item(row) for row in result['unavailable']),
+                          "error")
+                flash("Nothing was checked out.", "error")
+                return render_template('kit_checkout_form.html', form=form)
+
+            flash(f"{result['checked_out']} items checked out to {person_name}", "success")
+            return redirect(url_for('checkout_history', person=person_name, status='open'))
+
+        return render_template('kit_checkout_form.html', form=form)
+
+    @app.route('/checkin/kit', methods=['GET', 'POST'])
+    def checkin_kit():
+        """Check in several items, each with its own condition, in one transaction"""
+        if request.method == 'POST':
+            item_ids = request.form.getlist('item_id', type=int)
+            conditions = {item_id: request.form.get(f'condition_{item_id}', type=int) for item_id in item_ids}
+            lookup = {'person': request.form.get('person', ''), 'items': request.form.get('items', '')}
+            if not conditions or any(code not in range(1, 6) for code in conditions.values()):
+                flash("Choose a condition from 1 to 5 for every item.", "error")
+                return redirect(url_for('checkin_kit', **lookup))
+
+            try:
+                released = check_in_items(db.session, conditions, request.form.get('notes', ''))
+                if released == len(conditions):
+                    db.session.commit()
+                else:
+                    db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                flash(f"Error checking in kit: {str(e)}", "error")
+                return redirect(url_for('checkin_kit', **lookup))
+
+            if released != len(conditions):
+                flash("Some of these items are no longer checked out; nothing was checked in.", "error")
+                return redirect(url_for('checkin_kit', **lookup))
+
+            flash(f"{released} items checked in successfully", "success")
+            return redirect(url_for('checkout_history'))
+
+        # Find the kit by borrower and/or scanned items
+        person = request.args.get('person', '').strip()
+        items_text = request.args.get('items', '')
+        rows = {}
+        unknown = []
+        try:
+            if person:
+                rows.update((row.id, row) for row in items_out_to(db.session, person))
+            tokens = parse_item_tokens(items_text)
+            if tokens:
+                found, unknown = resolve_items(db.session, tokens)
+                rows.update((row.id, row) for row in found.values())
+        except Exception as e:
+            flash(f"Error looking up items: {str(e)}", "error")
+
+        if unknown:
+            flash(f"No items found for: {', '.join(unknown)}", "error")
+        return render_template('kit_checkin_form.html', person=person, items_text=items_text,
+                               rows=list(rows.values()), searched=bool(person or items_text))
+
+    @app.route('/api/checkout/kit', methods=['POST'])
+    def api_checkout_kit():
+        """Check out a kit from JSON {"person_name", "items": [serials or IDs], "notes"}"""
+        data = request.get_json(silent=True) or {}
+        person_name = str(data.get('person_name') or '').strip()
+        tokens = list(dict.fromkeys(str(token).strip() for token in data.get('items') or [] if str(token).strip()))
+        if not person_name or not tokens:
+            return jsonify({'error': "person_name and items are required"}), 400
+
+        try:
+            result = check_out_kit(db.session, tokens, person_name, str(data.get('notes') or ''))
+            if result['checked_out']:
+                db.session.commit()
+            else:
+                db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        return jsonify(kit_summary(result)), 200 if result['checked_out'] else 409
+
+    @app.route('/api/checkin/kit', methods=['POST'])
+    def api_checkin_kit():
+        """Check in a kit from JSON {"items": {serial or ID: condition code}, "notes"}"""
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        if not isinstance(items, dict) or not items:
+            return jsonify({'error': "items must map serial numbers or IDs to condition codes"}), 400
+        try:
+            conditions = {str(token).strip(): int(code) for token, code in items.items()}
+        except (TypeError, ValueError):
+            return jsonify({'error': "Condition codes must be integers from 1 to 5"}), 400
+        if any(code not in range(1, 6) for code in conditions.values()):
+            return jsonify({'error': "Condition codes must be integers from 1 to 5"}), 400
+
+        try:
+            result = check_in_kit(db.session, conditions, str(data.get('notes') or ''))
+            if result['checked_in']:
+                db.session.commit()
+            else:
+                db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        return jsonify(kit_summary(result)), 200 if result['checked_in'] else 409
+
     @app.route('/item/<int:item_id>')
     def item_detail(item_id):
         """Display detailed information for a specific inventory item"""
@@ -677,8 +1082,9 @@ def create_app(test_config=None):
         maintenance_records = []
         if type_name == "BCD" and item.bcd:
             bcd_data = item.bcd
+            # The page shows the latest three; the full history is on maintenance_detail
             maintenance_records = MaintenanceRecord.query.filter_by(bcd_id=bcd_data.id).order_by(
-                MaintenanceRecord.date.desc()).all()
+                MaintenanceRecord.date.desc(), MaintenanceRecord.id.desc()).limit(3).all()
 
         tank_data = None
         if type_name == "Tank" and item.tank:
@@ -699,16 +1105,16 @@ def create_app(test_config=None):
     def maintenance():
         """Display BCD maintenance information"""
         try:
-            # Get all BCDs
-            bcds = BCD.query.all()
-            bcd_data = []
-
-            for bcd in bcds:
-                # Get the inventory item
-                item = InventoryItem.query.get(bcd.inventory_item_id)
-                if not item:
-                    continue
+            # Get all BCDs with their items, due ones first, sorted inside the database
+            now = datetime.now()
+            maintenance_due = case((due_filter(BCD, now), 1), else_=0)
+            rows = db.session.query(BCD, InventoryItem, maintenance_due).join(
+                InventoryItem, BCD.inventory_item_id == InventoryItem.id
+            ).order_by(maintenance_due.desc(), BCD.next_maintenance.is_(None),
+                       BCD.next_maintenance, BCD.id).all()
 
+            bcd_data = []
+            for bcd, item, is_due in rows:
                 # Create a data object for the template
                 data = {
                     'id': bcd.id,
@@ -722,17 +1128,12 @@ def create_app(test_config=None):
                     'next_maintenance': bcd.next_maintenance,
                     'next_maintenance_formatted': bcd.next_maintenance.strftime(
                         '%m/%d/%Y') if bcd.next_maintenance else 'Not Available',
-                    'maintenance_due': bcd.is_maintenance_due(),
-                    'maintenance_records_count': MaintenanceRecord.query.filter_by(bcd_id=bcd.id).count()
+                    'maintenance_due': bool(is_due),
+                    'maintenance_records_count': bcd.maintenance_count
                 }
 
                 bcd_data.append(data)
 
-            # Sort with maintenance due items first
-            bcd_data = sorted(bcd_data,
-                              key=lambda x: (not x['maintenance_due'],
-                                             x['next_maintenance'] or datetime(9999, 12, 31)))
-
             return render_template('maintenance.html', bcds=bcd_data)
 
         except Exception as e:
@@ -764,7 +1165,7 @@ def create_app(test_config=None):
 
                 # Update BCD's maintenance dates
                 bcd.last_maintenance = maintenance_date
-                bcd.next_maintenance = maintenance_date.replace(year=maintenance_date.year + 1)
+                bcd.next_maintenance = get_rule('BCD', 'service').next_due(maintenance_date)
 
                 try:
                     db.session.add(record)
@@ -829,7 +1230,7 @@ def create_app(test_config=None):
                     bcd = BCD(
                         inventory_item_id=item.id,
                         last_maintenance=intake_date,
-                        next_maintenance=intake_date.replace(year=intake_date.year + 1)
+                        next_maintenance=get_rule('BCD', 'service').next_due(intake_date)
                     )
                     db.session.add(bcd)
 
@@ -898,25 +1299,64 @@ def create_app(test_config=None):
 
     @app.route('/search', methods=['GET', 'POST'])
     def search():
-        """Search for items by serial number, manufacturer, or model"""
+        """Search for items by serial number, manufacturer, model, tank number or notes"""
         results = []
         search_term = ""
+        has_more = False
 
         if request.method == 'POST':
             search_term = request.form.get('search_term', '').strip()
+            mode = request.form.get('mode', 'items')
         else:
             search_term = request.args.get('search_term', '').strip()
+            mode = request.args.get('mode', 'items')
+        if mode not in SEARCH_MODES:
+            mode = 'items'
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = app.config['SEARCH_PAGE_SIZE']
 
         if search_term:
             try:
-                # Search in serial number, manufacturer, or model
-                results = InventoryItem.query.filter(
-                    or_(
-                        InventoryItem.serial_number.ilike(f'%{search_term}%'),
-                        InventoryItem.manufacturer.ilike(f'%{search_term}%'),
-                        InventoryItem.model.ilike(f'%{search_term}%')
-                    )
-                ).all()
+                if app.extensions.get('search_fts'):
+                    if len(search_term) >= TRIGRAM_MIN_LENGTH:
+                        # Ranked trigram match on the full-text index
+                        sql = text(
+                            "SELECT rowid FROM inventory_search WHERE inventory_search MATCH :query "
+                            "ORDER BY rank LIMIT :limit OFFSET :offset")
+                        params = {'query': match_expression(search_term, mode)}
+                    else:
+                        # Too short for trigrams: substring scan of the (narrow) index table
+                        escaped = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                        clauses = ' OR '.join(f"{column} LIKE :pattern ESCAPE '\\'" for column in SEARCH_MODES[mode])
+                        sql = text(f"SELECT rowid FROM inventory_search WHERE {clauses} "
+                                   f"ORDER BY rowid LIMIT :limit OFFSET :offset")
+                        params = {'pattern': f'%{escaped}%'}
+                    params.update(limit=per_page + 1, offset=(page - 1) * per_page)
+                    item_ids = [row[0] for row in db.session.execute(sql, params)]
+                    has_more = len(item_ids) > per_page
+                    item_ids = item_ids[:per_page]
+
+                    # Load the page with type and location names, keeping rank order
+                    items = InventoryItem.query.options(
+                        joinedload(InventoryItem.item_type),
+                        joinedload(InventoryItem.location_info)
+                    ).filter(InventoryItem.id.in_(item_ids)).all() if item_ids else []
+                    items_by_id = {item.id: item for item in items}
+                    results = [items_by_id[item_id] for item_id in item_ids if item_id in items_by_id]
+                else:
+                    # Search in serial number, manufacturer, or model
+                    results = InventoryItem.query.options(
+                        joinedload(InventoryItem.item_type),
+                        joinedload(InventoryItem.location_info)
+                    ).filter(
+                        or_(
+                            InventoryItem.serial_number.ilike(f'%{search_term}%'),
+                            InventoryItem.manufacturer.ilike(f'%{search_term}%'),
+                            InventoryItem.model.ilike(f'%{search_term}%')
+                        )
+                    ).order_by(InventoryItem.id).offset((page - 1) * per_page).limit(per_page + 1).all()
+                    has_more = len(results) > per_page
+                    results = results[:per_page]
 
                 # Add location and type names
                 for item in results:
@@ -937,7 +1377,10 @@ def create_app(test_config=None):
 
         return render_template('search.html',
                                results=results,
-                               search_term=search_term)
+                               search_term=search_term,
+                               mode=mode,
+                               page=page,
+                               has_more=has_more)
 
     @app.route('/reports')
     def reports():
@@ -949,6 +1392,31 @@ def create_app(test_config=None):
                                current_month=current_month,
                                current_year=current_year)
 
+    @app.route('/export')
+    def export_database():
+        """Download the database in the workbook layout, as .xlsx or a zip of CSV files
+
+        .xlsx needs the optional xlsxwriter package; without it the CSV zip is sent.
+        """
+        export_format = request.args.get('format', 'xlsx')
+        if export_format not in EXPORT_FORMATS:
+            flash(f"Unknown export format: {export_format}", "error")
+            return redirect(url_for('reports'))
+        export_format = export_format_or_fallback(export_format)
+
+        # Written to a temporary file, which is deleted once the response has been sent
+        export_file = tempfile.TemporaryFile()
+        try:
+            write_export(db.session.connection(), export_file, export_format)
+        except Exception as e:
+            export_file.close()
+            flash(f"Error exporting database: {str(e)}", "error")
+            return redirect(url_for('reports'))
+        export_file.seek(0)
+
+        return send_file(export_file, as_attachment=True,
+                         download_name=f"inventory_export_{datetime.now():%Y%m%d}.{export_extension(export_format)}")
+
     @app.route('/reports/monthly/<int:year>/<int:month>')
     def monthly_report(year, month):
         """Generate monthly activity report"""
@@ -968,7 +1436,9 @@ def create_app(test_config=None):
             # Get all activities for the month
 
             # 1. Maintenance records
-            maintenance_records = MaintenanceRecord.query.filter(
+            maintenance_records = MaintenanceRecord.query.options(
+                joinedload(MaintenanceRecord.bcd).joinedload(BCD.inventory_item)
+            ).filter(
                 MaintenanceRecord.date >= start_date,
                 MaintenanceRecord.date <= end_date
             ).order_by(MaintenanceRecord.date).all()
@@ -979,28 +1449,30 @@ def create_app(test_config=None):
                 record.item = record.bcd.inventory_item
 
             # 2. Checkout records
-            checkouts = CheckoutRecord.query.filter(
+            checkouts = CheckoutRecord.query.options(
+                joinedload(CheckoutRecord.item).joinedload(InventoryItem.item_type)
+            ).filter(
                 CheckoutRecord.checkout_date >= start_date,
                 CheckoutRecord.checkout_date <= end_date
             ).order_by(CheckoutRecord.checkout_date).all()
 
-            # Add inventory item data to each checkout
+            # Add item type names (items were loaded with the checkouts)
             for checkout in checkouts:
-                checkout.item = InventoryItem.query.get(checkout.inventory_item_id)
                 if checkout.item and checkout.item.item_type:
                     checkout.type_name = checkout.item.item_type.name
                 else:
                     checkout.type_name = "Unknown"
 
             # 3. Check-in records
-            checkins = CheckoutRecord.query.filter(
+            checkins = CheckoutRecord.query.options(
+                joinedload(CheckoutRecord.item).joinedload(InventoryItem.item_type)
+            ).filter(
                 CheckoutRecord.checkin_date >= start_date,
                 CheckoutRecord.checkin_date <= end_date
             ).order_by(CheckoutRecord.checkin_date).all()
 
-            # Add inventory item data to each check-in
+            # Add item type names (items were loaded with the check-ins)
             for checkin in checkins:
-                checkin.item = InventoryItem.query.get(checkin.inventory_item_id)
                 if checkin.item and checkin.item.item_type:
                     checkin.type_name = checkin.item.item_type.name
                 else:
@@ -1035,28 +1507,60 @@ def create_app(test_config=None):
 
     @app.route('/checkouts')
     def checkout_history():
-        """Display all checkout records"""
-        try:
-            # Get all checkout records ordered by most recent first
-            checkouts = CheckoutRecord.query.order_by(CheckoutRecord.checkout_date.desc()).all()
-
-            # Add item information to each checkout
-            for checkout in checkouts:
-                checkout.item = InventoryItem.query.get(checkout.inventory_item_id)
-                if checkout.item and checkout.item.item_type:
-                    checkout.type_name = checkout.item.item_type.name
-                else:
-                    checkout.type_name = "Unknown"
+        """Display checkout records, newest first, one keyset page at a time"""
+        def parse_date(value):
+            try:
+                return datetime.strptime(value, '%Y-%m-%d') if value else None
+            except ValueError:
+                return None
+
+        filters = {
+            'person': request.args.get('person', '').strip(),
+            'type': request.args.get('type', type=int),
+            'status': request.args.get('status', ''),
+            'start': parse_date(request.args.get('start')),
+            'end': parse_date(request.args.get('end'))
+        }
+        stream = request.args.get('stream') == '1'
+        default_page_size = app.config['CHECKOUT_STREAM_PAGE_SIZE' if stream else 'CHECKOUT_PAGE_SIZE']
+        per_page = min(max(request.args.get('per_page', default_page_size, type=int), 1),
+                       app.config['CHECKOUT_STREAM_PAGE_SIZE'])
+        before = request.args.get('before')
+        cursor = decode_checkout_cursor(before) if before else None
+        pager = {'before': cursor and before, 'next_cursor': None}
 
-            return render_template('checkout_history.html',
-                                   checkouts=checkouts,
-                                   now=datetime.now())
+        try:
+            conditions = checkout_filter_conditions(filters)
+
+            # Rows strictly after the cursor in (checkout_date, id) descending order
+            page_conditions = list(conditions)
+            if cursor:
+                page_conditions.append(tuple_(CheckoutRecord.checkout_date, CheckoutRecord.id) < tuple_(*cursor))
+            query = CheckoutRecord.query.options(
+                joinedload(CheckoutRecord.item)
+            ).filter(*page_conditions).order_by(CheckoutRecord.checkout_date.desc(), CheckoutRecord.id.desc())
+
+            context = dict(summary=checkout_summary(conditions),
+                           filters=filters,
+                           pager=pager,
+                           stream=stream,
+                           item_types=ItemType.query.order_by(ItemType.id).all(),
+                           now=datetime.now())
+
+            if stream:
+                # Send rows as they are rendered instead of building the whole page first
+                return app.response_class(stream_with_context(stream_template(
+                    'checkout_history.html', checkouts=iter_checkout_page(query, per_page, pager), **context)))
+
+            checkouts = list(iter_checkout_page(query, per_page, pager))
+            return render_template('checkout_history.html', checkouts=checkouts, **context)
         except Exception as e:
             import traceback
             trace = traceback.format_exc()
             print(f"Error in checkout history: {trace}")
             flash(f"Error loading checkout history: {str(e)}", "error")
-            return render_template('checkout_history.html', checkouts=[], now=datetime.now())
+            return render_template('checkout_history.html', checkouts=[], summary=None, filters=filters,
+                                   pager=pager, stream=stream, item_types=[], now=datetime.now())
 
     @app.route('/quick-maintenance', methods=['POST'])
     def quick_maintenance():
@@ -1086,7 +1590,7 @@ def create_app(test_config=None):
 
                 # Update BCD maintenance dates
                 bcd.last_maintenance = maintenance_date
-                bcd.next_maintenance = maintenance_date.replace(year=maintenance_date.year + 1)
+                bcd.next_maintenance = get_rule('BCD', 'service').next_due(maintenance_date)
 
                 # Save to database
                 db.session.add(record)
@@ -1109,11 +1613,10 @@ def create_app(test_config=None):
                     notes=notes
                 )
 
-                # Update Tank dates based on maintenance type
-                if maintenance_type == 'Hydro Test':
-                    tank.hydro_date = maintenance_date
-                elif maintenance_type == 'VIP Inspection':
-                    tank.vip_date = maintenance_date
+                # Update the anchor date of the rule this maintenance type satisfies
+                rule = rule_for_label(Tank, maintenance_type)
+                if rule:
+                    setattr(tank, rule.anchor, maintenance_date)
 
                 # Save to database
                 db.session.add(record)
@@ -1189,6 +1692,131 @@ def create_app(test_config=None):
             print(f"Error in quick maintenance: {trace}")
             flash(f'Error adding maintenance record: {str(e)}', 'error')
             return redirect(url_for('home'))
+    def parse_batch_dates(date_text, due_by_text):
+        """Parse a batch's maintenance date and optional due-by date, which covers the whole day"""
+        maintenance_date = datetime.strptime(date_text, '%Y-%m-%d')
+        due_by = None
+        if due_by_text:
+            due_by = datetime.strptime(due_by_text, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        return maintenance_date, due_by
+
+    @app.route('/maintenance/batch', methods=['GET', 'POST'])
+    def batch_maintenance():
+        """Record one maintenance event on a list of items or on everything due"""
+        today = datetime.now()
+        month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+        form = {'item_type': request.args.get('item_type', 'tank'), 'type': request.args.get('type', 'VIP Inspection'),
+                'date': today.strftime('%Y-%m-%d'), 'due_by': request.args.get('due_by', ''), 'items': '', 'notes': ''}
+        if request.method != 'POST':
+            return render_template('maintenance_batch_form.html', form=form, month_end=month_end, result=None)
+
+        form = {key: request.form.get(key, '') for key in form}
+        tokens = parse_item_tokens(form['items'])
+        try:
+            maintenance_date, due_by = parse_batch_dates(form['date'], form['due_by'])
+        except ValueError:
+            flash("Dates must be in YYYY-MM-DD format.", "error")
+            return render_template('maintenance_batch_form.html', form=form, month_end=month_end, result=None)
+        if not tokens and due_by is None:
+            flash("Enter serial numbers or item IDs, or a due-by date.", "error")
+            return render_template('maintenance_batch_form.html', form=form, month_end=month_end, result=None)
+
+        try:
+            result = record_maintenance_batch(db.session, form['item_type'], maintenance_date, form['type'],
+                                              form['notes'], tokens, due_by)
+            if result['recorded']:
+                db.session.commit()
+            else:
+                db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error recording batch maintenance: {str(e)}", "error")
+            return render_template('maintenance_batch_form.html', form=form, month_end=month_end, result=None)
+
+        if result['unknown']:
+            flash(f"No items found for: {', '.join(result['unknown'])}", "error")
+        if result['wrong_type']:
+            flash(f"Not {form['item_type']} equipment: " + ', '.join(describe_item(row) for row in result['wrong_type']),
+                  "error")
+        if result['recorded']:
+            flash(f"{form['type']} recorded for {result['recorded']} items", "success")
+            # Keep a resubmitted form from recording the batch twice
+            form.update(items='', due_by='')
+        else:
+            flash("Nothing was recorded.", "error")
+        return render_template('maintenance_batch_form.html', form=form, month_end=month_end, result=result)
+
+    @app.route('/api/maintenance/batch', methods=['POST'])
+    def api_batch_maintenance():
+        """Record maintenance from JSON {"item_type", "date", "type", "notes", "items": [serials or IDs], "due_by"}"""
+        data = request.get_json(silent=True) or {}
+        item_type = str(data.get('item_type') or '')
+        maintenance_type = str(data.get('type') or '').strip()
+        tokens = list(dict.fromkeys(str(token).strip() for token in data.get('items') or [] if str(token).strip()))
+        if item_type not in BATCH_EQUIPMENT:
+            return jsonify({'error': f"item_type must be one of {', '.join(BATCH_EQUIPMENT)}"}), 400
+        try:
+            maintenance_date, due_by = parse_batch_dates(str(data.get('date') or ''), str(data.get('due_by') or ''))
+        except ValueError:
+            return jsonify({'error': "date and due_by must be YYYY-MM-DD"}), 400
+        if not maintenance_type or (not tokens and due_by is None):
+            return jsonify({'error': "type and either items or due_by are required"}), 400
+
+        try:
+            result = record_maintenance_batch(db.session, item_type, maintenance_date, maintenance_type,
+                                              str(data.get('notes') or ''), tokens, due_by)
+            if result['recorded']:
+                db.session.commit()
+            else:
+                db.session.rollback()
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        return jsonify(batch_summary(result)), 200 if result['recorded'] else 409
+
+    @app.route('/api/quick-maintenance/items')
+    def quick_maintenance_items():
+        """Paginated, prefix-filtered equipment lookup for the maintenance modal"""
+        equipment_type = request.args.get('type', '')
+        if equipment_type not in MODAL_EQUIPMENT_TYPES:
+            return jsonify({'error': f"Unknown equipment type: {equipment_type}"}), 400
+
+        search_term = request.args.get('q', '').strip()
+        item_id = request.args.get('id', type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', app.config['QUICK_MAINTENANCE_PAGE_SIZE'], type=int), 1), 100)
+
+        query = modal_equipment_query(equipment_type)
+
+        if item_id is not None:
+            # Used to restore a preselected item from the URL
+            query = query.filter(modal_equipment_id_column(equipment_type) == item_id)
+        elif search_term:
+            escaped = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            prefix = f'{escaped}%'
+            query = query.filter(or_(
+                InventoryItem.serial_number.like(prefix, escape='\\'),
+                InventoryItem.manufacturer.like(prefix, escape='\\'),
+                InventoryItem.model.like(prefix, escape='\\')
+            ))
+
+        # Fetch one extra row to know whether another page exists without a COUNT
+        rows = query.order_by(InventoryItem.serial_number, modal_equipment_id_column(equipment_type)).offset(
+            (page - 1) * per_page).limit(per_page + 1).all()
+
+        now = datetime.now()
+        items = [modal_equipment_row(equipment_type, row, now) for row in rows[:per_page]]
+
+        return jsonify({
+            'items': items,
+            'page': page,
+            'per_page': per_page,
+            'has_more': len(rows) > per_page
+        })
+
     @app.route('/reports/yearly/<int:year>')
     def yearly_report(year):
         """Generate yearly maintenance report"""
@@ -1198,7 +1826,9 @@ def create_app(test_config=None):
             end_date = datetime(year, 12, 31, 23, 59, 59)
 
             # Get all maintenance records for the year
-            maintenance_records = MaintenanceRecord.query.filter(
+            maintenance_records = MaintenanceRecord.query.options(
+                joinedload(MaintenanceRecord.bcd).joinedload(BCD.inventory_item)
+            ).filter(
                 MaintenanceRecord.date >= start_date,
                 MaintenanceRecord.date <= end_date
             ).order_by(MaintenanceRecord.date).all()
@@ -1217,51 +1847,11 @@ def create_app(test_config=None):
                 month = record.date.month
                 maintenance_by_month[month].append(record)
 
-            # Get maintenance due counts by month
-            monthly_stats = []
-
-            for month_num in range(1, 13):
-                # Set to the last day of the month
-                if month_num == 12:
-                    month_end = datetime(year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    month_end = datetime(year, month_num + 1, 1) - timedelta(days=1)
-
-                # Calculate maintenance stats as of the end of the month
-                bcd_maintenance_due = 0
-                tank_maintenance_due = 0
-
-                # For BCDs, check if next_maintenance was due
-                bcds = BCD.query.all()
-                for bcd in bcds:
-                    if bcd.next_maintenance and bcd.next_maintenance <= month_end:
-                        bcd_maintenance_due += 1
-
-                # For tanks, check if hydro or VIP was due
-                tanks = Tank.query.all()
-                for tank in tanks:
-                    # Check hydro
-                    if tank.hydro_date:
-                        next_hydro = tank.hydro_date.replace(year=tank.hydro_date.year + 5)
-                        if next_hydro <= month_end:
-                            tank_maintenance_due += 1
-                            continue
-
-                    # Check VIP
-                    if tank.vip_date:
-                        next_vip = tank.vip_date.replace(year=tank.vip_date.year + 1)
-                        if next_vip <= month_end:
-                            tank_maintenance_due += 1
-
-                # Add to stats
-                monthly_stats.append({
-                    'month': month_num,
-                    'month_name': calendar.month_name[month_num],
-                    'maintenance_count': len(maintenance_by_month[month_num]),
-                    'bcd_maintenance_due': bcd_maintenance_due,
-                    'tank_maintenance_due': tank_maintenance_due,
-                    'total_maintenance_due': bcd_maintenance_due + tank_maintenance_due
-                })
+            # Get maintenance due counts as of each month end
+            monthly_stats = maintenance_due_by_month(year, year)
+            for stats in monthly_stats:
+                stats['month_name'] = calendar.month_name[stats['month']]
+                stats['maintenance_count'] = len(maintenance_by_month[stats['month']])
 
             # Calculate yearly summary
             total_maintenance = len(maintenance_records)
@@ -1288,6 +1878,21 @@ def create_app(test_config=None):
             flash(f"Error generating report: {str(e)}", "error")
             return redirect(url_for('reports'))
 
+    @app.route('/api/reports/maintenance-due')
+    def maintenance_due_trend():
+        """Maintenance due counts at each month end over a range of years"""
+        current_year = datetime.now().year
+        start_year = request.args.get('start_year', current_year, type=int)
+        end_year = request.args.get('end_year', start_year, type=int)
+        if end_year < start_year or end_year - start_year >= app.config['MAINTENANCE_TREND_MAX_YEARS']:
+            return jsonify({'error': f"Year range must cover 1 to {app.config['MAINTENANCE_TREND_MAX_YEARS']} years"}), 400
+
+        return jsonify({
+            'start_year': start_year,
+            'end_year': end_year,
+            'months': maintenance_due_by_month(start_year, end_year)
+        })
+
     # Add CLI commands for database management
     @app.cli.command("init-db")
     def init_db_command():
@@ -1364,8 +1969,142 @@ def create_app(test_config=None):
         except Exception as e:
             debug_info['bcds_error'] = str(e)
 
+        debug_info['modal_cache'] = modal_cache.stats()
+
+        try:
+            with db.engine.connect() as conn:
+                debug_info['storage'] = read_pragmas(conn, DEFAULT_PRAGMAS)
+            checkpointer = app.extensions.get('wal_checkpointer')
+            debug_info['wal_checkpoints'] = checkpointer.stats() if checkpointer else None
+        except Exception as e:
+            debug_info['storage_error'] = str(e)
+
         return render_template('debug.html', debug_info=debug_info)
 
+    @app.cli.command("backfill-due-dates")
+    def backfill_due_dates_command():
+        """Recompute materialized next-due dates for tanks, BCDs and regulators."""
+        added_columns = ensure_due_date_columns()
+        if added_columns:
+            print(f"Added columns: {', '.join(added_columns)}")
+        counts = backfill_due_dates()
+        print(f"Backfilled due dates: {counts}")
+
+    @app.cli.command("bench-tank-status")
+    @click.option('--repeat', default=5, help='Timing runs per implementation.')
+    def bench_tank_status_command(repeat):
+        """Time loading the tank rows and computing the tanks page status buckets on this database.
+
+        tests/test_tanks.py checks the buckets against the original per-row computation.
+        """
+        now = datetime.now()
+        upcoming_end = now + timedelta(days=30)
+        rows = []
+
+        def load():
+            rows[:] = db.session.query(*TANK_COLUMNS).join(
+                InventoryItem, Tank.inventory_item_id == InventoryItem.id
+            ).order_by(Tank.next_due.is_(None), Tank.next_due, Tank.id).all()
+
+        def compute():
+            return group_tanks_by_status(*tank_status_table(rows, now, upcoming_end))
+
+        timings = {}
+        for name, func_ in (('load', load), ('compute', compute)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func_()
+            timings[name] = (time.perf_counter() - start) / repeat
+
+        print(f"{len(rows)} tanks")
+        for name, seconds in timings.items():
+            print(f"{name:>10}: {seconds * 1000:.2f} ms")
+
+    @app.cli.command("bench-storage")
+    @click.option('--workers', default=8, help='Concurrent worker threads.')
+    @click.option('--seconds', default=5.0, help='Duration of each run.')
+    @click.option('--write-ratio', default=0.2, help='Share of operations that are writes.')
+    def bench_storage_command(workers, seconds, write_ratio):
+        """Compare SQLite's default storage settings with the configured profile under concurrent load."""
+        if database_file_id() is None:
+            raise click.ClickException("bench-storage needs a SQLite database file")
+
+        profiles = (('default', BASELINE_PRAGMAS), ('profile', storage_pragmas))
+        results = {}
+        for name, pragmas in profiles:
+            results[name] = run_benchmark(db.engine.url.database, pragmas, workers, seconds, write_ratio)
+
+        print(f"{workers} workers, {seconds:g}s per run, {write_ratio:.0%} writes, on a copy of the database")
+        for name, result in results.items():
+            print(f"{name:>8}: {result['reads_per_second']:8.0f} reads/s {result['writes_per_second']:8.0f} writes/s "
+                  f"{result['errors']:6d} lock errors")
+
+    @app.cli.command("stress-checkout")
+    @click.option('--workers', default=16, help='Concurrent worker threads.')
+    @click.option('--seconds', default=5.0, help='Duration of the run.')
+    def stress_checkout_command(workers, seconds):
+        """Race checkouts of one item from many threads on a copy of the database."""
+        if database_file_id() is None:
+            raise click.ClickException("stress-checkout needs a SQLite database file")
+
+        result = run_checkout_stress(db.engine.url.database, storage_pragmas, workers, seconds)
+
+        print(f"{workers} workers, {seconds:g}s, on a copy of the database")
+        print(f"{result['checked_out']} checkouts, {result['checked_in']} check-ins, "
+              f"{result['conflicts']} refused as already out, {result['errors']} errors")
+        print(f"{result['ops_per_second']:.0f} ops/s, {result['checkouts_per_second']:.0f} checkouts/s")
+        print(f"Final round: {result['final_winners']} of {workers} simultaneous checkouts won, "
+              f"{result['open_checkouts']} open checkout(s)")
+        if not result['consistent']:
+            print("Inconsistent: expected exactly one winner and one open checkout")
+            sys.exit(1)
+        print("Exactly one open checkout")
+
+    @app.cli.command("repair-maintenance-counters")
+    def repair_maintenance_counters_command():
+        """Recompute BCD maintenance counts and last-record pointers from the maintenance records."""
+        with db.engine.begin() as conn:
+            repaired = refresh_bcd_maintenance_counters(conn)
+        print(f"Repaired {repaired} BCDs" if repaired else "All BCD maintenance counters are consistent")
+
+    @app.cli.command("check-query-plans")
+    @click.option('--verbose', is_flag=True, help='Print the plan of every query.')
+    def check_query_plans_command(verbose):
+        """Fail if any page's queries fall back to a full table scan on this database.
+
+        tests/test_query_plans.py runs the same check on a seeded database.
+        """
+        ids = query_plan_page_ids()
+        # Detail pages are skipped when there is no record of their kind
+        pages = [page.format(**ids) for page in QUERY_PLAN_PAGES
+                 if not any(ids[key] is None and f'{{{key}}}' in page for key in ids)]
+
+        client = app.test_client()
+        failures = 0
+        queries = 0
+        for page in pages:
+            response, plans = explain_page_queries(client, page)
+            for statement, plan in plans:
+                scans = full_table_scans(statement, plan)
+                queries += 1
+                failures += bool(scans)
+                if scans or verbose:
+                    print(f"{page} ({response.status_code}): {' '.join(statement.split())}")
+                    for row in plan:
+                        print(f"    {row[3]}")
+
+        print(f"{len(pages)} pages, {queries} distinct queries, {failures} with full table scans")
+        if failures:
+            sys.exit(1)
+
+    @app.cli.command("rebuild-search-index")
+    def rebuild_search_index_command():
+        """Recreate the full-text search index from the inventory tables."""
+        with db.engine.begin() as conn:
+            create_search_index(conn.exec_driver_sql)
+            rebuild_search_index(conn.exec_driver_sql)
+        print("Search index rebuilt.")
+
     @app.cli.command("seed-db")
     def seed_db_command():
         """Seed the database with initial data."""
@@ -1399,11 +2138,56 @@ def create_app(test_config=None):
         db.session.commit()
         print("Database seeded with initial data.")
 
+    @app.cli.command("export-excel")
+    @click.argument('filename', required=False)
+    @click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS), default=None,
+                  help='xlsx workbook (needs xlsxwriter), or csv for a zip with one CSV file per sheet. '
+                       'Defaults to xlsx, or csv when xlsxwriter is not installed.')
+    def export_excel_command(filename, export_format):
+        """Export the database in the layout migrate-excel imports."""
+        if export_format is None:
+            export_format = export_format_or_fallback()
+            if export_format != 'xlsx':
+                print("xlsxwriter is not installed, exporting a zip of CSV files")
+        filename = filename or f"inventory_export.{export_extension(export_format)}"
+        started = time.perf_counter()
+        try:
+            counts = write_export(db.session.connection(), filename, export_format)
+        except ImportError as e:
+            raise click.ClickException(f"{e}; install xlsxwriter or use --format csv")
+        for sheet, count in counts.items():
+            print(f"{sheet}: {count} rows")
+        print(f"Exported to {filename} in {time.perf_counter() - started:.2f}s")
+
     @app.cli.command("migrate-excel")
-    def migrate_excel_command():
+    @click.option('--chunk-size', default=5000, help='Rows read and inserted per batch.')
+    @click.option('--incremental', is_flag=True,
+                  help='Update the existing database in place instead of recreating it.')
+    @click.option('--workers', default=1, help='Worker processes reading and cleaning sheets.')
+    @click.option('--batch-size', type=int, default=None,
+                  help='Commit about every N rows so a failed import can be resumed.')
+    @click.option('--resume', is_flag=True, help='Continue an interrupted import from its last committed batch.')
+    @click.option('--dry-run', '--validate', 'validate', is_flag=True,
+                  help='Check the workbook and write a report without importing it; exits 1 on problems.')
+    @click.option('--report', 'report_file', default=None,
+                  help='Validation report file (default: <workbook>_validation.csv).')
+    def migrate_excel_command(chunk_size, incremental, workers, batch_size, resume, validate, report_file):
         """Migrate data from Excel file to database."""
-        from migration import migrate_data
-        migrate_data('Inventory.xlsx')
+        from migration import migrate_data, validate_workbook
+        if validate:
+            problems = validate_workbook('Inventory.xlsx', report_file, chunk_size=chunk_size)
+            if problems is None:
+                raise click.ClickException("Could not read Inventory.xlsx")
+            if problems:
+                raise click.ClickException(f"{problems} problems found in Inventory.xlsx")
+            return
+        if database_file_id() is None:
+            raise click.ClickException("migrate-excel needs a SQLite database file")
+        # Import into the database this app is configured with
+        if not migrate_data('Inventory.xlsx', db.engine.url.database, chunk_size=chunk_size, incremental=incremental,
+                            workers=workers, batch_size=batch_size, resume=resume):
+            raise click.ClickException("Data migration failed; the database was not changed. See migration.log")
+        modal_cache.invalidate()
         print("Data migration completed.")
 
     return app
@@ -0,0 +1,190 @@
+# cache.py - Process-level snapshots of data shared by every page
+import re
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+
+from models import db, ItemType, InventoryItem, Tank, BCD, Regulator
+
+# Table an INSERT, UPDATE, DELETE or REPLACE statement writes to
+WRITE_STATEMENT = re.compile(
+    r'\s*(?:(?:INSERT|REPLACE)(?:\s+OR\s+\w+)?\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+["`]?(\w+)',
+    re.IGNORECASE)
+
+
+class ModalDataCache:
+    """Snapshot of the equipment lists used by the quick maintenance modal.
+
+    The snapshot is built with one joined query per equipment class and is
+    dropped whenever a committed transaction on the app's engine wrote to
+    the InventoryItem, BCD, Tank or Regulator tables. Writes are seen at the
+    statement level, so the ORM and Core writers (checkouts, batch
+    maintenance) are covered alike, and the listeners belong to one app's
+    engine rather than the Session class every app shares. A database
+    swapped in by migration.py is written elsewhere; the app invalidates
+    the snapshot when it reconnects. Due flags depend on the current time,
+    so snapshots also expire after max_age seconds.
+    """
+
+    WATCHED_MODELS = (InventoryItem, BCD, Tank, Regulator)
+
+    def __init__(self, engine, max_age=300):
+        self.engine = engine
+        self.max_age = max_age
+        self.watched_tables = {model.__tablename__ for model in self.WATCHED_MODELS}
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0.0
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+
+        self._listeners = (('before_cursor_execute', self._before_cursor_execute),
+                           ('commit', self._commit), ('rollback', self._rollback))
+        for name, listener in self._listeners:
+            event.listen(engine, name, listener)
+
+    def close(self):
+        """Stop watching the engine"""
+        for name, listener in self._listeners:
+            if event.contains(self.engine, name, listener):
+                event.remove(self.engine, name, listener)
+
+    # Engine hooks
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Remember that this transaction wrote to a watched table"""
+        match = WRITE_STATEMENT.match(statement)
+        if match and match.group(1).lower() in self.watched_tables:
+            conn.info['modal_cache_dirty'] = True
+
+    def _commit(self, conn):
+        if conn.info.pop('modal_cache_dirty', False):
+            self.invalidate()
+
+    def _rollback(self, conn):
+        conn.info.pop('modal_cache_dirty', None)
+
+    # Public API
+
+    def invalidate(self):
+        """Drop the current snapshot so the next request rebuilds it"""
+        with self._lock:
+            self._snapshot = None
+            self._generation += 1
+            self.invalidations += 1
+
+    def get(self):
+        """Return the current snapshot, rebuilding it if needed"""
+        with self._lock:
+            snapshot = self._snapshot
+            fresh = snapshot is not None and (time.monotonic() - self._built_at) < self.max_age
+            if fresh:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            generation = self._generation
+
+        snapshot = build_modal_snapshot()
+
+        with self._lock:
+            self.rebuilds += 1
+            # Only keep the snapshot if nothing was committed while we built it
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._built_at = time.monotonic()
+        return snapshot
+
+    def stats(self):
+        """Return hit/miss/rebuild counters for the debug page"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rebuilds': self.rebuilds,
+                'invalidations': self.invalidations,
+                'cached': self._snapshot is not None,
+                'age_seconds': round(time.monotonic() - self._built_at, 1) if self._snapshot is not None else None,
+                'max_age': self.max_age
+            }
+
+
+# Picker columns and row formatting per modal equipment type
+MODAL_EQUIPMENT_TYPES = ('bcd', 'tank', 'regulator', 'other')
+
+
+def modal_equipment_query(equipment_type):
+    """Return a joined column query for one modal equipment type"""
+    if equipment_type == 'bcd':
+        return db.session.query(
+            BCD.id, InventoryItem.manufacturer, InventoryItem.model,
+            InventoryItem.serial_number, BCD.next_due
+        ).join(InventoryItem, BCD.inventory_item_id == InventoryItem.id)
+
+    if equipment_type == 'tank':
+        return db.session.query(
+            Tank.id, InventoryItem.manufacturer, InventoryItem.model,
+            InventoryItem.serial_number, Tank.next_due
+        ).join(InventoryItem, Tank.inventory_item_id == InventoryItem.id)
+
+    if equipment_type == 'regulator':
+        return db.session.query(
+            Regulator.id, InventoryItem.manufacturer, InventoryItem.model,
+            InventoryItem.serial_number
+        ).join(InventoryItem, Regulator.inventory_item_id == InventoryItem.id)
+
+    if equipment_type == 'other':
+        # Anything without a BCD, Tank or Regulator row
+        return db.session.query(
+            InventoryItem.id, InventoryItem.manufacturer, InventoryItem.model,
+            InventoryItem.serial_number, ItemType.name.label('type_name')
+        ).outerjoin(ItemType, InventoryItem.item_type_id == ItemType.id
+        ).outerjoin(BCD, BCD.inventory_item_id == InventoryItem.id
+        ).outerjoin(Tank, Tank.inventory_item_id == InventoryItem.id
+        ).outerjoin(Regulator, Regulator.inventory_item_id == InventoryItem.id
+        ).filter(BCD.id.is_(None), Tank.id.is_(None), Regulator.id.is_(None))
+
+    raise ValueError(f"Unknown equipment type: {equipment_type}")
+
+
+def modal_equipment_id_column(equipment_type):
+    """Return the column the modal submits for an equipment type"""
+    return {
+        'bcd': BCD.id,
+        'tank': Tank.id,
+        'regulator': Regulator.id,
+        'other': InventoryItem.id
+    }[equipment_type]
+
+
+def modal_equipment_row(equipment_type, row, now):
+    """Format one picker row the way layout.html expects it"""
+    data = {
+        'id': row.id,
+        'manufacturer': row.manufacturer,
+        'model': row.model,
+        'serial_number': row.serial_number
+    }
+    if equipment_type == 'bcd':
+        data['is_maintenance_due'] = bool(row.next_due and row.next_due <= now)
+    elif equipment_type == 'tank':
+        data['maintenance_due'] = bool(row.next_due and row.next_due <= now)
+    elif equipment_type == 'other':
+        data['type_name'] = row.type_name or "Unknown"
+    return data
+
+
+def build_modal_snapshot():
+    """Load the maintenance modal picker lists with set-based queries"""
+    now = datetime.now()
+    snapshot = {}
+    for equipment_type, key in (('bcd', 'global_bcds'), ('tank', 'global_tanks'),
+                                ('regulator', 'global_regulators'), ('other', 'global_other_items')):
+        rows = modal_equipment_query(equipment_type).all()
+        snapshot[key] = [modal_equipment_row(equipment_type, row, now) for row in rows]
+    return snapshot
@@ -0,0 +1,341 @@
+# checkouts.py - Atomic checkout and check-in
+#
+# The availability test and the status change are one conditional UPDATE, so
+# two requests for the same item can't both succeed: SQLite serializes the
+# writers and the second one matches no row. The CheckoutRecord is written in
+# the same transaction. Functions take a Session or Connection and leave the
+# commit to the caller.
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, select, insert, update, literal, func, or_, case
+
+from models import InventoryItem, CheckoutRecord
+from storage import configure_storage
+
+items = InventoryItem.__table__
+checkouts = CheckoutRecord.__table__
+
+# Imported rows can have NULL for "not checked out"
+item_available = or_(items.c.currently_checked_out.is_(None), items.c.currently_checked_out == False)
+
+# Values per IN list: SQLite builds before 3.32 allow only 999 bound parameters
+# per statement, and resolve_items binds two lists
+IN_CHUNK_SIZE = 400
+
+
+def chunked(values, size=IN_CHUNK_SIZE):
+    """Split values into lists of at most size, for IN clauses"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def check_out_item(connection, item_id, person_name, notes='', now=None):
+    """Check an item out if it is available; returns False when it was already out or doesn't exist"""
+    now = now or datetime.now()
+    claimed = connection.execute(update(items).where(items.c.id == item_id, item_available).values(
+        currently_checked_out=True, last_check_out_date=now)).rowcount
+    if not claimed:
+        return False
+    # The checkout condition is copied from the item inside the database
+    connection.execute(insert(checkouts).from_select(
+        ['inventory_item_id', 'person_name', 'checkout_date', 'checkout_condition', 'notes'],
+        select(items.c.id, literal(person_name), literal(now, checkouts.c.checkout_date.type),
+               items.c.condition_code, literal(notes)).where(items.c.id == item_id)))
+    return True
+
+
+def check_in_item(connection, item_id, condition_code, notes='', now=None):
+    """Check an item in if it is out; returns False when it wasn't out or doesn't exist"""
+    now = now or datetime.now()
+    released = connection.execute(update(items).where(items.c.id == item_id, items.c.currently_checked_out == True).values(
+        currently_checked_out=False, last_check_in_date=now, condition_code=condition_code)).rowcount
+    if not released:
+        return False
+    open_checkout = select(checkouts.c.id).where(
+        checkouts.c.inventory_item_id == item_id, checkouts.c.checkin_date.is_(None)
+    ).order_by(checkouts.c.checkout_date.desc()).limit(1).scalar_subquery()
+    values = {'checkin_date': now, 'checkin_condition': condition_code}
+    if notes:
+        values['notes'] = func.coalesce(checkouts.c.notes, '') + "\n\nCheck-in notes: " + notes
+    connection.execute(update(checkouts).where(checkouts.c.id == open_checkout).values(**values))
+    return True
+
+
+# Kits: several items checked out or in together, all or nothing
+
+def parse_item_tokens(text):
+    """Split scanned serials or item IDs on newlines, commas and semicolons, dropping repeats"""
+    tokens = [token.strip() for token in re.split(r'[\r\n,;]+', text or '')]
+    return list(dict.fromkeys(token for token in tokens if token))
+
+
+def resolve_items(connection, tokens):
+    """Look up items by serial number or ID in one query
+
+    A token matches a serial number first and an item ID second; '#123'
+    only matches item ID 123. Returns ({token: row}, [unknown tokens]); rows
+    carry the id, serial number, manufacturer, model, condition and
+    checkout status.
+    """
+    tokens = [str(token) for token in tokens]
+
+    def item_id(token):
+        digits = token[1:] if token.startswith('#') else token
+        return int(digits) if digits.isdigit() else None
+
+    rows = []
+    for chunk in chunked(tokens):
+        ids = [item_id(token) for token in chunk if item_id(token) is not None]
+        rows += connection.execute(select(
+            items.c.id, items.c.serial_number, items.c.manufacturer, items.c.model,
+            items.c.condition_code, items.c.currently_checked_out
+        ).where(or_(items.c.serial_number.in_(chunk), items.c.id.in_(ids)))).all()
+    by_serial = {row.serial_number: row for row in rows}
+    by_id = {row.id: row for row in rows}
+
+    found = {}
+    unknown = []
+    for token in tokens:
+        row = None if token.startswith('#') else by_serial.get(token)
+        if row is None:
+            row = by_id.get(item_id(token))
+        if row is None:
+            unknown.append(token)
+        else:
+            found[token] = row
+    return found, unknown
+
+
+def check_out_items(connection, item_ids, person_name, notes='', now=None):
+    """Check out every item with one UPDATE and one INSERT
+
+    Returns how many items were claimed. When that is fewer than
+    len(item_ids) another request took some of them first, no records were
+    written, and the caller must roll back.
+    """
+    now = now or datetime.now()
+    item_ids = list(item_ids)
+    claimed = connection.execute(update(items).where(items.c.id.in_(item_ids), item_available).values(
+        currently_checked_out=True, last_check_out_date=now)).rowcount
+    if claimed != len(item_ids):
+        return claimed
+    connection.execute(insert(checkouts).from_select(
+        ['inventory_item_id', 'person_name', 'checkout_date', 'checkout_condition', 'notes'],
+        select(items.c.id, literal(person_name), literal(now, checkouts.c.checkout_date.type),
+               items.c.condition_code, literal(notes)).where(items.c.id.in_(item_ids)).order_by(items.c.id)))
+    return claimed
+
+
+def check_in_items(connection, conditions, notes='', now=None):
+    """Check in items given {item_id: condition code}, with one UPDATE per table
+
+    Returns how many items were released. When that is fewer than
+    len(conditions) some were not checked out, their checkouts were left
+    open, and the caller must roll back.
+    """
+    now = now or datetime.now()
+    item_ids = list(conditions)
+    released = connection.execute(update(items).where(items.c.id.in_(item_ids), items.c.currently_checked_out == True).values(
+        currently_checked_out=False, last_check_in_date=now,
+        condition_code=case(conditions, value=items.c.id))).rowcount
+    if released != len(item_ids):
+        return released
+
+    # Close each item's latest open checkout
+    other = checkouts.alias()
+    latest_open = select(func.max(other.c.checkout_date)).where(
+        other.c.inventory_item_id == checkouts.c.inventory_item_id, other.c.checkin_date.is_(None)
+    ).scalar_subquery()
+    values = {'checkin_date': now, 'checkin_condition': case(conditions, value=checkouts.c.inventory_item_id)}
+    if notes:
+        values['notes'] = func.coalesce(checkouts.c.notes, '') + "\n\nCheck-in notes: " + notes
+    connection.execute(update(checkouts).where(
+        checkouts.c.inventory_item_id.in_(item_ids), checkouts.c.checkin_date.is_(None),
+        checkouts.c.checkout_date == latest_open
+    ).values(**values))
+    return released
+
+
+def items_out_to(connection, person_name):
+    """Rows, shaped like resolve_items', of the items with an open checkout under person_name"""
+    return connection.execute(select(
+        items.c.id, items.c.serial_number, items.c.manufacturer, items.c.model,
+        items.c.condition_code, items.c.currently_checked_out
+    ).where(items.c.id.in_(select(checkouts.c.inventory_item_id).where(
+        checkouts.c.checkin_date.is_(None), func.lower(checkouts.c.person_name) == person_name.lower()
+    ))).order_by(items.c.id)).all()
+
+
+def describe_item(row):
+    """Serial number and make of an item row, for messages"""
+    name = ' '.join(part for part in (row.manufacturer, row.model) if part)
+    label = row.serial_number or f"#{row.id}"
+    return f"{label} ({name})" if name else label
+
+
+def kit_summary(result):
+    """JSON-ready form of a check_out_kit or check_in_kit result"""
+    def item(row):
+        return {'id': row.id, 'serial_number': row.serial_number}
+    summary = {key: value for key, value in result.items() if key in ('checked_out', 'checked_in')}
+    summary.update({
+        'items': [item(row) for row in result['items']],
+        'unknown': result['unknown'],
+        'unavailable': [item(row) for row in result['unavailable']]
+    })
+    return summary
+
+
+def check_out_kit(connection, tokens, person_name, notes='', now=None):
+    """Resolve, validate and check out a kit of items
+
+    Returns a dict with the resolved rows ('items'), 'unknown' tokens,
+    'unavailable' rows and 'checked_out', the number of items checked out.
+    Nothing is written unless every item resolved and was available; the
+    caller commits when 'checked_out' is non-zero and rolls back otherwise.
+    """
+    found, unknown = resolve_items(connection, tokens)
+    rows = list({row.id: row for row in found.values()}.values())
+    result = {'items': rows, 'unknown': unknown, 'checked_out': 0,
+              'unavailable': [row for row in rows if row.currently_checked_out]}
+    if not rows or unknown or result['unavailable']:
+        return result
+
+    claimed = check_out_items(connection, [row.id for row in rows], person_name, notes, now)
+    if claimed == len(rows):
+        result['checked_out'] = claimed
+    else:
+        # Taken between the lookup and the update; report the whole kit as contested
+        result['unavailable'] = rows
+    return result
+
+
+def check_in_kit(connection, conditions, notes='', now=None):
+    """Resolve and check in items given {serial or ID: condition code}
+
+    Returns the same shape as check_out_kit, with 'checked_in' counting the
+    items released and 'unavailable' listing items that were not out.
+    """
+    found, unknown = resolve_items(connection, list(conditions))
+    codes = {row.id: int(conditions[token]) for token, row in found.items()}
+    rows = list({row.id: row for row in found.values()}.values())
+    result = {'items': rows, 'unknown': unknown, 'checked_in': 0,
+              'unavailable': [row for row in rows if not row.currently_checked_out]}
+    if not rows or unknown or result['unavailable']:
+        return result
+
+    released = check_in_items(connection, codes, notes, now)
+    if released == len(rows):
+        result['checked_in'] = released
+    else:
+        result['unavailable'] = rows
+    return result
+
+
+def _stress_worker(engine, item_id, deadline, counts, lock, start):
+    checked_out = checked_in = conflicts = errors = 0
+    name = threading.current_thread().name
+    start.wait()
+    while time.perf_counter() < deadline:
+        try:
+            with engine.begin() as connection:
+                won = check_out_item(connection, item_id, name)
+            if not won:
+                conflicts += 1
+                continue
+            checked_out += 1
+            with engine.begin() as connection:
+                checked_in += check_in_item(connection, item_id, 1)
+        except Exception:
+            errors += 1
+    with lock:
+        counts['checked_out'] += checked_out
+        counts['checked_in'] += checked_in
+        counts['conflicts'] += conflicts
+        counts['errors'] += errors
+
+
+def run_checkout_stress(db_file, pragmas, workers=16, seconds=5.0):
+    """Hammer one item with concurrent checkouts and check-ins on a copy of db_file
+
+    Workers race to check the item out and check it back in when they win.
+    A final round where every worker tries once without checking in must
+    leave exactly one open checkout. Returns counters, ops/s and whether
+    the invariants held.
+    """
+    work_dir = tempfile.mkdtemp()
+    copy_file = os.path.join(work_dir, 'stress.db')
+    try:
+        with sqlite3.connect(db_file) as source, sqlite3.connect(copy_file) as target:
+            source.backup(target)
+
+        engine = create_engine(f"sqlite:///{copy_file}", pool_size=workers, max_overflow=0)
+        configure_storage(engine, pragmas)
+        with engine.begin() as connection:
+            item_id = connection.execute(select(func.min(items.c.id))).scalar()
+            if item_id is None:
+                raise ValueError("The database has no inventory items to check out")
+            # Start from an available item with no history
+            connection.execute(update(items).where(items.c.id == item_id).values(currently_checked_out=False))
+            connection.execute(checkouts.delete().where(checkouts.c.inventory_item_id == item_id))
+
+        counts = {'checked_out': 0, 'checked_in': 0, 'conflicts': 0, 'errors': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(workers)
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=_stress_worker, args=(engine, item_id, deadline, counts, lock, start))
+                   for _ in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # Final round: everyone tries once at the same moment, nobody checks in
+        final_wins = []
+        final_start = threading.Barrier(workers)
+
+        def final_attempt():
+            final_start.wait()
+            with engine.begin() as connection:
+                if check_out_item(connection, item_id, threading.current_thread().name):
+                    final_wins.append(True)
+
+        threads = [threading.Thread(target=final_attempt) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with engine.connect() as connection:
+            open_checkouts = connection.execute(select(func.count()).where(
+                checkouts.c.inventory_item_id == item_id, checkouts.c.checkin_date.is_(None))).scalar()
+            total_checkouts = connection.execute(select(func.count()).where(
+                checkouts.c.inventory_item_id == item_id)).scalar()
+            checked_out = connection.execute(select(items.c.currently_checked_out).where(
+                items.c.id == item_id)).scalar()
+        engine.dispose()
+
+        operations = counts['checked_out'] + counts['checked_in'] + counts['conflicts']
+        return {
+            **counts,
+            'workers': workers,
+            'ops_per_second': operations / elapsed,
+            'checkouts_per_second': counts['checked_out'] / elapsed,
+            'final_winners': len(final_wins),
+            'open_checkouts': open_checkouts,
+            'consistent': (open_checkouts == 1 and len(final_wins) == 1 and bool(checked_out)
+                           and total_checkouts == counts['checked_out'] + 1
+                           and counts['checked_in'] == counts['checked_out'])
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,161 @@
+# export.py - Stream the database out in the workbook layout migration.py imports
+#
+# Every sheet is a Core select run with yield_per, so rows are fetched from the
+# cursor in batches and written one at a time instead of being loaded as ORM
+# objects. Excel files are written with xlsxwriter in constant_memory mode,
+# which flushes each row to disk; the CSV variant writes one file per sheet
+# into a zip archive. xlsxwriter is optional: without it exports default to
+# the CSV zip, which only needs the standard library.
+import csv
+import io
+import time
+import zipfile
+
+from sqlalchemy import select, literal, union_all
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+from models import (ItemType, Location, InventoryItem, Tank, Mask, CheckoutRecord, MaintenanceRecord, BCD,
+                    TankMaintenanceRecord, InventoryMaintenanceRecord)
+
+# Rows fetched from the database per round trip
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+
+
+def export_format_or_fallback(export_format=None):
+    """The format to write for a requested one: xlsx, the default, becomes csv without xlsxwriter"""
+    export_format = export_format or 'xlsx'
+    if export_format == 'xlsx' and xlsxwriter is None:
+        return 'csv'
+    return export_format
+
+
+def export_extension(export_format):
+    return 'xlsx' if export_format == 'xlsx' else 'zip'
+
+
+def _maintenance_query():
+    """Maintenance history of every equipment class in one select"""
+    bcd_records = select(
+        literal('BCD').label('equipment'), BCD.inventory_item_id, MaintenanceRecord.date,
+        MaintenanceRecord.maintenance_type, MaintenanceRecord.notes
+    ).join(BCD, MaintenanceRecord.bcd_id == BCD.id)
+    tank_records = select(
+        literal('Tank'), Tank.inventory_item_id, TankMaintenanceRecord.date,
+        TankMaintenanceRecord.maintenance_type, TankMaintenanceRecord.notes
+    ).join(Tank, TankMaintenanceRecord.tank_id == Tank.id)
+    item_records = select(
+        literal('Item'), InventoryMaintenanceRecord.inventory_item_id, InventoryMaintenanceRecord.date,
+        InventoryMaintenanceRecord.maintenance_type, InventoryMaintenanceRecord.notes
+    )
+    records = union_all(bcd_records, tank_records, item_records).subquery()
+    return select(
+        records.c.equipment, records.c.inventory_item_id, InventoryItem.serial_number, records.c.date,
+        records.c.maintenance_type, records.c.notes
+    ).outerjoin(InventoryItem, InventoryItem.id == records.c.inventory_item_id
+    ).order_by(records.c.date, records.c.inventory_item_id)
+
+
+def export_sheets():
+    """(sheet name, header, select) for each exported sheet, in import order
+
+    The first four sheets use the headers migration.SHEET_COLUMNS reads, so
+    an export can be imported again. Tanks only appear on Tank_Inventory,
+    which the import turns back into inventory items.
+    """
+    return [
+        ('Item_Type', ['ID', 'Item Type'],
+         select(ItemType.id, ItemType.name).order_by(ItemType.id)),
+        ('Locations', ['ID', 'Location'],
+         select(Location.id, Location.name).order_by(Location.id)),
+        ('Inventory', ['ID', 'Item Type Lookup', 'Item Manufacturer', 'Item Model', 'Item Seriel Number',
+                       'Intake Date', 'Disposal Date', 'Location', 'PM Required', 'Condition Code', 'Size'],
+         select(InventoryItem.id, InventoryItem.item_type_id, InventoryItem.manufacturer, InventoryItem.model,
+                InventoryItem.serial_number, InventoryItem.intake_date, InventoryItem.disposal_date,
+                InventoryItem.location_id, InventoryItem.pm_required, InventoryItem.condition_code, Mask.size
+                ).outerjoin(Mask, Mask.inventory_item_id == InventoryItem.id
+                ).outerjoin(Tank, Tank.inventory_item_id == InventoryItem.id
+                ).where(Tank.id.is_(None)).order_by(InventoryItem.id)),
+        ('Tank_Inventory', ['Tank ID', 'Tank Number', 'Manufacturer', 'Hydro Date', 'VIP Date',
+                            'Tank Material', 'Working Pressure', 'Gas Type'],
+         select(InventoryItem.serial_number, Tank.tank_number, InventoryItem.manufacturer, Tank.hydro_date,
+                Tank.vip_date, Tank.tank_material, Tank.working_pressure, Tank.gas_type
+                ).join(InventoryItem, Tank.inventory_item_id == InventoryItem.id).order_by(InventoryItem.id)),
+        ('Checkouts', ['ID', 'Item ID', 'Serial Number', 'Person', 'Checkout Date', 'Checkin Date',
+                       'Checkout Condition', 'Checkin Condition', 'Notes'],
+         select(CheckoutRecord.id, CheckoutRecord.inventory_item_id, InventoryItem.serial_number,
+                CheckoutRecord.person_name, CheckoutRecord.checkout_date, CheckoutRecord.checkin_date,
+                CheckoutRecord.checkout_condition, CheckoutRecord.checkin_condition, CheckoutRecord.notes
+                ).outerjoin(InventoryItem, CheckoutRecord.inventory_item_id == InventoryItem.id
+                ).order_by(CheckoutRecord.id)),
+        ('Maintenance', ['Equipment', 'Item ID', 'Serial Number', 'Date', 'Maintenance Type', 'Notes'],
+         _maintenance_query()),
+    ]
+
+
+def stream_rows(connection, query):
+    """Yield the rows of a select, fetching EXPORT_BATCH_SIZE at a time"""
+    result = connection.execution_options(yield_per=EXPORT_BATCH_SIZE).execute(query)
+    for partition in result.partitions():
+        yield from partition
+
+
+def write_xlsx(connection, target):
+    """Write every sheet to an .xlsx file path or binary file object
+
+    Requires the optional xlsxwriter package. Returns the number of rows
+    written per sheet.
+    """
+    if xlsxwriter is None:
+        raise ImportError("The xlsx export needs the xlsxwriter package")
+
+    workbook = xlsxwriter.Workbook(target, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+    counts = {}
+    try:
+        for name, header, query in export_sheets():
+            worksheet = workbook.add_worksheet(name)
+            worksheet.write_row(0, 0, header)
+            row_number = 0
+            for row_number, row in enumerate(stream_rows(connection, query), start=1):
+                worksheet.write_row(row_number, 0, row)
+            counts[name] = row_number
+    finally:
+        workbook.close()
+    return counts
+
+
+def write_csv_zip(connection, target):
+    """Write every sheet as <sheet>.csv into a zip file path or binary file object
+
+    Returns the number of rows written per sheet.
+    """
+    counts = {}
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, header, query in export_sheets():
+            entry = zipfile.ZipInfo(f"{name}.csv", date_time=time.localtime()[:6])
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(entry, 'w') as member:
+                text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+                writer = csv.writer(text)
+                writer.writerow(header)
+                row_number = 0
+                for row_number, row in enumerate(stream_rows(connection, query), start=1):
+                    writer.writerow(row)
+                text.flush()
+                text.detach()
+            counts[name] = row_number
+    return counts
+
+
+def write_export(connection, target, export_format='xlsx'):
+    """Write the export in one of EXPORT_FORMATS; 'xlsx' needs xlsxwriter installed"""
+    if export_format == 'csv':
+        return write_csv_zip(connection, target)
+    if export_format == 'xlsx':
+        return write_xlsx(connection, target)
+    raise ValueError(f"Unknown export format: {export_format}")
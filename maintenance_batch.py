@@ -0,0 +1,163 @@
+# maintenance_batch.py - Record one maintenance event on many items at once
+#
+# A VIP or hydro day covers most of the fleet. The records go in with one
+# executemany INSERT and the anchor dates move with one set-based UPDATE per
+# IN_CHUNK_SIZE items. That UPDATE also writes the materialized due dates,
+# because the ORM events that normally keep them in sync don't fire for Core
+# statements.
+# Functions take a Session or Connection and leave the commit to the caller.
+from sqlalchemy import select, insert, update, literal, func
+
+from models import db, InventoryItem, Tank, BCD, Regulator, MaintenanceRecord, TankMaintenanceRecord
+from models import InventoryMaintenanceRecord, refresh_bcd_maintenance_counters
+from maintenance_rules import rules_for, rule_for_label
+from checkouts import resolve_items, chunked
+
+items = InventoryItem.__table__
+
+# Equipment model, record model and the record column naming the equipment per
+# quick maintenance type; regulator and other records point at the inventory item
+BATCH_EQUIPMENT = {
+    'tank': (Tank, TankMaintenanceRecord, 'tank_id'),
+    'bcd': (BCD, MaintenanceRecord, 'bcd_id'),
+    'regulator': (Regulator, InventoryMaintenanceRecord, 'inventory_item_id'),
+    'other': (None, InventoryMaintenanceRecord, 'inventory_item_id'),
+}
+
+
+def anchor_rule(equipment_type, maintenance_type):
+    """The rule whose anchor date a maintenance type resets, or None
+
+    Matches /quick-maintenance: tanks reset the rule with the type's label,
+    BCDs and regulators reset their only rule whatever the type.
+    """
+    model = BATCH_EQUIPMENT[equipment_type][0]
+    if model is None:
+        return None
+    rules = rules_for(model)
+    if len(rules) == 1:
+        return rules[0]
+    return rule_for_label(model, maintenance_type)
+
+
+def equipment_query(equipment_type, rule=None):
+    """Select inventory rows with their equipment_id and current anchor date ('previous')"""
+    model = BATCH_EQUIPMENT[equipment_type][0]
+    columns = [items.c.id, items.c.serial_number, items.c.manufacturer, items.c.model]
+    if model is None:
+        return select(*columns, items.c.id.label('equipment_id'), literal(None).label('previous'))
+    table = model.__table__
+    previous = table.c[rule.anchor] if rule else literal(None)
+    return select(*columns, table.c.id.label('equipment_id'), previous.label('previous')).join(
+        table, table.c.inventory_item_id == items.c.id)
+
+
+def resolve_equipment(connection, equipment_type, tokens, rule=None):
+    """Look up serial numbers or item IDs as equipment of one type
+
+    Returns (rows, [unknown tokens], [item rows of another type]); repeated
+    items are kept once.
+    """
+    found, unknown = resolve_items(connection, tokens)
+    item_rows = list({row.id: row for row in found.values()}.values())
+    rows = {}
+    for chunk in chunked(row.id for row in item_rows):
+        rows.update((row.id, row) for row in connection.execute(
+            equipment_query(equipment_type, rule).where(items.c.id.in_(chunk))))
+    return ([rows[row.id] for row in item_rows if row.id in rows], unknown,
+            [row for row in item_rows if row.id not in rows])
+
+
+def due_equipment(connection, equipment_type, rule, due_by):
+    """Equipment with the rule's maintenance due by a date, soonest first"""
+    return connection.execute(equipment_query(equipment_type, rule).where(rule.due_filter(due_by)).order_by(
+        rule.next_due_expr(), items.c.id)).all()
+
+
+def anchor_values(rule, anchor_date):
+    """SET clause resetting a rule's anchor on many rows, with the due dates it drives
+
+    Every row gets the same due date for this rule. The overall next_due is
+    the earliest of it and each other rule's due date on the row, as
+    apply_due_dates() computes it.
+    """
+    table = rule.model.__table__
+    due_date = rule.next_due(anchor_date)
+    values = {rule.anchor: anchor_date, rule.due_column: due_date}
+    if 'next_due' in table.c:
+        due = literal(due_date, db.DateTime)
+        # SQLite's multi-argument min() is NULL if any argument is
+        others = [func.coalesce(other.next_due_expr(), due) for other in rules_for(rule.model) if other is not rule]
+        values['next_due'] = func.min(due, *others, type_=db.DateTime) if others else due_date
+    return values
+
+
+def record_batch(connection, equipment_type, rows, maintenance_date, maintenance_type, notes='', rule=None):
+    """Insert a maintenance record for every row and reset the rule's anchor on them
+
+    The anchor UPDATE and the BCD counter refresh run once per IN_CHUNK_SIZE
+    rows, so a whole fleet stays under SQLite's bound parameter limit.
+    Returns the number of records written.
+    """
+    if not rows:
+        return 0
+    model, record_model, record_key = BATCH_EQUIPMENT[equipment_type]
+    connection.execute(insert(record_model.__table__), [
+        {record_key: row.id if record_key == 'inventory_item_id' else row.equipment_id,
+         'date': maintenance_date, 'maintenance_type': maintenance_type, 'notes': notes}
+        for row in rows
+    ])
+
+    for equipment_ids in chunked(row.equipment_id for row in rows):
+        if rule is not None:
+            table = model.__table__
+            connection.execute(update(table).where(table.c.id.in_(equipment_ids)).values(
+                anchor_values(rule, maintenance_date)))
+        if model is BCD:
+            refresh_bcd_maintenance_counters(connection, equipment_ids)
+    return len(rows)
+
+
+def record_maintenance_batch(connection, equipment_type, maintenance_date, maintenance_type, notes='',
+                             tokens=(), due_by=None):
+    """Record maintenance on listed equipment and/or everything due by a date
+
+    tokens are serial numbers or item IDs as accepted by resolve_items();
+    due_by adds every item whose maintenance for the type is due by then.
+    Known items are recorded even when others in the list are not. Returns a
+    dict with the recorded rows ('items', each with its 'previous' anchor
+    date), 'unknown' tokens, 'wrong_type' item rows, 'recorded' and the
+    'rule' and 'next_due' date the batch set, if any.
+    """
+    if equipment_type not in BATCH_EQUIPMENT:
+        raise ValueError(f"Unknown equipment type: {equipment_type}")
+    rule = anchor_rule(equipment_type, maintenance_type)
+
+    rows, unknown, wrong_type = [], [], []
+    if tokens:
+        rows, unknown, wrong_type = resolve_equipment(connection, equipment_type, tokens, rule)
+    if due_by is not None:
+        if rule is None:
+            raise ValueError(f"{maintenance_type} has no due date to select {equipment_type} equipment by")
+        listed = {row.id for row in rows}
+        rows += [row for row in due_equipment(connection, equipment_type, rule, due_by) if row.id not in listed]
+
+    recorded = record_batch(connection, equipment_type, rows, maintenance_date, maintenance_type, notes, rule)
+    return {'items': rows, 'unknown': unknown, 'wrong_type': wrong_type, 'recorded': recorded, 'rule': rule,
+            'next_due': rule.next_due(maintenance_date) if rule else None}
+
+
+def batch_summary(result):
+    """JSON-ready, per-item form of a record_maintenance_batch result"""
+    def date(value):
+        return value.isoformat() if value else None
+
+    results = [{'id': row.id, 'serial_number': row.serial_number, 'equipment_id': row.equipment_id,
+                'status': 'recorded', 'previous': date(row.previous), 'next_due': date(result['next_due'])}
+               for row in result['items']]
+    results += [{'token': token, 'status': 'unknown'} for token in result['unknown']]
+    results += [{'id': row.id, 'serial_number': row.serial_number, 'status': 'wrong_type'}
+                for row in result['wrong_type']]
+    return {'recorded': result['recorded'],
+            'anchor': result['rule'].anchor if result['rule'] else None,
+            'results': results}
@@ -0,0 +1,171 @@
+# maintenance_rules.py - Service interval rules for equipment that needs maintenance
+import calendar
+import copy
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import or_
+
+from models import db, Tank, BCD, Regulator
+
+
+def add_months(value, months):
+    """Add months to a date, clamping the day to the end of the target month"""
+    if value is None:
+        return None
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+class MaintenanceRule:
+    """One maintenance interval for an equipment type.
+
+    A rule says that `kind` maintenance on `model` is due `months` after the
+    date stored in its `anchor` column. It is evaluated in Python for a
+    single record; the due date is also materialized in the indexed
+    `due_column`, which due and upcoming filters compare inside the database.
+
+    Every rule needs a due_column: there is no SQL date arithmetic fallback,
+    so a new equipment type gets a due column (see DUE_DATE_COLUMNS in
+    models.py) along with its rule. item_type_id is the type's ID in the
+    seeded item_types table.
+    """
+
+    def __init__(self, item_type, item_type_id, kind, label, model, anchor, months, due_column):
+        self.item_type = item_type
+        self.item_type_id = item_type_id
+        self.kind = kind
+        self.label = label
+        self.model = model
+        self.anchor = anchor
+        self.months = months
+        self.due_column = due_column
+
+    def __repr__(self):
+        return f"<MaintenanceRule {self.item_type}.{self.kind} every {self.months} months>"
+
+    # Python evaluator
+
+    def next_due(self, anchor_value):
+        """Return the next due date for an anchor date"""
+        return add_months(anchor_value, self.months)
+
+    def next_due_for(self, record):
+        """Return the next due date for a model instance"""
+        return self.next_due(getattr(record, self.anchor))
+
+    def is_due(self, record, as_of=None):
+        due_date = self.next_due_for(record)
+        return bool(due_date and due_date <= (as_of or datetime.now()))
+
+    # SQL filters
+
+    def next_due_expr(self):
+        """SQL expression for the next due date: the materialized column
+
+        It only matches the interval if due dates were backfilled after the
+        interval last changed; create_app warns when they were not.
+        """
+        return getattr(self.model, self.due_column)
+
+    def due_filter(self, as_of):
+        return self.next_due_expr() <= as_of
+
+    def upcoming_filter(self, start, end):
+        due_date = self.next_due_expr()
+        return (due_date > start) & (due_date <= end)
+
+
+# The default rule table: interval and anchor column per item type and
+# maintenance kind. Apps work on their own copy from build_rules().
+MAINTENANCE_RULES = (
+    MaintenanceRule('BCD', 1, 'service', 'Annual Service', BCD, 'last_maintenance', 12,
+                    due_column='next_maintenance'),
+    MaintenanceRule('Regulator', 2, 'service', 'Annual Service', Regulator, 'last_service_date', 12,
+                    due_column='next_service_due'),
+    MaintenanceRule('Tank', 7, 'vip', 'VIP Inspection', Tank, 'vip_date', 12,
+                    due_column='next_vip_due'),
+    MaintenanceRule('Tank', 7, 'hydro', 'Hydro Test', Tank, 'hydro_date', 60,
+                    due_column='next_hydro_due'),
+)
+
+
+def build_rules(intervals=None):
+    """Copy the default rules with interval overrides from config, e.g. {'Tank.hydro': 60}
+
+    create_app keeps the copy in app.extensions['maintenance_rules'].
+    Materialized due dates are not rewritten; run `flask backfill-due-dates`
+    after changing an interval.
+    """
+    rules = [copy.copy(rule) for rule in MAINTENANCE_RULES]
+    for key, months in (intervals or {}).items():
+        get_rule(*key.split('.', 1), rules=rules).months = int(months)
+    return rules
+
+
+def changed_rules(rules):
+    """Rules whose interval differs from the default"""
+    return [rule for rule, default in zip(rules, MAINTENANCE_RULES) if rule.months != default.months]
+
+
+def stale_due_dates(rules, sample=20):
+    """Rules whose materialized due dates don't follow their interval on a sample of records
+
+    Due dates are written when a record is saved, so after an interval
+    changes they stay stale until `flask backfill-due-dates` runs.
+    """
+    stale = []
+    for rule in rules:
+        anchor = getattr(rule.model, rule.anchor)
+        rows = db.session.query(anchor, rule.next_due_expr()).filter(anchor.isnot(None)).limit(sample).all()
+        if any(due_date != rule.next_due(anchor_date) for anchor_date, due_date in rows):
+            stale.append(rule)
+    return stale
+
+
+def current_rules():
+    """The current app's rule table, or the defaults outside an app context"""
+    if has_app_context():
+        return current_app.extensions.get('maintenance_rules', MAINTENANCE_RULES)
+    return MAINTENANCE_RULES
+
+
+def get_rule(item_type, kind, rules=None):
+    for rule in rules if rules is not None else current_rules():
+        if rule.item_type == item_type and rule.kind == kind:
+            return rule
+    raise KeyError(f"No maintenance rule for {item_type}.{kind}")
+
+
+def rules_for(model, rules=None):
+    return [rule for rule in (rules if rules is not None else current_rules()) if rule.model is model]
+
+
+def rule_for_label(model, label, rules=None):
+    """Find the rule whose maintenance type label matches a form value"""
+    for rule in rules_for(model, rules):
+        if rule.label == label:
+            return rule
+    return None
+
+
+def apply_due_dates(record):
+    """Materialize every rule's due date on a record, plus its overall next_due"""
+    due_dates = []
+    for rule in rules_for(type(record)):
+        due_date = rule.next_due_for(record)
+        setattr(record, rule.due_column, due_date)
+        if due_date:
+            due_dates.append(due_date)
+    if hasattr(record, 'next_due'):
+        record.next_due = min(due_dates) if due_dates else None
+
+
+def due_filter(model, as_of):
+    """SQL filter for records of a model with any maintenance due by as_of"""
+    if hasattr(model, 'next_due'):
+        return model.next_due <= as_of
+    return or_(*[rule.due_filter(as_of) for rule in rules_for(model)])
@@ -4,11 +4,23 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import os
+import hashlib
+import json
 import sys
 import logging
 import sqlite3
 import time
-import re
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from functools import partial
+from itertools import repeat
+
+import openpyxl
+
+from maintenance_rules import get_rule
+from search_index import SEARCH_TABLE, create_search_index, rebuild_search_index, search_index_exists
 
 # Setup logging
 logging.basicConfig(level=logging.INFO,
@@ -17,63 +29,1073 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger('migration')
 
 
-# Helper functions for data cleaning
-def clean_string(value):
-    """Clean string values, convert NaN to empty string"""
-    if pd.isna(value):
-        return ''
-    return str(value).strip()
+# Sheets the migration reads and the columns it maps from each
+SHEET_COLUMNS = {
+    'Item_Type': ['ID', 'Item Type'],
+    'Locations': ['ID', 'Location'],
+    'Inventory': ['ID', 'Item Type Lookup', 'Item Manufacturer', 'Item Model', 'Item Seriel Number',
+                  'Intake Date', 'Disposal Date', 'Location', 'PM Required', 'Condition Code', 'Size'],
+    'Tank_Inventory': ['Tank ID', 'Tank Number', 'Manufacturer', 'Hydro Date', 'VIP Date',
+                       'Tank Material', 'Working Pressure', 'Gas Type'],
+}
+
+# Rows per batch read from the workbook and inserted with executemany
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def read_sheet_chunks(workbook, sheet_name, chunk_size=DEFAULT_CHUNK_SIZE, start_row=1):
+    """Yield (sheet row of the last row, DataFrame) for chunks of up to chunk_size rows
+
+    Only the mapped columns are kept, rows up to start_row are skipped and
+    each DataFrame is indexed by sheet row number.
+    The workbook must be opened with openpyxl read_only=True, so rows are
+    streamed from the file and memory use does not depend on its size.
+    """
+    rows = workbook[sheet_name].iter_rows(values_only=True)
+    header = next(rows, None) or ()
+    positions = {}
+    for position, name in enumerate(header):
+        if name in SHEET_COLUMNS[sheet_name]:
+            positions.setdefault(name, position)
+    columns = list(positions)
+
+    chunk = []
+    row_numbers = []
+    row_number = 1
+    for row_number, row in enumerate(rows, start=2):
+        if row_number <= start_row:
+            continue
+        values = [row[position] if position < len(row) else None for position in positions.values()]
+        # Skip blank rows
+        if all(value is None for value in values):
+            continue
+        chunk.append(values)
+        row_numbers.append(row_number)
+        if len(chunk) >= chunk_size:
+            yield row_number, pd.DataFrame(chunk, columns=columns, index=row_numbers)
+            chunk = []
+            row_numbers = []
+    if chunk:
+        yield row_number, pd.DataFrame(chunk, columns=columns, index=row_numbers)
+
+
+# Column-wise cleaning helpers. Each takes a pandas Series and returns a Series
+# with the same index; values that cannot be converted are logged one by one.
+TRUE_STRINGS = ('yes', 'true', 't', '1', 'y')
+
+# Storage format SQLAlchemy uses for SQLite DateTime columns
+SQL_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def sheet_column(df, name, default=None):
+    """Return a sheet column, or a column of `default` if the sheet lacks it"""
+    if name in df:
+        return df[name]
+    return pd.Series(default, index=df.index, dtype=object)
+
+
+def clean_string_column(series):
+    """Convert NaN to empty string and strip whitespace"""
+    return series.astype(object).where(series.notna(), '').astype(str).str.strip()
+
+
+def clean_int_column(series, default=0):
+    """Convert to integers (truncating floats); blanks and bad values become default"""
+    numbers = pd.to_numeric(series, errors='coerce')
+    numbers = numbers.where(np.isfinite(numbers))
+    for value in series[series.notna() & numbers.isna()]:
+        logger.warning(f"Could not convert value '{value}' to integer, using default {default}")
+    integers = np.trunc(numbers).astype('Int64')
+    if default is not None:
+        integers = integers.fillna(default)
+    return integers
+
+
+def clean_bool_column(series, default=False):
+    """Convert yes/no strings, booleans and numbers to booleans"""
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype(bool)
+    result = pd.Series(default, index=series.index, dtype=bool)
+    text = series.astype(object).where(series.map(type).eq(str)).str.lower()
+    is_text = text.notna()
+    result[is_text] = text[is_text].isin(TRUE_STRINGS)
+    numbers = pd.to_numeric(series.where(~is_text), errors='coerce')
+    is_number = numbers.notna()
+    result[is_number] = numbers[is_number].ne(0)
+    return result
+
+
+def clean_date_column(series):
+    """Convert to datetimes; unparseable values are logged and become NaT"""
+    dates = pd.to_datetime(series, errors='coerce', format='mixed')
+    for value in series[series.notna() & dates.isna()]:
+        logger.warning(f"Error converting date value: {value}")
+    return dates
+
+
+def sql_values(series):
+    """Convert a column to a list of Python values for sqlite3, with None for blanks"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime(SQL_DATETIME_FORMAT).astype(object).where(series.notna(), None).tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def rule_due_dates(rule, anchors):
+    """Vectorized MaintenanceRule.next_due; DateOffset clamps to month end like add_months"""
+    return anchors + pd.DateOffset(months=rule.months)
+
+
+def dedupe_serials(serials, used_serials):
+    """Make serial numbers unique by appending -1, -2, ... to repeats
+
+    Serials that occur once and are not in used_serials are kept as they are;
+    only repeated serials are numbered one row at a time, so the result does
+    not depend on how the rows were split into chunks. The result is added
+    to used_serials.
+    """
+    repeated = serials.duplicated(keep=False) | serials.isin(used_serials)
+    used_serials.update(serials[~repeated])
+
+    # Suffixes below next_suffix[original] are known to be taken, so each serial is scanned once
+    next_suffix = {}
+    resolved = []
+    for original in serials[repeated]:
+        candidate = original
+        counter = next_suffix.get(original, 1)
+        if original in used_serials:
+            candidate = f"{original}-{counter}"
+        while candidate in used_serials:
+            counter += 1
+            candidate = f"{original}-{counter}"
+        next_suffix[original] = counter
+        resolved.append(candidate)
+        used_serials.add(candidate)
+    unique = serials.copy()
+    unique.loc[repeated] = resolved
+    return unique
+
+
+def insert_rows(cursor, table, columns, rows, label, conflict=''):
+    """Insert rows with one executemany, logging and skipping rows that fail
+
+    conflict is an optional ON CONFLICT clause appended to the INSERT. If the
+    batch fails it is rolled back to a savepoint and replayed row by row so
+    each bad row is logged individually. Returns the positions of the rows
+    that were not inserted.
+    """
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}){conflict}"
+    cursor.execute("SAVEPOINT insert_rows")
+    try:
+        cursor.executemany(sql, rows)
+        cursor.execute("RELEASE insert_rows")
+        return set()
+    except sqlite3.Error:
+        cursor.execute("ROLLBACK TO insert_rows")
+        cursor.execute("RELEASE insert_rows")
+
+    failed = set()
+    for position, row in enumerate(rows):
+        try:
+            cursor.execute(sql, row)
+        except sqlite3.Error as e:
+            logger.error(f"Error processing {label} {row[0]}: {e}")
+            failed.add(position)
+    return failed
+
+
+def frame_rows(frame, columns):
+    """Rows of a cleaned DataFrame as tuples ready for executemany"""
+    return list(zip(*(sql_values(frame[column]) for column in columns)))
+
+
+# Sheet cleaning: one DataFrame in, one cleaned DataFrame with table column names out
 
+def clean_lookup_sheet(df, name_column):
+    """Clean an ID/name lookup sheet (Item_Type, Locations)"""
+    return pd.DataFrame({
+        'id': clean_int_column(sheet_column(df, 'ID')),
+        'name': clean_string_column(sheet_column(df, name_column)),
+        'description': ''
+    })
+
+
+def clean_inventory_sheet(df):
+    """Clean the Inventory sheet, dropping rows without an ID or item type"""
+    df = df[sheet_column(df, 'ID').notna()]
+    items = pd.DataFrame({
+        'id': clean_int_column(df['ID']),
+        'item_type_id': clean_int_column(sheet_column(df, 'Item Type Lookup'), default=None),
+        'manufacturer': clean_string_column(sheet_column(df, 'Item Manufacturer', '')),
+        'model': clean_string_column(sheet_column(df, 'Item Model', '')),
+        'serial_number': clean_string_column(sheet_column(df, 'Item Seriel Number', '')),
+        'intake_date': clean_date_column(sheet_column(df, 'Intake Date')),
+        'disposal_date': clean_date_column(sheet_column(df, 'Disposal Date')),
+        'location_id': clean_int_column(sheet_column(df, 'Location'), default=1),
+        'pm_required': clean_bool_column(sheet_column(df, 'PM Required')).astype(int),
+        'condition_code': clean_int_column(sheet_column(df, 'Condition Code', 1)),
+        'size': clean_string_column(sheet_column(df, 'Size', ''))
+    })
+
+    # Skip if no item type
+    missing_type = items['item_type_id'].fillna(0).eq(0)
+    for item_id in items.loc[missing_type, 'id']:
+        logger.warning(f"Skipping inventory item {item_id}: Missing type_id")
+    return items[~missing_type]
+
+
+def clean_tank_sheet(df):
+    """Clean the Tank_Inventory sheet, dropping rows with neither tank ID nor number"""
+    tanks = pd.DataFrame({
+        'tank_id': clean_string_column(sheet_column(df, 'Tank ID', '')),
+        'tank_number': clean_string_column(sheet_column(df, 'Tank Number', '')),
+        'manufacturer': clean_string_column(sheet_column(df, 'Manufacturer', '')),
+        'hydro_date': clean_date_column(sheet_column(df, 'Hydro Date')),
+        'vip_date': clean_date_column(sheet_column(df, 'VIP Date')),
+        'tank_material': clean_string_column(sheet_column(df, 'Tank Material', '')),
+        'working_pressure': clean_int_column(sheet_column(df, 'Working Pressure', 3000)),
+        'gas_type': clean_string_column(sheet_column(df, 'Gas Type', 'Air'))
+    })
+
+    unidentified = tanks['tank_id'].eq('') & tanks['tank_number'].eq('')
+    for _ in range(int(unidentified.sum())):
+        logger.warning("Skipping tank record with no ID or number")
+    return tanks[~unidentified]
+
+
+# Cleaner for each sheet, run by the sequential reader or by worker processes
+SHEET_CLEANERS = {
+    'Item_Type': partial(clean_lookup_sheet, name_column='Item Type'),
+    'Locations': partial(clean_lookup_sheet, name_column='Location'),
+    'Inventory': clean_inventory_sheet,
+    'Tank_Inventory': clean_tank_sheet,
+}
+
+
+# Validation: a dry run that checks whole columns of the raw sheets at once and
+# reports every problem the import would log or silently fix, without a database.
+
+# 1=New, 2=Good, 3=Fair, 4=Poor, 5=Unusable (see InventoryItem.condition_code)
+CONDITION_CODES = range(1, 6)
+
+VALIDATION_COLUMNS = ['sheet', 'row', 'column', 'check', 'value', 'detail']
+
+
+def unparseable_dates(series):
+    """Mask of values that are present but not dates"""
+    return series.notna() & pd.to_datetime(series, errors='coerce', format='mixed').isna()
+
+
+def numeric_values(series):
+    """Numbers in a column, NaN where blank or not a finite number"""
+    numbers = pd.to_numeric(series, errors='coerce')
+    return numbers.where(np.isfinite(numbers))
+
+
+def repeated_values(values, first_rows):
+    """Mask of values that already occurred on an earlier row of the sheet
+
+    first_rows maps each value to the sheet row it first appeared on and is
+    updated with the chunk's new values, so repeats across chunks are found.
+    """
+    repeated = values.map(first_rows).notna() | values.duplicated()
+    first_rows.update(zip(values[~repeated], values.index[~repeated]))
+    return repeated
+
+
+def sheet_issues(sheet_name, df, seen):
+    """Return the problems found in one raw chunk of a sheet as a DataFrame
+
+    seen carries what later chunks and sheets need: the IDs of each lookup
+    sheet and the first row of every ID and serial checked for repeats.
+    """
+    issues = []
+
+    def add(mask, column, check, values, detail=''):
+        if mask.any():
+            issues.append(pd.DataFrame({
+                'sheet': sheet_name, 'row': values.index[mask], 'column': column, 'check': check,
+                'value': values[mask].astype(str), 'detail': detail
+            }))
+
+    def check_numeric(column, check):
+        raw = sheet_column(df, column)
+        numbers = numeric_values(raw)
+        add(raw.notna() & numbers.isna(), column, check, raw)
+        return numbers
+
+    def check_repeats(column, values, key):
+        first_rows = seen.setdefault((sheet_name, key), {})
+        repeated = repeated_values(values, first_rows)
+        add(repeated, column, f"duplicate {key}", sheet_column(df, column).loc[values.index],
+            'first on row ' + values[repeated].map(first_rows).astype(str))
+
+    def check_reference(column, numbers, lookup_sheet, label):
+        if lookup_sheet in seen:
+            dangling = numbers.notna() & ~numbers.isin(seen[lookup_sheet])
+            add(dangling, column, f"unknown {label}", sheet_column(df, column), f"not in {lookup_sheet} sheet")
+
+    def check_dates(*columns):
+        for column in columns:
+            raw = sheet_column(df, column)
+            add(unparseable_dates(raw), column, 'unparseable date', raw)
+
+    if sheet_name in ('Item_Type', 'Locations'):
+        ids = check_numeric('ID', 'non-numeric ID')
+        add(sheet_column(df, 'ID').isna(), 'ID', 'missing ID', sheet_column(df, 'ID'))
+        check_repeats('ID', ids[ids.notna()], 'ID')
+        seen.setdefault(sheet_name, set()).update(ids.dropna())
+
+    elif sheet_name == 'Inventory':
+        ids = check_numeric('ID', 'non-numeric ID')
+        add(sheet_column(df, 'ID').isna(), 'ID', 'missing ID', sheet_column(df, 'ID'), 'row is skipped')
+        check_repeats('ID', ids[ids.notna()], 'ID')
+
+        item_types = check_numeric('Item Type Lookup', 'non-numeric item type')
+        raw_types = sheet_column(df, 'Item Type Lookup')
+        add(raw_types.isna() | item_types.eq(0), 'Item Type Lookup', 'missing item type', raw_types, 'row is skipped')
+        check_reference('Item Type Lookup', item_types.where(item_types.ne(0)), 'Item_Type', 'item type')
+
+        locations = check_numeric('Location', 'non-numeric location')
+        check_reference('Location', locations, 'Locations', 'location')
+
+        conditions = check_numeric('Condition Code', 'non-numeric condition code')
+        add(conditions.notna() & ~np.trunc(conditions).isin(CONDITION_CODES), 'Condition Code',
+            'condition code out of range', sheet_column(df, 'Condition Code'),
+            f"expected {CONDITION_CODES.start}-{CONDITION_CODES.stop - 1}")
+
+        check_dates('Intake Date', 'Disposal Date')
+        serials = clean_string_column(sheet_column(df, 'Item Seriel Number', ''))
+        check_repeats('Item Seriel Number', serials[serials.ne('')], 'serial number')
+
+    elif sheet_name == 'Tank_Inventory':
+        check_dates('Hydro Date', 'VIP Date')
+        check_numeric('Working Pressure', 'non-numeric working pressure')
+        tank_ids = clean_string_column(sheet_column(df, 'Tank ID', ''))
+        tank_numbers = clean_string_column(sheet_column(df, 'Tank Number', ''))
+        add(tank_ids.eq('') & tank_numbers.eq(''), 'Tank ID', 'missing tank ID and number', tank_ids,
+            'row is skipped')
+        check_repeats('Tank ID', tank_ids[tank_ids.ne('')], 'tank ID')
+
+    if not issues:
+        return pd.DataFrame(columns=VALIDATION_COLUMNS)
+    return pd.concat(issues, ignore_index=True)
+
+
+def validate_workbook(excel_file, report_file=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Check a workbook without importing it
+
+    Writes one line per problem to report_file (default: the workbook name
+    with a _validation.csv suffix), logs and prints a summary per sheet and
+    check, and returns the number of problems found, or None if the
+    workbook cannot be read.
+    """
+    if report_file is None:
+        report_file = os.path.splitext(excel_file)[0] + '_validation.csv'
+    logger.info(f"Validating {excel_file}")
+    started = time.perf_counter()
 
-def clean_int(value, default=0):
-    """Convert to int with error handling"""
-    if pd.isna(value):
-        return default
     try:
-        return int(value)
-    except (ValueError, TypeError):
-        logger.warning(f"Could not convert value '{value}' to integer, using default {default}")
-        return default
+        workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    except Exception as e:
+        logger.error(f"Failed to read Excel file: {e}")
+        print(f"Error: Failed to read Excel file: {e}")
+        return None
+
+    seen = {}
+    rows_read = {}
+    counts = defaultdict(int)
+    try:
+        with open(report_file, 'w', newline='') as report:
+            pd.DataFrame(columns=VALIDATION_COLUMNS).to_csv(report, index=False)
+            # Lookup sheets come first in SHEET_COLUMNS, so references can be checked
+            for sheet_name in SHEET_COLUMNS:
+                if sheet_name not in workbook.sheetnames:
+                    counts[(sheet_name, 'missing sheet')] += 1
+                    continue
+                rows_read[sheet_name] = 0
+                for _, chunk in read_sheet_chunks(workbook, sheet_name, chunk_size):
+                    rows_read[sheet_name] += len(chunk)
+                    issues = sheet_issues(sheet_name, chunk, seen)
+                    issues.to_csv(report, header=False, index=False)
+                    for key, count in issues.groupby(['sheet', 'check']).size().items():
+                        counts[key] += count
+    finally:
+        workbook.close()
+
+    elapsed = time.perf_counter() - started
+    lines = [f"Validated {sum(rows_read.values())} rows in {elapsed:.2f}s: "
+             + ', '.join(f"{name} {count}" for name, count in rows_read.items())]
+    if counts:
+        sheet_order = list(SHEET_COLUMNS)
+        ordered = sorted(counts.items(), key=lambda item: (sheet_order.index(item[0][0]), item[0][1]))
+        lines += [f"- {sheet}: {count} x {check}" for (sheet, check), count in ordered]
+        lines.append(f"Row by row report: {report_file}")
+    else:
+        lines.append("No problems found")
+    summary = '\n'.join(lines)
+    logger.info(summary)
+    print(summary)
+    return sum(counts.values())
+
+
+# Sheet reading: cleaned chunks come from the workbook opened here, or with
+# --workers from one worker process per sheet. openpyxl has to parse every row
+# before a row range, so sheets are read concurrently rather than split; each
+# worker streams its cleaned chunks through a bounded queue to the single
+# writer, which applies them in foreign-key order.
+
+# Cleaned chunks a worker may read ahead of the writer
+QUEUED_CHUNKS = 4
+
+
+@contextmanager
+def timed(timings, stage):
+    """Add the time spent in the block to timings[stage]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] += time.perf_counter() - started
 
 
-def clean_bool(value, default=False):
-    """Convert to boolean with error handling"""
-    if pd.isna(value):
-        return default
-    if isinstance(value, bool):
-        return value
-    if isinstance(value, (int, float)):
-        return value != 0
-    if isinstance(value, str):
-        return value.lower() in ('yes', 'true', 't', '1', 'y')
-    return default
+def clean_sheet_chunks(workbook, sheet_name, chunk_size, timings, start_row=1):
+    """Yield (last sheet row, rows read, cleaned DataFrame) for each chunk of a sheet"""
+    chunks = read_sheet_chunks(workbook, sheet_name, chunk_size, start_row)
+    while True:
+        with timed(timings, 'read'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        last_row, frame = chunk
+        with timed(timings, 'clean'):
+            cleaned = SHEET_CLEANERS[sheet_name](frame)
+        yield last_row, len(frame), cleaned
 
 
-def clean_date(value):
-    """Convert to date with error handling"""
-    if pd.isna(value):
-        return None
+def read_and_clean_sheet(excel_file, sheet_name, chunk_size, chunk_queue, start_row=1):
+    """Worker process: stream one sheet onto chunk_queue, ending with None
+
+    Returns the worker's read and clean timings.
+    """
+    timings = defaultdict(float)
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
     try:
-        return pd.to_datetime(value)
-    except:
-        logger.warning(f"Error converting date value: {value}")
-        return None
+        for chunk in clean_sheet_chunks(workbook, sheet_name, chunk_size, timings, start_row):
+            chunk_queue.put(chunk)
+    finally:
+        workbook.close()
+        chunk_queue.put(None)
+    return dict(timings)
 
 
-def extract_tank_number(value):
-    """Extract the numeric part of a tank ID if present"""
-    if not value:
+def queued_chunks(chunk_queue, future, timings):
+    """Yield the chunks a worker puts on chunk_queue, then collect its timings
+
+    Re-raises any exception from the worker once its chunks are consumed.
+    """
+    while True:
+        with timed(timings, 'wait'):
+            chunk = chunk_queue.get()
+        if chunk is None:
+            break
+        yield chunk
+    for stage, seconds in future.result().items():
+        timings[stage] += seconds
+
+
+# Sheet loading: upsert one cleaned DataFrame with executemany.
+#
+# Every imported inventory item and tank is recorded in import_fingerprints
+# under its key (serial number or tank ID, qualified with the workbook ID or
+# tank number when blank or repeated) with a hash of its cleaned values. Rows
+# whose hash matches the last import are skipped, so re-importing an unchanged
+# workbook writes almost nothing.
+# A full import is the same load against freshly created tables.
+
+IMPORT_TABLE = 'import_fingerprints'
+
+INVENTORY_COLUMNS = ['id', 'item_type_id', 'manufacturer', 'model', 'serial_number',
+                     'intake_date', 'disposal_date', 'location_id', 'pm_required', 'condition_code']
+TANK_COLUMNS = ['inventory_item_id', 'tank_number', 'hydro_date', 'vip_date', 'tank_material',
+                'working_pressure', 'gas_type', 'next_hydro_due', 'next_vip_due', 'next_due']
+
+# Tank inspection dates and the due dates they drive. The app moves these
+# forward when an inspection is recorded, so a re-import only takes the
+# sheet's date when it is newer than the stored one.
+TANK_ANCHOR_DUE_COLUMNS = {'hydro_date': 'next_hydro_due', 'vip_date': 'next_vip_due'}
+
+# Source columns hashed to detect changed rows
+INVENTORY_FINGERPRINT_COLUMNS = INVENTORY_COLUMNS + ['size']
+TANK_FINGERPRINT_COLUMNS = ['manufacturer', 'tank_number', 'hydro_date', 'vip_date',
+                            'tank_material', 'working_pressure', 'gas_type']
+
+# Items with history are never deleted by a re-import
+ITEMS_WITH_HISTORY_SQL = '''
+    SELECT inventory_item_id FROM checkout_records
+    UNION SELECT inventory_item_id FROM inventory_maintenance_records
+    UNION SELECT b.inventory_item_id FROM bcds b JOIN maintenance_records m ON m.bcd_id = b.id
+    UNION SELECT t.inventory_item_id FROM tanks t JOIN tank_maintenance_records m ON m.tank_id = t.id
+'''
+
+
+def upsert_clause(target, update_columns=(), where=None):
+    """ON CONFLICT clause that updates only columns whose value changed"""
+    target = f"{target}) WHERE ({where}" if where else target
+    if not update_columns:
+        return f" ON CONFLICT({target}) DO NOTHING"
+    assignments = ', '.join(f"{column} = excluded.{column}" for column in update_columns)
+    changed = ' OR '.join(f"{column} IS NOT excluded.{column}" for column in update_columns)
+    return f" ON CONFLICT({target}) DO UPDATE SET {assignments} WHERE {changed}"
+
+
+def tank_upsert_clause():
+    """ON CONFLICT clause for tanks that never moves an inspection date backwards
+
+    Other columns are overwritten as upsert_clause() would. Each anchor date
+    and its due date keep their stored values unless the sheet's date is
+    later or nothing is stored, and next_due is the earlier of the results.
+    """
+    derived = set(TANK_ANCHOR_DUE_COLUMNS) | set(TANK_ANCHOR_DUE_COLUMNS.values()) | {'next_due'}
+    plain = [column for column in TANK_COLUMNS[1:] if column not in derived]
+    assignments = [f"{column} = excluded.{column}" for column in plain]
+    changed = [f"{column} IS NOT excluded.{column}" for column in plain]
+    due_dates = []
+    for anchor, due_column in TANK_ANCHOR_DUE_COLUMNS.items():
+        newer = (f"(excluded.{anchor} > tanks.{anchor} "
+                 f"OR (tanks.{anchor} IS NULL AND excluded.{anchor} IS NOT NULL))")
+        due_date = f"CASE WHEN {newer} THEN excluded.{due_column} ELSE tanks.{due_column} END"
+        assignments += [f"{anchor} = CASE WHEN {newer} THEN excluded.{anchor} ELSE tanks.{anchor} END",
+                        f"{due_column} = {due_date}"]
+        changed.append(newer)
+        due_dates.append(due_date)
+    # SQLite's multi-argument min() is NULL if any argument is
+    hydro_due, vip_due = due_dates
+    assignments.append(f"next_due = min(coalesce({hydro_due}, {vip_due}), coalesce({vip_due}, {hydro_due}))")
+    return f" ON CONFLICT(inventory_item_id) DO UPDATE SET {', '.join(assignments)} WHERE {' OR '.join(changed)}"
+
+
+def fingerprint_rows(frame, columns):
+    """64-bit hash of each row's cleaned values in their stored form"""
+    values = pd.DataFrame({column: sql_values(frame[column]) for column in columns}, index=frame.index, dtype=object)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy().view('int64').tolist()
+
+
+def load_import_state(cursor):
+    """Read the fingerprints recorded by previous imports"""
+    cursor.execute(f"SELECT source, key, inventory_item_id, fingerprint FROM {IMPORT_TABLE}")
+    recorded = {'inventory': {}, 'tank': {}}
+    for source, key, item_id, fingerprint in cursor.fetchall():
+        recorded.setdefault(source, {})[key] = (item_id, fingerprint)
+
+    # Unrecorded items by serial ('#<ID>' when blank), so rows imported before
+    # fingerprints existed are matched
+    cursor.execute("SELECT id, serial_number, item_type_id FROM inventory_items")
+    serials = {}
+    legacy = {'inventory': {}, 'tank': {}}
+    recorded_ids = {item_id for records in recorded.values() for item_id, _ in records.values()}
+    for item_id, serial, item_type_id in cursor.fetchall():
+        serials[item_id] = serial
+        if item_id in recorded_ids:
+            continue
+        if item_type_id == 7:
+            legacy['tank'][serial] = item_id
+        else:
+            legacy['inventory'][serial or f"#{item_id}"] = item_id
+    return {
+        'recorded': recorded,
+        'serials': serials,
+        'legacy': legacy,
+        'legacy_serials': set(),
+        'seen': {source: set() for source in recorded},
+        'journal_keys': [],
+        'deferred': [],
+        'next_item_id': None,
+        'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0
+    }
+
+
+def row_keys(serials, fallback, source, state, owner_ids=None):
+    """Key rows by serial; blank or repeated serials are qualified as 'serial#fallback'
+
+    The first row with a serial takes the plain key unless another item owns
+    it; owner_ids, when given, is the item ID each row would get. A row that
+    was imported under a qualified key keeps it, so keys stay stable when a
+    duplicate is added or removed.
+    """
+    recorded = state['recorded'][source]
+    legacy = state['legacy'][source]
+    seen = state['seen'][source]
+    owners = owner_ids.tolist() if owner_ids is not None else [None] * len(serials)
+    keys = []
+    claimed = set()
+    for serial, other, owner_id in zip(serials.tolist(), fallback.astype(str).tolist(), owners):
+        qualified = f"{serial}#{other}"
+        owned = serial in recorded or serial in legacy
+        claimed_by = recorded[serial][0] if serial in recorded else legacy.get(serial)
+        plain = (serial and serial not in seen and serial not in claimed
+                 and (owner_id is None or claimed_by in (None, owner_id))
+                 and (owned or qualified not in recorded))
+        keys.append(serial if plain else qualified)
+        if plain:
+            claimed.add(serial)
+
+    # Rows repeating a key exactly are numbered like repeated serials
+    keys = dedupe_serials(pd.Series(keys, index=serials.index), seen)
+    journal_keys(state, source, keys)
+    return keys
+
+
+def split_changes(frame, source, keys, legacy_keys, columns, state):
+    """Return the rows of a chunk that are new or changed since the last import
+
+    legacy_keys are the serials a drop-and-recreate import would have given
+    the rows. Adds key, fingerprint, item_id (None for new rows) and is_new
+    columns.
+    """
+    frame = frame.assign(key=keys, fingerprint=fingerprint_rows(frame, columns))
+    recorded = state['recorded'][source]
+    previous = [recorded.get(key) for key in frame['key']]
+    legacy = state['legacy'][source]
+    item_ids = [record[0] if record and record[0] in state['serials'] else legacy.pop(legacy_key, None)
+                for record, legacy_key in zip(previous, legacy_keys.tolist())]
+    changed = [item_id is None or record is None or record[1] != fingerprint
+               for item_id, record, fingerprint in zip(item_ids, previous, frame['fingerprint'])]
+    frame = frame.assign(item_id=pd.Series(item_ids, index=frame.index, dtype=object),
+                         is_new=[item_id is None for item_id in item_ids])
+    frame = frame[changed]
+    state['unchanged'] += len(previous) - len(frame)
+    return frame
+
+
+def upsert_items(cursor, items, columns, update_columns, label):
+    """Upsert inventory items keyed on serial number, or on ID when the serial is blank
+
+    Returns the items that were written.
+    """
+    written = []
+    for has_serial, rows in items.groupby(items['serial_number'].ne(''), sort=False):
+        if has_serial:
+            conflict = upsert_clause('serial_number', update_columns, where="serial_number != ''")
+        else:
+            conflict = upsert_clause('id', update_columns)
+        failed = insert_rows(cursor, 'inventory_items', columns, frame_rows(rows, columns), label, conflict)
+        written.append(rows.drop(rows.index[sorted(failed)]) if failed else rows)
+    return pd.concat(written) if written else items
+
+
+def record_fingerprints(cursor, source, rows, state):
+    """Remember what was imported for each written row"""
+    records = list(zip([source] * len(rows), rows['key'].tolist(), rows['id'].tolist(), rows['fingerprint'].tolist()))
+    insert_rows(cursor, IMPORT_TABLE, ['source', 'key', 'inventory_item_id', 'fingerprint'], records, source,
+                upsert_clause('source, key', ['inventory_item_id', 'fingerprint']))
+    new_rows = int(rows['is_new'].sum())
+    state['inserted'] += new_rows
+    state['updated'] += len(rows) - new_rows
+
+
+def assign_serials(rows, column, used_serials, state):
+    """Existing items keep their stored serial; new rows get a deduplicated one"""
+    stored = rows.loc[~rows['is_new'], 'item_id'].map(state['serials'])
+    created = dedupe_serials(rows.loc[rows['is_new'], column], used_serials)
+    journal_keys(state, 'serial', created)
+    return pd.concat([stored, created]).reindex(rows.index)
+
+
+def allocate_item_ids(cursor, state, count):
+    """Reserve inventory item IDs after the highest ID in the table"""
+    if state['next_item_id'] is None:
+        cursor.execute("SELECT MAX(id) FROM inventory_items")
+        state['next_item_id'] = (cursor.fetchone()[0] or 0) + 1
+    ids = list(range(state['next_item_id'], state['next_item_id'] + count))
+    state['next_item_id'] += count
+    return ids
+
+
+def insert_inventory(cursor, items, used_serials, state):
+    """Upsert new or changed inventory items from one cleaned chunk"""
+    keys = row_keys(items['serial_number'], items['id'], 'inventory', state, owner_ids=items['id'])
+    legacy_keys = '#' + items['id'].astype(str)
+    has_serial = items['serial_number'].ne('')
+    legacy_keys[has_serial] = dedupe_serials(items.loc[has_serial, 'serial_number'], state['legacy_serials'])
+    journal_keys(state, 'legacy', legacy_keys[has_serial])
+    items = split_changes(items, 'inventory', keys, legacy_keys, INVENTORY_FINGERPRINT_COLUMNS, state)
+    has_serial = items['serial_number'].ne('')
+    items.loc[has_serial, 'serial_number'] = assign_serials(items[has_serial], 'serial_number',
+                                                            used_serials, state)
+
+    # Existing items keep their ID; new ones take the workbook ID unless another item already has it
+    items['id'] = items['item_id'].where(items['item_id'].notna(), items['id'].astype(object))
+    taken = items['is_new'] & items['id'].isin(state['serials'])
+    if taken.any():
+        state['deferred'].append(items[taken])
+        items = items[~taken]
+    return write_inventory(cursor, items, state)
+
+
+def insert_deferred_inventory(cursor, state):
+    """Insert new items whose workbook ID was taken, numbered after the highest ID"""
+    if not state['deferred']:
+        return {'items': 0, 'bcds': 0, 'regulators': 0, 'masks': 0}
+    items = pd.concat(state['deferred'])
+    state['deferred'] = []
+    new_ids = allocate_item_ids(cursor, state, len(items))
+    for item_id, new_id in zip(items['id'], new_ids):
+        logger.warning(f"Inventory item ID {item_id} is already in use; importing it as {new_id}")
+    items['id'] = new_ids
+    return write_inventory(cursor, items, state)
+
+
+def write_inventory(cursor, items, state):
+    """Upsert inventory items, adding BCD, regulator and mask rows for new ones"""
+    items = upsert_items(cursor, items, INVENTORY_COLUMNS, INVENTORY_COLUMNS[1:4] + INVENTORY_COLUMNS[5:],
+                         'inventory item')
+    record_fingerprints(cursor, 'inventory', items, state)
+
+    # Equipment rows are only created for new items; afterwards the app maintains them
+    new_items = items[items['is_new']]
+
+    # For BCDs (type ID 1)
+    bcds = new_items[new_items['item_type_id'] == 1]
+    next_maintenance = rule_due_dates(get_rule('BCD', 'service'), bcds['intake_date'])
+    bcd_rows = pd.DataFrame({'inventory_item_id': bcds['id'], 'last_maintenance': bcds['intake_date'],
+                             'next_maintenance': next_maintenance, 'next_due': next_maintenance})
+    insert_rows(cursor, 'bcds', list(bcd_rows.columns), frame_rows(bcd_rows, bcd_rows.columns), 'BCD',
+                upsert_clause('inventory_item_id'))
+
+    # For Regulators (type ID 2)
+    regulators = new_items[new_items['item_type_id'] == 2]
+    next_service = rule_due_dates(get_rule('Regulator', 'service'), regulators['intake_date'])
+    regulator_rows = pd.DataFrame({'inventory_item_id': regulators['id'], 'has_computer': 0,
+                                   'last_service_date': regulators['intake_date'],
+                                   'next_service_due': next_service, 'next_due': next_service})
+    insert_rows(cursor, 'regulators', list(regulator_rows.columns),
+                frame_rows(regulator_rows, regulator_rows.columns), 'regulator', upsert_clause('inventory_item_id'))
+
+    # For Masks (type ID 4)
+    masks = new_items[new_items['item_type_id'] == 4]
+    mask_rows = pd.DataFrame({'inventory_item_id': masks['id'], 'has_comms': 0, 'size': masks['size']})
+    insert_rows(cursor, 'masks', list(mask_rows.columns), frame_rows(mask_rows, mask_rows.columns), 'mask',
+                upsert_clause('inventory_item_id'))
+
+    return {'items': len(items), 'bcds': len(bcds), 'regulators': len(regulators), 'masks': len(masks)}
+
+
+def insert_tanks(cursor, tanks, used_serials, state, intake_date):
+    """Upsert new or changed tanks; new tanks get an inventory item numbered after the highest ID"""
+    keys = row_keys(tanks['tank_id'], tanks['tank_number'], 'tank', state)
+    legacy_keys = dedupe_serials(tanks['tank_id'], state['legacy_serials'])
+    journal_keys(state, 'legacy', legacy_keys)
+    tanks = split_changes(tanks, 'tank', keys, legacy_keys, TANK_FINGERPRINT_COLUMNS, state)
+    tanks['serial_number'] = assign_serials(tanks, 'tank_id', used_serials, state)
+
+    new_tanks = tanks['item_id'].isna()
+    tanks['id'] = tanks['item_id']
+    tanks.loc[new_tanks, 'id'] = allocate_item_ids(cursor, state, int(new_tanks.sum()))
+
+    # Create inventory item with the original tank ID as the serial number
+    items = pd.DataFrame({
+        'id': tanks['id'],
+        'item_type_id': 7,  # Tank type ID
+        'manufacturer': tanks['manufacturer'],
+        'model': tanks['tank_number'],
+        'serial_number': tanks['serial_number'],
+        'intake_date': intake_date,
+        'location_id': 1,  # Default location
+        'pm_required': 1,  # PM required
+        'condition_code': 2  # Default condition
+    })
+    items = upsert_items(cursor, items, list(items.columns), ['manufacturer', 'model'], 'tank')
+    tanks = tanks.loc[items.index]
+
+    # Materialized due dates from the maintenance rules
+    tanks['inventory_item_id'] = tanks['id']
+    tanks['next_hydro_due'] = rule_due_dates(get_rule('Tank', 'hydro'), tanks['hydro_date'])
+    tanks['next_vip_due'] = rule_due_dates(get_rule('Tank', 'vip'), tanks['vip_date'])
+    tanks['next_due'] = tanks[['next_hydro_due', 'next_vip_due']].min(axis=1)
+
+    failed = insert_rows(cursor, 'tanks', TANK_COLUMNS, frame_rows(tanks, TANK_COLUMNS), 'tank',
+                         tank_upsert_clause())
+    if failed:
+        tanks = tanks.drop(tanks.index[sorted(failed)])
+    record_fingerprints(cursor, 'tank', tanks, state)
+    return {'tanks': len(tanks)}
+
+
+def delete_missing_rows(cursor, state, sources):
+    """Delete imported items whose rows left the workbook, keeping items with history"""
+    cursor.execute(ITEMS_WITH_HISTORY_SQL)
+    with_history = {row[0] for row in cursor.fetchall()}
+
+    for source in sources:
+        missing = [(key, item_id) for key, (item_id, _) in state['recorded'][source].items()
+                   if key not in state['seen'][source]]
+        removable = [(key, item_id) for key, item_id in missing if item_id not in with_history]
+        for key, item_id in missing:
+            if item_id in with_history:
+                logger.warning(f"Keeping {source} {key} (item {item_id}): no longer in workbook but has history")
+
+        item_ids = [(item_id,) for _, item_id in removable]
+        for table in ('bcds', 'regulators', 'masks', 'tanks'):
+            cursor.executemany(f"DELETE FROM {table} WHERE inventory_item_id = ?", item_ids)
+        cursor.executemany("DELETE FROM inventory_items WHERE id = ?", item_ids)
+        cursor.executemany(f"DELETE FROM {IMPORT_TABLE} WHERE source = ? AND key = ?",
+                           [(source, key) for key, _ in removable])
+        state['deleted'] += len(removable)
+
+
+# Shadow database: the import is built in a copy next to the live file, checked,
+# then moved over it with os.replace so readers only ever see a complete database.
+# A live database in WAL mode is overwritten through the backup API instead.
+
+def remove_database_files(path):
+    """Delete a SQLite database file and its journal files"""
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def validate_import(cursor, items_before, state):
+    """Check the built database before it replaces the live one"""
+    cursor.execute("PRAGMA integrity_check")
+    problems = [row[0] for row in cursor.fetchall() if row[0] != 'ok']
+    if problems:
+        raise RuntimeError(f"Integrity check failed: {'; '.join(problems[:5])}")
+
+    cursor.execute("SELECT COUNT(*) FROM inventory_items")
+    items_after = cursor.fetchone()[0]
+    expected = items_before + state['inserted'] - state['deleted']
+    if items_after != expected:
+        raise RuntimeError(f"Row count mismatch: {items_after} inventory items, expected {expected}")
+
+    cursor.execute(f'''SELECT COUNT(*) FROM {IMPORT_TABLE} f
+        LEFT JOIN inventory_items i ON i.id = f.inventory_item_id
+        LEFT JOIN tanks t ON t.inventory_item_id = f.inventory_item_id
+        WHERE i.id IS NULL OR (f.source = 'tank' AND t.id IS NULL)''')
+    orphans = cursor.fetchone()[0]
+    if orphans:
+        raise RuntimeError(f"{orphans} imported rows are missing from the built database")
+
+
+def swap_in_database(shadow_file, db_file, live, data_version=None):
+    """Replace the live database with the shadow, keeping the old file as a backup
+
+    Holding a write lock on the live database while the file is replaced
+    waits out any write in progress; readers carry on. If data_version is
+    given and another connection has committed since it was read, the swap
+    is abandoned so those writes are not lost.
+    """
+    if live is None:
+        os.replace(shadow_file, db_file)
         return None
 
-    # Try to extract a number from the string
-    match = re.search(r'(\d+)', str(value))
-    if match:
-        return match.group(1)
-    return value
+    live.execute("BEGIN IMMEDIATE")
+    try:
+        if data_version is not None and live.execute("PRAGMA data_version").fetchone()[0] != data_version:
+            raise RuntimeError("The database was modified during the import; run it again")
+
+        # The replaced file becomes the backup without copying it
+        backup_file = f"{db_file}.backup.{int(time.time())}"
+        try:
+            os.link(db_file, backup_file)
+        except OSError as e:
+            logger.warning(f"Could not create database backup: {e}")
+            backup_file = None
+        os.replace(shadow_file, db_file)
+        return backup_file
+    finally:
+        live.execute("ROLLBACK")
+
+
+def copy_into_database(shadow_file, db_file, live, data_version=None):
+    """Overwrite a live WAL database with the shadow, copying the old contents to a backup
 
+    Connections to a WAL database share its -wal and -shm files by name, so
+    replacing the main file under them could corrupt it. The backup API
+    writes the shadow through SQLite instead: it holds the write lock from
+    the first page, so writers wait on busy_timeout, and commits in one
+    transaction that readers pick up on their next query. If data_version
+    is given and another connection has committed since it was read, the
+    copy is rolled back so those writes are not lost.
+    """
+    backup_file = f"{db_file}.backup.{int(time.time())}"
+    try:
+        with closing(sqlite3.connect(backup_file)) as backup:
+            live.backup(backup)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not create database backup: {e}")
+        remove_database_files(backup_file)
+        backup_file = None
+
+    checked = []
+
+    def check_unchanged(status, remaining, total):
+        # Called after the first page, with the write lock held and nothing committed yet
+        if checked:
+            return
+        checked.append(True)
+        if data_version is not None and live.execute("PRAGMA data_version").fetchone()[0] != data_version:
+            raise RuntimeError("The database was modified during the import; run it again")
 
-def migrate_data(excel_file, db_file=None):
-    """Migrate data directly to SQLite database"""
+    try:
+        with closing(sqlite3.connect(shadow_file)) as shadow, closing(sqlite3.connect(db_file, timeout=30)) as target:
+            # One page per step so the check runs before the copy can finish
+            shadow.backup(target, pages=1, progress=check_unchanged)
+    except Exception:
+        if backup_file:
+            remove_database_files(backup_file)
+        raise
+    return backup_file
+
+
+# Journal: with a batch size the shadow is committed every batch_size rows, and
+# the journal records how far each sheet got so an interrupted import can resume.
+
+JOURNAL_TABLE = 'migration_journal'
+JOURNAL_KEYS_TABLE = 'migration_journal_keys'
+
+# Journal row holding the run's options and counters
+RUN_ENTRY = ''
+IMPORT_COUNTERS = ('inserted', 'updated', 'unchanged', 'deleted')
+
+
+def workbook_hash(path):
+    """SHA-256 of the workbook file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(partial(f.read, 1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    """Size and modification time, to notice a file changing between runs"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def journal_keys(state, kind, keys):
+    """Queue keys added to the seen, legacy or used serial sets for the next checkpoint"""
+    state['journal_keys'].extend(zip(repeat(kind), keys.tolist()))
+
+
+def create_journal(cursor):
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {JOURNAL_TABLE} (
+        sheet TEXT PRIMARY KEY,
+        last_row INTEGER NOT NULL DEFAULT 1,
+        rows_read INTEGER NOT NULL DEFAULT 0,
+        finished BOOLEAN NOT NULL DEFAULT 0,
+        content_hash TEXT NOT NULL,
+        state TEXT
+    )
+    ''')
+    # Keys and serials the run has used, so later rows are keyed and numbered as before
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {JOURNAL_KEYS_TABLE} (source TEXT NOT NULL, key TEXT NOT NULL)")
+
+
+def load_journal(cursor):
+    """Return the journal of an interrupted import, or None if there is none"""
+    cursor.execute(f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{JOURNAL_TABLE}'")
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute(f"SELECT sheet, last_row, rows_read, finished, content_hash, state FROM {JOURNAL_TABLE}")
+    journal = {'sheets': {}, 'run': None, 'pending_rows': 0, 'committed': True}
+    for sheet, last_row, rows_read, finished, content_hash, run_state in cursor.fetchall():
+        if sheet == RUN_ENTRY:
+            journal['run'] = json.loads(run_state)
+            journal['hash'] = content_hash
+        else:
+            journal['sheets'][sheet] = {'last_row': last_row, 'rows_read': rows_read, 'finished': bool(finished)}
+    return journal if journal['run'] is not None else None
+
+
+def journaled_keys(cursor, kind):
+    cursor.execute(f"SELECT key FROM {JOURNAL_KEYS_TABLE} WHERE source = ?", (kind,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def resume_import_state(cursor, journal):
+    """Rebuild the loader state of an interrupted import from the shadow and its journal"""
+    state = load_import_state(cursor)
+    state['legacy_serials'] = journaled_keys(cursor, 'legacy')
+    for source in state['seen']:
+        state['seen'][source] = journaled_keys(cursor, source)
+    for counter in IMPORT_COUNTERS:
+        state[counter] = journal['run'][counter]
+    return state
+
+
+def write_checkpoint(cursor, journal, state):
+    """Write the journal and commit everything imported so far"""
+    run = dict(journal['run'], **{counter: state[counter] for counter in IMPORT_COUNTERS})
+    entries = [(RUN_ENTRY, 1, 0, False, journal['hash'], json.dumps(run))]
+    entries += [(sheet, entry['last_row'], entry['rows_read'], entry['finished'], journal['hash'], None)
+                for sheet, entry in journal['sheets'].items()]
+    cursor.executemany(f'''INSERT INTO {JOURNAL_TABLE} (sheet, last_row, rows_read, finished, content_hash, state)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(sheet) DO UPDATE SET last_row = excluded.last_row, rows_read = excluded.rows_read,
+            finished = excluded.finished, state = excluded.state''', entries)
+    cursor.executemany(f"INSERT INTO {JOURNAL_KEYS_TABLE} (source, key) VALUES (?, ?)", state['journal_keys'])
+    state['journal_keys'] = []
+    cursor.execute("COMMIT")
+    cursor.execute("BEGIN")
+    journal['pending_rows'] = 0
+    journal['committed'] = True
+
+
+def record_progress(cursor, journal, state, sheet_name, last_row, rows_read, finished=False):
+    """Advance a sheet's journal entry, committing once batch_size rows are pending"""
+    if journal is None:
+        return
+    entry = journal['sheets'].setdefault(sheet_name, {'last_row': 1, 'rows_read': 0, 'finished': False})
+    entry['last_row'] = max(entry['last_row'], last_row)
+    entry['rows_read'] += rows_read
+    entry['finished'] = finished
+    journal['pending_rows'] += rows_read
+    # Deferred items are only held in memory, so no checkpoint is taken while any are waiting
+    if (finished or journal['pending_rows'] >= journal['run']['batch_size']) and not state['deferred']:
+        write_checkpoint(cursor, journal, state)
+        logger.info(f"Checkpoint: {sheet_name} committed through row {entry['last_row']}")
+
+
+def tracked_chunks(chunks, sheet_name, cursor, journal, state):
+    """Yield (rows read, chunk) from a sheet, logging throughput and checkpointing after each chunk"""
+    started = time.perf_counter()
+    first_row = journal['sheets'].get(sheet_name, {'last_row': 1})['last_row'] + 1 if journal else 2
+    for last_row, rows_read, chunk in chunks:
+        yield rows_read, chunk
+        elapsed = time.perf_counter() - started
+        logger.info(f"{sheet_name} rows {first_row}-{last_row}: {rows_read} rows in {elapsed:.2f}s "
+                    f"({rows_read / elapsed if elapsed else 0:.0f} rows/s)")
+        record_progress(cursor, journal, state, sheet_name, last_row, rows_read)
+        first_row = last_row + 1
+        started = time.perf_counter()
+
+
+def migrate_data(excel_file, db_file=None, chunk_size=DEFAULT_CHUNK_SIZE, incremental=False, workers=1,
+                 batch_size=None, resume=False):
+    """Migrate data directly to SQLite database, streaming the workbook in chunks
+
+    By default the tables are dropped and recreated. With incremental=True the
+    existing database is kept: changed rows are upserted, unchanged rows are
+    skipped and rows removed from the workbook are deleted unless they have
+    checkout or maintenance history.
+
+    The import is built in a shadow copy (db_file + '.import') and swapped in
+    atomically once it has passed validation; the live database is never
+    modified in place.
+
+    With workers > 1 the sheets are read and cleaned in that many worker
+    processes (at most one per sheet) while this process writes.
+
+    Without a batch_size everything is loaded in one transaction. With one,
+    the shadow is committed about every batch_size rows along with a journal
+    of how far each sheet got, and is kept if the import fails; resume=True
+    then continues from the last commit, provided the workbook is unchanged.
+
+    Returns True once the import is swapped in and False when it failed or
+    was abandoned, leaving the live database as it was.
+    """
     # Set default db_file if not provided
     if db_file is None:
         # Try to find the instance folder
@@ -85,38 +1107,102 @@ def migrate_data(excel_file, db_file=None):
     logger.info(f"Starting direct migration from {excel_file} to {db_file}")
 
     # Ensure the database directory exists
-    os.makedirs(os.path.dirname(db_file), exist_ok=True)
-
-    # Backup existing database if it exists
-    if os.path.exists(db_file):
-        backup_file = f"{db_file}.backup.{int(time.time())}"
-        try:
-            import shutil
-            shutil.copy2(db_file, backup_file)
-            logger.info(f"Created database backup: {backup_file}")
-        except Exception as e:
-            logger.warning(f"Could not create database backup: {e}")
-
-    # Connect to the SQLite database directly
-    conn = sqlite3.connect(db_file)
+    os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+
+    # Build into a shadow file; an incremental import starts from a snapshot of the live database
+    shadow_file = f"{db_file}.import"
+    if not resume:
+        remove_database_files(shadow_file)
+    elif not os.path.exists(shadow_file):
+        logger.error(f"No interrupted import to resume: {shadow_file} does not exist")
+        print(f"Error: No interrupted import to resume: {shadow_file} does not exist")
+        return False
+    live = sqlite3.connect(db_file, isolation_level=None, timeout=30) if os.path.exists(db_file) else None
+    conn = sqlite3.connect(shadow_file, isolation_level=None)
     cursor = conn.cursor()
+    workbook = None
+    swapped = False
+    pool = None
+    manager = None
+    journal = None
+    timings = defaultdict(float)
 
     try:
-        # Read Excel sheets with error handling
+        data_version = None
+        live_file = file_signature(db_file) if live is not None else None
+        if resume:
+            journal = load_journal(cursor)
+            problem = None
+            if journal is None:
+                problem = f"{shadow_file} has no migration journal to resume from"
+            elif journal['hash'] != workbook_hash(excel_file):
+                problem = f"{excel_file} changed since the interrupted import; run it again without --resume"
+            elif journal['run']['incremental'] and live_file != journal['run']['live_file']:
+                problem = f"{db_file} changed since the interrupted import; run it again without --resume"
+            if problem:
+                logger.error(problem)
+                print(f"Error: {problem}")
+                return False
+            incremental = journal['run']['incremental']
+            if batch_size:
+                journal['run']['batch_size'] = batch_size
+            if incremental and live is not None:
+                data_version = live.execute("PRAGMA data_version").fetchone()[0]
+            logger.info(f"Resuming the import in {shadow_file}")
+        else:
+            if incremental and live is not None:
+                live.backup(conn)
+                data_version = live.execute("PRAGMA data_version").fetchone()[0]
+                logger.info(f"Copied {db_file} to {shadow_file}")
+            if batch_size:
+                journal = {'sheets': {}, 'pending_rows': 0, 'committed': False, 'hash': workbook_hash(excel_file),
+                           'run': {'incremental': incremental, 'batch_size': batch_size, 'items_before': None,
+                                   'intake_date': datetime.now().isoformat(), 'live_file': live_file}}
+
+        # Open the workbook for streaming with error handling
         try:
-            excel_data = pd.read_excel(excel_file, sheet_name=None)
-            logger.info(f"Successfully read Excel file. Found sheets: {list(excel_data.keys())}")
+            workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+            logger.info(f"Successfully opened Excel file. Found sheets: {workbook.sheetnames}")
         except Exception as e:
             logger.error(f"Failed to read Excel file: {e}")
             print(f"Error: Failed to read Excel file: {e}")
-            return
+            return False
+
+        # Cleaned chunks per sheet present in the workbook; a resumed import skips the committed rows
+        sheet_names = [name for name in SHEET_COLUMNS if name in workbook.sheetnames]
+        progress = journal['sheets'] if journal else {}
+        start_rows = {name: entry['last_row'] for name, entry in progress.items() if not entry['finished']}
+        for name, row in start_rows.items():
+            logger.info(f"Resuming {name} sheet after row {row}")
+        unread = [name for name in sheet_names if not progress.get(name, {}).get('finished')]
+        sheet_chunks = {name: iter(()) for name in sheet_names if name not in unread}
+        if workers > 1 and unread:
+            # spawn: workers must not inherit this process's open SQLite connections
+            context = multiprocessing.get_context('spawn')
+            worker_count = min(workers, len(unread))
+            pool = ProcessPoolExecutor(max_workers=worker_count, mp_context=context)
+            manager = context.Manager()
+            for name in unread:
+                chunk_queue = manager.Queue(maxsize=QUEUED_CHUNKS)
+                future = pool.submit(read_and_clean_sheet, excel_file, name, chunk_size, chunk_queue,
+                                     start_rows.get(name, 1))
+                sheet_chunks[name] = queued_chunks(chunk_queue, future, timings)
+            logger.info(f"Reading {len(unread)} sheets in {worker_count} worker processes")
+        else:
+            for name in unread:
+                sheet_chunks[name] = clean_sheet_chunks(workbook, name, chunk_size, timings, start_rows.get(name, 1))
+
+        # Update the schema and load the sheets, in one transaction unless committing in batches
+        schema_started = time.perf_counter()
+        cursor.execute("BEGIN")
 
         # Create tables
         logger.info("Creating database tables")
 
-        # Drop existing tables if they exist
         tables = [
             "checkout_records",
+            "inventory_maintenance_records",
+            "tank_maintenance_records",
             "maintenance_records",
             "tanks",
             "masks",
@@ -127,12 +1213,14 @@ def migrate_data(excel_file, db_file=None):
             "item_types"
         ]
 
-        for table in tables:
-            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        # Drop existing tables unless updating them in place or resuming
+        if not incremental and not resume:
+            for table in tables + [IMPORT_TABLE, SEARCH_TABLE]:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
 
         # Create tables
         cursor.execute('''
-        CREATE TABLE item_types (
+        CREATE TABLE IF NOT EXISTS item_types (
             id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             description TEXT
@@ -140,7 +1228,7 @@ def migrate_data(excel_file, db_file=None):
         ''')
 
         cursor.execute('''
-        CREATE TABLE locations (
+        CREATE TABLE IF NOT EXISTS locations (
             id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             description TEXT
@@ -148,7 +1236,7 @@ def migrate_data(excel_file, db_file=None):
         ''')
 
         cursor.execute('''
-        CREATE TABLE inventory_items (
+        CREATE TABLE IF NOT EXISTS inventory_items (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             item_type_id INTEGER NOT NULL,
             manufacturer TEXT,
@@ -168,27 +1256,32 @@ def migrate_data(excel_file, db_file=None):
         ''')
 
         cursor.execute('''
-        CREATE TABLE bcds (
+        CREATE TABLE IF NOT EXISTS bcds (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             inventory_item_id INTEGER UNIQUE,
             last_maintenance TIMESTAMP,
             next_maintenance TIMESTAMP,
+            next_due TIMESTAMP,
+            maintenance_count INTEGER NOT NULL DEFAULT 0,
+            last_record_id INTEGER,
             FOREIGN KEY (inventory_item_id) REFERENCES inventory_items (id)
         )
         ''')
 
         cursor.execute('''
-        CREATE TABLE regulators (
+        CREATE TABLE IF NOT EXISTS regulators (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             inventory_item_id INTEGER UNIQUE,
             has_computer BOOLEAN DEFAULT 0,
             last_service_date TIMESTAMP,
+            next_service_due TIMESTAMP,
+            next_due TIMESTAMP,
             FOREIGN KEY (inventory_item_id) REFERENCES inventory_items (id)
         )
         ''')
 
         cursor.execute('''
-        CREATE TABLE masks (
+        CREATE TABLE IF NOT EXISTS masks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             inventory_item_id INTEGER UNIQUE,
             has_comms BOOLEAN DEFAULT 0,
@@ -198,7 +1291,7 @@ def migrate_data(excel_file, db_file=None):
         ''')
 
         cursor.execute('''
-        CREATE TABLE tanks (
+        CREATE TABLE IF NOT EXISTS tanks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             inventory_item_id INTEGER UNIQUE,
             tank_number TEXT,
@@ -207,12 +1300,15 @@ def migrate_data(excel_file, db_file=None):
             tank_material TEXT,
             working_pressure INTEGER,
             gas_type TEXT,
+            next_hydro_due TIMESTAMP,
+            next_vip_due TIMESTAMP,
+            next_due TIMESTAMP,
             FOREIGN KEY (inventory_item_id) REFERENCES inventory_items (id)
         )
         ''')
 
         cursor.execute('''
-        CREATE TABLE maintenance_records (
+        CREATE TABLE IF NOT EXISTS maintenance_records (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             bcd_id INTEGER,
             date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -223,7 +1319,7 @@ def migrate_data(excel_file, db_file=None):
         ''')
 
         cursor.execute('''
-        CREATE TABLE checkout_records (
+        CREATE TABLE IF NOT EXISTS checkout_records (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             inventory_item_id INTEGER,
             person_name TEXT NOT NULL,
@@ -236,278 +1332,178 @@ def migrate_data(excel_file, db_file=None):
         )
         ''')
 
-        conn.commit()
-        logger.info("Created database tables")
-
-        # Migrate Item Types
-        if 'Item_Type' in excel_data:
-            logger.info("Processing Item_Type sheet")
-            item_types_df = excel_data['Item_Type']
-
-            for _, row in item_types_df.iterrows():
-                try:
-                    item_id = clean_int(row['ID'])
-                    name = clean_string(row['Item Type'])
-
-                    cursor.execute(
-                        "INSERT INTO item_types (id, name, description) VALUES (?, ?, ?)",
-                        (item_id, name, "")
-                    )
-                except Exception as e:
-                    logger.error(f"Error processing item type: {e}")
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_maintenance_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventory_item_id INTEGER,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            maintenance_type TEXT,
+            notes TEXT,
+            FOREIGN KEY (inventory_item_id) REFERENCES inventory_items (id)
+        )
+        ''')
 
-            conn.commit()
-            logger.info(f"Imported {len(item_types_df)} item types")
-        else:
-            logger.warning("Item_Type sheet not found")
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tank_maintenance_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tank_id INTEGER,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            maintenance_type TEXT,
+            notes TEXT,
+            FOREIGN KEY (tank_id) REFERENCES tanks (id)
+        )
+        ''')
 
-        # Migrate Locations
-        if 'Locations' in excel_data:
-            logger.info("Processing Locations sheet")
-            locations_df = excel_data['Locations']
+        # Indexes for due-date range scans
+        for table, column in (('tanks', 'next_hydro_due'), ('tanks', 'next_vip_due'), ('tanks', 'next_due'),
+                              ('bcds', 'next_due'),
+                              ('regulators', 'next_service_due'), ('regulators', 'next_due')):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})")
+
+        # Upsert target for items with a serial number; blank serials may repeat
+        cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_inventory_items_serial_number
+        ON inventory_items (serial_number) WHERE serial_number != ''
+        """)
+
+        # What the last import wrote for each inventory and tank row
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {IMPORT_TABLE} (
+            source TEXT NOT NULL,
+            key TEXT NOT NULL,
+            inventory_item_id INTEGER,
+            fingerprint INTEGER,
+            PRIMARY KEY (source, key)
+        )
+        ''')
 
-            for _, row in locations_df.iterrows():
-                try:
-                    location_id = clean_int(row['ID'])
-                    name = clean_string(row['Location'])
+        if journal is not None:
+            create_journal(cursor)
 
-                    cursor.execute(
-                        "INSERT INTO locations (id, name, description) VALUES (?, ?, ?)",
-                        (location_id, name, "")
-                    )
-                except Exception as e:
-                    logger.error(f"Error processing location: {e}")
+        logger.info("Created database tables")
 
-            conn.commit()
-            logger.info(f"Imported {len(locations_df)} locations")
+        if journal is not None and journal['run']['items_before'] is not None:
+            items_before = journal['run']['items_before']
         else:
-            logger.warning("Locations sheet not found")
+            cursor.execute("SELECT COUNT(*) FROM inventory_items")
+            items_before = cursor.fetchone()[0]
+            if journal is not None:
+                journal['run']['items_before'] = items_before
+        timings['schema'] += time.perf_counter() - schema_started
 
         # Track serial numbers to avoid duplicates
-        used_serials = set()
-        inventory_items_processed = 0
-        inventory_items_created = 0
-        bcd_count = 0
-        regulator_count = 0
-        mask_count = 0
+        state = resume_import_state(cursor, journal) if resume else load_import_state(cursor)
+        used_serials = set(filter(None, state['serials'].values()))
+        if resume:
+            used_serials |= journaled_keys(cursor, 'serial')
+        loaded_sources = []
+
+        # Migrate Item Types and Locations
+        for sheet_name, table, label in (('Item_Type', 'item_types', 'item type'),
+                                         ('Locations', 'locations', 'location')):
+            if sheet_name not in sheet_chunks:
+                logger.warning(f"{sheet_name} sheet not found")
+                continue
+            logger.info(f"Processing {sheet_name} sheet")
+            imported = 0
+            for _, lookup in tracked_chunks(sheet_chunks[sheet_name], sheet_name, cursor, journal, state):
+                with timed(timings, 'write'):
+                    insert_rows(cursor, table, list(lookup.columns), frame_rows(lookup, lookup.columns), label,
+                                upsert_clause('id', ['name']))
+                imported += len(lookup)
+            record_progress(cursor, journal, state, sheet_name, 0, 0, finished=True)
+            logger.info(f"Imported {imported} {label}s")
 
         # Migrate Inventory items
-        if 'Inventory' in excel_data:
+        if 'Inventory' in sheet_chunks:
             logger.info("Processing Inventory sheet")
-            inventory_df = excel_data['Inventory']
-
-            for _, row in inventory_df.iterrows():
-                try:
-                    # Skip rows without an ID
-                    if pd.isna(row['ID']):
-                        continue
-
-                    item_id = clean_int(row['ID'])
-                    inventory_items_processed += 1
-
-                    # Extract values
-                    item_type_id = clean_int(row.get('Item Type Lookup'), default=None)
-                    manufacturer = clean_string(row.get('Item Manufacturer', ''))
-                    model = clean_string(row.get('Item Model', ''))
-                    serial_number = clean_string(row.get('Item Seriel Number', ''))
-
-                    # Make serial number unique if needed
-                    original_serial = serial_number
-                    counter = 1
-                    while serial_number in used_serials and serial_number:
-                        serial_number = f"{original_serial}-{counter}"
-                        counter += 1
-
-                    if serial_number:
-                        used_serials.add(serial_number)
-
-                    # Handle dates
-                    intake_date = clean_date(row.get('Intake Date'))
-                    disposal_date = clean_date(row.get('Disposal Date'))
-
-                    intake_date_str = intake_date.isoformat() if intake_date else None
-                    disposal_date_str = disposal_date.isoformat() if disposal_date else None
-
-                    location_id = clean_int(row.get('Location'), default=1)
-                    pm_required = 1 if clean_bool(row.get('PM Required')) else 0
-                    condition_code = clean_int(row.get('Condition Code', 1))
-
-                    # Skip if no item type
-                    if not item_type_id:
-                        logger.warning(f"Skipping inventory item {item_id}: Missing type_id")
-                        continue
-
-                    # Insert into inventory_items
-                    cursor.execute('''
-                    INSERT INTO inventory_items 
-                    (id, item_type_id, manufacturer, model, serial_number, 
-                     intake_date, disposal_date, location_id, pm_required, condition_code)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        item_id, item_type_id, manufacturer, model, serial_number,
-                        intake_date_str, disposal_date_str, location_id, pm_required, condition_code
-                    ))
-
-                    inventory_items_created += 1
-
-                    # For BCDs (type ID 1)
-                    if item_type_id == 1:
-                        next_maint_date = None
-                        if intake_date:
-                            next_maint_date = intake_date.replace(year=intake_date.year + 1).isoformat()
-
-                        cursor.execute('''
-                        INSERT INTO bcds (inventory_item_id, last_maintenance, next_maintenance)
-                        VALUES (?, ?, ?)
-                        ''', (
-                            item_id, intake_date_str, next_maint_date
-                        ))
-                        bcd_count += 1
-
-                    # For Regulators (type ID 2)
-                    elif item_type_id == 2:
-                        cursor.execute('''
-                        INSERT INTO regulators (inventory_item_id, has_computer, last_service_date)
-                        VALUES (?, ?, ?)
-                        ''', (
-                            item_id, 0, intake_date_str
-                        ))
-                        regulator_count += 1
-
-                    # For Masks (type ID 4)
-                    elif item_type_id == 4:
-                        size = clean_string(row.get('Size', ''))
-                        cursor.execute('''
-                        INSERT INTO masks (inventory_item_id, has_comms, size)
-                        VALUES (?, ?, ?)
-                        ''', (
-                            item_id, 0, size
-                        ))
-                        mask_count += 1
-                except Exception as e:
-                    logger.error(f"Error processing inventory item {item_id}: {e}")
-                    continue
-
-            conn.commit()
-            logger.info(f"Processed {inventory_items_processed} inventory items, created {inventory_items_created}")
-            logger.info(f"Created {bcd_count} BCDs, {regulator_count} regulators, {mask_count} masks")
+            processed = 0
+            totals = {'items': 0, 'bcds': 0, 'regulators': 0, 'masks': 0}
+            for rows_read, items in tracked_chunks(sheet_chunks['Inventory'], 'Inventory', cursor, journal, state):
+                processed += rows_read
+                with timed(timings, 'write'):
+                    counts = insert_inventory(cursor, items, used_serials, state)
+                for key in totals:
+                    totals[key] += counts[key]
+            with timed(timings, 'write'):
+                counts = insert_deferred_inventory(cursor, state)
+            for key in totals:
+                totals[key] += counts[key]
+            record_progress(cursor, journal, state, 'Inventory', 0, 0, finished=True)
+            loaded_sources.append('inventory')
+            logger.info(f"Read {processed} inventory rows, wrote {totals['items']} items")
+            logger.info(f"Created {totals['bcds']} BCDs, {totals['regulators']} regulators, {totals['masks']} masks")
         else:
             logger.warning("Inventory sheet not found")
 
         # Process Tanks separately
-        tanks_processed = 0
-        tanks_created = 0
-
-        if 'Tank_Inventory' in excel_data:
+        if 'Tank_Inventory' in sheet_chunks:
             logger.info("Processing Tank_Inventory sheet")
-            tanks_df = excel_data['Tank_Inventory']
-
-            # Get last inventory item ID
-            cursor.execute("SELECT MAX(id) FROM inventory_items")
-            result = cursor.fetchone()
-            next_inventory_id = (result[0] or 0) + 1
-
-            # Process each tank row
-            for _, row in tanks_df.iterrows():
-                try:
-                    # Get tank ID and number
-                    tank_id = clean_string(row.get('Tank ID', ''))
-                    tank_number = clean_string(row.get('Tank Number', ''))
-
-                    if not tank_id and not tank_number:
-                        logger.warning("Skipping tank record with no ID or number")
-                        continue
-
-                    tanks_processed += 1
-
-                    # Extract values
-                    manufacturer = clean_string(row.get('Manufacturer', ''))
-
-                    # Handle dates
-                    hydro_date = clean_date(row.get('Hydro Date'))
-                    vip_date = clean_date(row.get('VIP Date'))
-
-                    hydro_date_str = hydro_date.isoformat() if hydro_date else None
-                    vip_date_str = vip_date.isoformat() if vip_date else None
-
-                    tank_material = clean_string(row.get('Tank Material', ''))
-                    working_pressure = clean_int(row.get('Working Pressure', 3000))
-                    gas_type = clean_string(row.get('Gas Type', 'Air'))
-
-                    # Extract numeric part of tank ID if possible, otherwise use the original
-                    extracted_id = extract_tank_number(tank_id)
-
-                    # Create inventory item with the original tank ID as the serial number
-                    unique_serial = tank_id
-                    original_serial = unique_serial
-                    counter = 1
-
-                    # Make sure serial is unique
-                    while unique_serial in used_serials:
-                        unique_serial = f"{original_serial}-{counter}"
-                        counter += 1
-
-                    used_serials.add(unique_serial)
-
-                    # Create inventory item for this tank
-                    cursor.execute('''
-                    INSERT INTO inventory_items 
-                    (id, item_type_id, manufacturer, model, serial_number, 
-                     intake_date, location_id, pm_required, condition_code)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        next_inventory_id,
-                        7,  # Tank type ID
-                        manufacturer,
-                        tank_number,
-                        unique_serial,  # Use original tank ID as serial
-                        datetime.now().isoformat(),
-                        1,  # Default location
-                        1,  # PM required
-                        2  # Default condition
-                    ))
-
-                    # Create tank record - use tank_number for the tank_number field
-                    cursor.execute('''
-                    INSERT INTO tanks 
-                    (inventory_item_id, tank_number, hydro_date, vip_date, 
-                     tank_material, working_pressure, gas_type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        next_inventory_id,
-                        tank_number,  # Use provided tank number
-                        hydro_date_str,
-                        vip_date_str,
-                        tank_material,
-                        working_pressure,
-                        gas_type
-                    ))
-
-                    tanks_created += 1
-                    next_inventory_id += 1
-
-                    # Commit every 10 tanks
-                    if tanks_created % 10 == 0:
-                        conn.commit()
-                        logger.info(f"Committed {tanks_created} tanks so far")
-
-                except Exception as e:
-                    logger.error(f"Error processing tank: {e}")
-                    import traceback
-                    logger.error(traceback.format_exc())
-                    continue
 
-            conn.commit()
-            logger.info(f"Processed {tanks_processed} tanks, created {tanks_created} new tank records")
+            processed = 0
+            written = 0
+            intake_date = datetime.fromisoformat(journal['run']['intake_date']) if journal else datetime.now()
+            for rows_read, tanks in tracked_chunks(sheet_chunks['Tank_Inventory'], 'Tank_Inventory',
+                                                   cursor, journal, state):
+                processed += rows_read
+                with timed(timings, 'write'):
+                    counts = insert_tanks(cursor, tanks, used_serials, state, intake_date)
+                written += counts['tanks']
+            record_progress(cursor, journal, state, 'Tank_Inventory', 0, 0, finished=True)
+            loaded_sources.append('tank')
+            logger.info(f"Read {processed} tank rows, wrote {written} tank records")
         else:
             logger.warning("Tank_Inventory sheet not found")
 
+        # Only sheets that were read can tell which of their rows were removed
+        if incremental:
+            with timed(timings, 'write'):
+                delete_missing_rows(cursor, state, loaded_sources)
+
+        # Build the search index once after a full load; its triggers keep it current afterwards
+        try:
+            with timed(timings, 'index'):
+                rebuild = not incremental or not search_index_exists(cursor.execute)
+                create_search_index(cursor.execute)
+                if rebuild:
+                    rebuild_search_index(cursor.execute)
+                    logger.info("Built full-text search index")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search index not built: {e}")
+
+        # The journal is only needed while the shadow is incomplete
+        if journal is not None:
+            cursor.execute(f"DROP TABLE IF EXISTS {JOURNAL_TABLE}")
+            cursor.execute(f"DROP TABLE IF EXISTS {JOURNAL_KEYS_TABLE}")
+
+        # Stamp the import so the app notices it even when the file is overwritten in place
+        generation = live.execute("PRAGMA user_version").fetchone()[0] + 1 if live is not None else 1
+        cursor.execute(f"PRAGMA user_version = {generation % 2 ** 31}")
+
+        with timed(timings, 'validate'):
+            validate_import(cursor, items_before, state)
+            conn.commit()
+        if journal is not None:
+            journal['committed'] = False
+
         # Count records in each table
         counts = {}
         for table in tables:
             cursor.execute(f"SELECT COUNT(*) FROM {table}")
             counts[table] = cursor.fetchone()[0]
 
+        # Swap the finished database in; the app reopens its connections on the next request
+        conn.close()
+        with timed(timings, 'swap'):
+            if live is not None and live.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+                backup_file = copy_into_database(shadow_file, db_file, live, data_version)
+                remove_database_files(shadow_file)
+            else:
+                backup_file = swap_in_database(shadow_file, db_file, live, data_version)
+        swapped = True
+        if backup_file:
+            logger.info(f"Previous database kept as {backup_file}")
+
         # Summarize
         summary = f"""
 Migration completed successfully:
@@ -518,30 +1514,71 @@ Migration completed successfully:
 - {counts['bcds']} BCDs
 - {counts['regulators']} regulators
 - {counts['masks']} masks
+
+Import changes: {state['inserted']} inserted, {state['updated']} updated, \
+{state['unchanged']} unchanged, {state['deleted']} deleted
 """
         logger.info(summary)
         print(summary)
 
+        # Read and clean are summed over worker processes; wait is the writer idling on them
+        logger.info("Stage timings: " + ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+        return True
+
     except Exception as e:
-        conn.rollback()
         logger.error(f"Migration failed with error: {e}")
         import traceback
         logger.error(traceback.format_exc())
         print(f"Migration failed: {e}")
         print("Check migration.log for details")
+        if journal is not None and journal['committed']:
+            logger.info(f"Committed batches are kept in {shadow_file}")
+            print("Run the import again with --resume to continue from the last committed batch")
+        return False
     finally:
+        # Shutting the manager down first unblocks workers waiting on a full queue
+        if manager is not None:
+            manager.shutdown()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if workbook is not None:
+            workbook.close()
         conn.close()
+        if live is not None:
+            live.close()
+        # A journaled shadow is kept for --resume
+        if not swapped and not (journal is not None and journal['committed']):
+            remove_database_files(shadow_file)
 
 
 if __name__ == "__main__":
-    import sys
-
-    # Get the filename from arguments or use default
-    filename = 'Inventory.xlsx'  # Default filename with correct case
-    for arg in sys.argv[1:]:
-        if not arg.startswith("--"):
-            filename = arg
-            break
-
-    print(f"Starting migration with file: {filename}")
-    migrate_data(filename)
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate the inventory workbook to the SQLite database")
+    parser.add_argument('filename', nargs='?', default='Inventory.xlsx',
+                        help="Excel workbook to import (default: Inventory.xlsx)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Rows read and inserted per batch (default: {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Update the existing database in place instead of recreating it")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes reading and cleaning sheets (default: 1, no workers)")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="Commit about every N rows so a failed import can be resumed "
+                             "(default: one commit at the end)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted import from its last committed batch")
+    parser.add_argument('--dry-run', '--validate', dest='validate', action='store_true',
+                        help="Check the workbook and write a report without importing it")
+    parser.add_argument('--report', default=None,
+                        help="Validation report file (default: <workbook>_validation.csv)")
+    args = parser.parse_args()
+
+    if args.validate:
+        problems = validate_workbook(args.filename, args.report, chunk_size=args.chunk_size)
+        sys.exit(0 if problems == 0 else 1)
+
+    print(f"Starting migration with file: {args.filename}")
+    succeeded = migrate_data(args.filename, chunk_size=args.chunk_size, incremental=args.incremental,
+                             workers=args.workers, batch_size=args.batch_size, resume=args.resume)
+    sys.exit(0 if succeeded else 1)
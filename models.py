@@ -1,9 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event, func, inspect, text, select, case, or_
 
 db = SQLAlchemy()
 
 
+
 # Item Type table (replacing Item_Type sheet)
 class ItemType(db.Model):
     __tablename__ = 'item_types'
@@ -25,8 +27,12 @@ class Location(db.Model):
 # Main Inventory Items
 class InventoryItem(db.Model):
     __tablename__ = 'inventory_items'
+    __table_args__ = (
+        # Checked-out filter on the inventory list, and the dashboard counters
+        db.Index('ix_inventory_items_checked_out', 'currently_checked_out', 'item_type_id'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    item_type_id = db.Column(db.Integer, db.ForeignKey('item_types.id'), nullable=False)
+    item_type_id = db.Column(db.Integer, db.ForeignKey('item_types.id'), nullable=False, index=True)
     manufacturer = db.Column(db.String(100))
     model = db.Column(db.String(100))
     serial_number = db.Column(db.String(100), unique=True)
@@ -63,34 +69,37 @@ class Tank(db.Model):
     tank_material = db.Column(db.String(50))
     working_pressure = db.Column(db.Integer)
     gas_type = db.Column(db.String(50))
+
+    # Materialized due dates, kept in sync by update_due_dates()
+    next_hydro_due = db.Column(db.DateTime, index=True)
+    next_vip_due = db.Column(db.DateTime, index=True)
+    next_due = db.Column(db.DateTime, index=True)
+
     maintenance_records = db.relationship('TankMaintenanceRecord', backref='tank', lazy=True)
 
     def __repr__(self):
         return f"<Tank {self.id}>"
 
     def is_hydro_due(self):
-        if not self.hydro_date:
-            return False
-        # Hydro test every 5 years
-        next_hydro = self.hydro_date.replace(year=self.hydro_date.year + 5)
-        return next_hydro <= datetime.now()
+        from maintenance_rules import get_rule
+        return get_rule('Tank', 'hydro').is_due(self)
 
     def is_vip_due(self):
-        if not self.vip_date:
-            return False
-        # VIP every year
-        next_vip = self.vip_date.replace(year=self.vip_date.year + 1)
-        return next_vip <= datetime.now()
+        from maintenance_rules import get_rule
+        return get_rule('Tank', 'vip').is_due(self)
 
     def get_next_hydro_date(self):
-        if not self.hydro_date:
-            return None
-        return self.hydro_date.replace(year=self.hydro_date.year + 5)
+        from maintenance_rules import get_rule
+        return get_rule('Tank', 'hydro').next_due_for(self)
 
     def get_next_vip_date(self):
-        if not self.vip_date:
-            return None
-        return self.vip_date.replace(year=self.vip_date.year + 1)
+        from maintenance_rules import get_rule
+        return get_rule('Tank', 'vip').next_due_for(self)
+
+    def update_due_dates(self):
+        """Recompute the materialized hydro, VIP and overall due dates"""
+        from maintenance_rules import apply_due_dates
+        apply_due_dates(self)
 
     def maintenance_due(self):
         return self.is_hydro_due() or self.is_vip_due()
@@ -131,6 +140,9 @@ class TankMaintenanceRecord(db.Model):
     tank_id = db.Column(db.Integer, db.ForeignKey('tanks.id'))
     date = db.Column(db.DateTime, default=datetime.now)
     maintenance_type = db.Column(db.String(100))  # Hydro Test or VIP Inspection
+
+    # A tank's history, also read by the search index triggers on every insert
+    __table_args__ = (db.Index('ix_tank_maintenance_records_tank_date', 'tank_id', 'date'),)
     notes = db.Column(db.Text)
 
     def __repr__(self):
@@ -141,7 +153,13 @@ class BCD(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_items.id'), unique=True)
     last_maintenance = db.Column(db.DateTime)
-    next_maintenance = db.Column(db.DateTime)
+    next_maintenance = db.Column(db.DateTime, index=True)
+    next_due = db.Column(db.DateTime, index=True)
+
+    # Denormalized from maintenance_records by the MaintenanceRecord events below;
+    # last_record_id is the latest record by date (no FK: records reference bcds)
+    maintenance_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_record_id = db.Column(db.Integer)
 
     maintenance_records = db.relationship('MaintenanceRecord', backref='bcd', lazy=True)
 
@@ -153,6 +171,11 @@ class BCD(db.Model):
             return False
         return self.next_maintenance <= datetime.now()
 
+    def update_due_dates(self):
+        """Recompute the materialized next and overall due dates"""
+        from maintenance_rules import apply_due_dates
+        apply_due_dates(self)
+
 
 # Add regulator-specific data
 class Regulator(db.Model):
@@ -162,19 +185,25 @@ class Regulator(db.Model):
     has_computer = db.Column(db.Boolean, default=False)  # New field for working computer
     last_service_date = db.Column(db.DateTime)
 
+    # Materialized due dates, kept in sync by update_due_dates()
+    next_service_due = db.Column(db.DateTime, index=True)
+    next_due = db.Column(db.DateTime, index=True)
+
     def is_maintenance_due(self):
         """Check if regulator maintenance is due"""
-        if not self.last_service_date:
-            return False
-        # Regulator service every year
-        next_service = self.last_service_date.replace(year=self.last_service_date.year + 1)
-        return next_service <= datetime.now()
+        from maintenance_rules import get_rule
+        return get_rule('Regulator', 'service').is_due(self)
 
     def get_next_service_date(self):
         """Get the next service date for the regulator"""
-        if not self.last_service_date:
-            return None
-        return self.last_service_date.replace(year=self.last_service_date.year + 1)
+        from maintenance_rules import get_rule
+        return get_rule('Regulator', 'service').next_due_for(self)
+
+    def update_due_dates(self):
+        """Recompute the materialized service and overall due dates"""
+        from maintenance_rules import apply_due_dates
+        apply_due_dates(self)
+
     def __repr__(self):
         return f"<Regulator {self.id}>"
 
@@ -194,9 +223,13 @@ class Mask(db.Model):
 # Maintenance Records for BCDs and other equipment
 class MaintenanceRecord(db.Model):
     __tablename__ = 'maintenance_records'
+    __table_args__ = (
+        # A BCD's history newest first
+        db.Index('ix_maintenance_records_bcd_date', 'bcd_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     bcd_id = db.Column(db.Integer, db.ForeignKey('bcds.id'))
-    date = db.Column(db.DateTime, default=datetime.now)
+    date = db.Column(db.DateTime, default=datetime.now, index=True)  # Monthly and yearly report ranges
     maintenance_type = db.Column(db.String(100))
     notes = db.Column(db.Text)
 
@@ -205,6 +238,7 @@ class MaintenanceRecord(db.Model):
 
 class InventoryMaintenanceRecord(db.Model):
     __tablename__ = 'inventory_maintenance_records'
+    __table_args__ = (db.Index('ix_inventory_maintenance_records_item_date', 'inventory_item_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
     inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_items.id'))
     date = db.Column(db.DateTime, default=datetime.now)
@@ -218,14 +252,166 @@ class InventoryMaintenanceRecord(db.Model):
 # New table for tracking checkouts
 class CheckoutRecord(db.Model):
     __tablename__ = 'checkout_records'
+    __table_args__ = (
+        # Keyset pagination over (checkout_date, id), and the open-checkouts filter
+        db.Index('ix_checkout_records_checkout_date_id', 'checkout_date', 'id'),
+        db.Index('ix_checkout_records_open', 'checkout_date', 'id', sqlite_where=text('checkin_date IS NULL')),
+        # An item's history newest first, and its open checkout for check-in
+        db.Index('ix_checkout_records_item_date', 'inventory_item_id', 'checkout_date'),
+        db.Index('ix_checkout_records_item_open', 'inventory_item_id', 'checkout_date',
+                 sqlite_where=text('checkin_date IS NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_items.id'))
     person_name = db.Column(db.String(100), nullable=False)
     checkout_date = db.Column(db.DateTime, default=datetime.now)
-    checkin_date = db.Column(db.DateTime)
+    checkin_date = db.Column(db.DateTime, index=True)  # Monthly report check-in range
     checkout_condition = db.Column(db.Integer)  # Condition at checkout
     checkin_condition = db.Column(db.Integer)  # Condition at check-in
     notes = db.Column(db.Text)
 
     def __repr__(self):
-        return f"<Checkout Record {self.id}>"
\ No newline at end of file
+        return f"<Checkout Record {self.id}>"
+
+
+# Case-insensitive borrower prefix search
+db.Index('ix_checkout_records_person_name', func.lower(CheckoutRecord.person_name), CheckoutRecord.checkout_date)
+
+
+# Keep materialized due dates in sync on every ORM insert and update
+@event.listens_for(Tank, 'before_insert')
+@event.listens_for(Tank, 'before_update')
+@event.listens_for(BCD, 'before_insert')
+@event.listens_for(BCD, 'before_update')
+@event.listens_for(Regulator, 'before_insert')
+@event.listens_for(Regulator, 'before_update')
+def _refresh_due_dates(mapper, connection, target):
+    target.update_due_dates()
+
+
+# Keep BCD.maintenance_count and last_record_id in sync in the transaction that
+# writes the record; bulk writers call refresh_bcd_maintenance_counters instead
+@event.listens_for(MaintenanceRecord, 'after_insert')
+def _count_maintenance_record(mapper, connection, target):
+    if target.bcd_id is None:
+        return
+    bcds = BCD.__table__
+    records = MaintenanceRecord.__table__
+    last_date = select(records.c.date).where(records.c.id == bcds.c.last_record_id).scalar_subquery()
+    # Ties go to the new record, matching the date, id order of the refresh
+    is_latest = or_(bcds.c.last_record_id.is_(None), last_date.is_(None), last_date <= target.date)
+    connection.execute(bcds.update().where(bcds.c.id == target.bcd_id).values(
+        maintenance_count=bcds.c.maintenance_count + 1,
+        last_record_id=case((is_latest, target.id), else_=bcds.c.last_record_id)
+    ))
+
+
+@event.listens_for(MaintenanceRecord, 'after_update')
+def _recount_moved_maintenance_record(mapper, connection, target):
+    history = inspect(target).attrs
+    if history.bcd_id.history.has_changes() or history.date.history.has_changes():
+        bcd_ids = {target.bcd_id, *history.bcd_id.history.deleted} - {None}
+        refresh_bcd_maintenance_counters(connection, bcd_ids)
+
+
+@event.listens_for(MaintenanceRecord, 'after_delete')
+def _uncount_maintenance_record(mapper, connection, target):
+    if target.bcd_id is not None:
+        refresh_bcd_maintenance_counters(connection, [target.bcd_id])
+
+
+def refresh_bcd_maintenance_counters(connection, bcd_ids=None):
+    """Recompute maintenance_count and last_record_id from maintenance_records in one UPDATE
+
+    Limited to bcd_ids when given. Only rows that drifted are written; returns
+    how many there were.
+    """
+    bcds = BCD.__table__
+    records = MaintenanceRecord.__table__
+    count = select(func.count()).where(records.c.bcd_id == bcds.c.id).scalar_subquery()
+    # NULL dates sort last in descending order
+    latest = select(records.c.id).where(records.c.bcd_id == bcds.c.id).order_by(
+        records.c.date.desc(), records.c.id.desc()).limit(1).scalar_subquery()
+    statement = bcds.update().values(maintenance_count=count, last_record_id=latest).where(
+        or_(bcds.c.maintenance_count != count, bcds.c.last_record_id.is_not(latest)))
+    if bcd_ids is not None:
+        statement = statement.where(bcds.c.id.in_(list(bcd_ids)))
+    return connection.execute(statement).rowcount
+
+
+# Columns added after the first release, with the indexes that cover them
+DUE_DATE_COLUMNS = {
+    'tanks': ['next_hydro_due', 'next_vip_due', 'next_due'],
+    'bcds': ['next_due'],
+    'regulators': ['next_service_due', 'next_due'],
+}
+
+
+def ensure_due_date_columns():
+    """Add missing due date columns and indexes to an existing database"""
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as conn:
+        for table, columns in DUE_DATE_COLUMNS.items():
+            if not inspector.has_table(table):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table)}
+            for column in columns:
+                if column not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} DATETIME"))
+                    added.append(f"{table}.{column}")
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+    return added
+
+
+# Denormalized BCD maintenance columns, added after the due date columns
+BCD_COUNTER_COLUMNS = {
+    'maintenance_count': 'INTEGER NOT NULL DEFAULT 0',
+    'last_record_id': 'INTEGER',
+}
+
+
+def ensure_bcd_counter_columns():
+    """Add missing BCD maintenance counter columns to an existing database"""
+    inspector = inspect(db.engine)
+    if not inspector.has_table('bcds'):
+        return []
+    existing = {column['name'] for column in inspector.get_columns('bcds')}
+    added = []
+    with db.engine.begin() as conn:
+        for column, definition in BCD_COUNTER_COLUMNS.items():
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE bcds ADD COLUMN {column} {definition}"))
+                added.append(f"bcds.{column}")
+    return added
+
+
+def ensure_indexes():
+    """Create indexes declared on the models that an existing database lacks
+
+    create_all() skips tables that already exist, so this is how a database
+    built before an index was added (or by migration.py) gets it: the app
+    runs it at startup and after a database swap. Returns the names created.
+    """
+    created = []
+    with db.engine.begin() as conn:
+        # Read names from sqlite_master; reflection skips expression-based indexes
+        existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    created.append(index.name)
+    return created
+
+
+def backfill_due_dates():
+    """Recompute every materialized due date from its anchor dates"""
+    counts = {}
+    for model in (Tank, BCD, Regulator):
+        records = model.query.all()
+        for record in records:
+            record.update_due_dates()
+        counts[model.__tablename__] = len(records)
+    db.session.commit()
+    return counts
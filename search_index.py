@@ -0,0 +1,123 @@
+# search_index.py - SQLite FTS5 trigram index over inventory items
+#
+# The index has one row per inventory item (rowid = inventory_items.id) holding
+# its serial number, manufacturer, model, tank number and every note recorded
+# against it. Triggers keep it in sync with the source tables, so any writer -
+# the ORM or migration.py's raw sqlite3 inserts - updates it.
+#
+# Functions take an `execute` callable that runs one SQL string, so they work
+# with both a sqlite3 cursor and a SQLAlchemy connection's exec_driver_sql.
+
+SEARCH_TABLE = 'inventory_search'
+
+# Columns each search mode matches against
+SEARCH_MODES = {
+    'items': ('serial_number', 'manufacturer', 'model'),
+    'tank': ('tank_number',),
+    'notes': ('notes',),
+}
+
+# Minimum term length the trigram tokenizer can answer with MATCH
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _item_notes_sql(item_id):
+    """SQL expression concatenating every note recorded against an item"""
+    return f'''(SELECT group_concat(note, ' ') FROM (
+        SELECT notes AS note FROM checkout_records WHERE inventory_item_id = {item_id}
+        UNION ALL
+        SELECT notes FROM inventory_maintenance_records WHERE inventory_item_id = {item_id}
+        UNION ALL
+        SELECT m.notes FROM maintenance_records m JOIN bcds b ON m.bcd_id = b.id
+        WHERE b.inventory_item_id = {item_id}
+        UNION ALL
+        SELECT t.notes FROM tank_maintenance_records t JOIN tanks k ON t.tank_id = k.id
+        WHERE k.inventory_item_id = {item_id}
+    ) WHERE note IS NOT NULL AND note != '')'''
+
+
+def _refresh_notes_sql(item_id):
+    return f"UPDATE {SEARCH_TABLE} SET notes = {_item_notes_sql(item_id)} WHERE rowid = {item_id};"
+
+
+def _trigger_statements():
+    """CREATE TRIGGER statements keeping the index in sync"""
+    statements = [
+        f'''CREATE TRIGGER IF NOT EXISTS inventory_search_item_insert AFTER INSERT ON inventory_items BEGIN
+            INSERT INTO {SEARCH_TABLE} (rowid, serial_number, manufacturer, model)
+            VALUES (NEW.id, NEW.serial_number, NEW.manufacturer, NEW.model);
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS inventory_search_item_update
+            AFTER UPDATE OF serial_number, manufacturer, model ON inventory_items BEGIN
+            UPDATE {SEARCH_TABLE} SET serial_number = NEW.serial_number, manufacturer = NEW.manufacturer,
+                model = NEW.model WHERE rowid = NEW.id;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS inventory_search_item_delete AFTER DELETE ON inventory_items BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS inventory_search_tank_insert AFTER INSERT ON tanks BEGIN
+            UPDATE {SEARCH_TABLE} SET tank_number = NEW.tank_number WHERE rowid = NEW.inventory_item_id;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS inventory_search_tank_update AFTER UPDATE OF tank_number ON tanks BEGIN
+            UPDATE {SEARCH_TABLE} SET tank_number = NEW.tank_number WHERE rowid = NEW.inventory_item_id;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS inventory_search_tank_delete AFTER DELETE ON tanks BEGIN
+            UPDATE {SEARCH_TABLE} SET tank_number = NULL WHERE rowid = OLD.inventory_item_id;
+        END''',
+    ]
+
+    # Note tables: how to find the inventory item a NEW/OLD row belongs to
+    note_tables = {
+        'checkout_records': '{row}.inventory_item_id',
+        'inventory_maintenance_records': '{row}.inventory_item_id',
+        'maintenance_records': '(SELECT inventory_item_id FROM bcds WHERE id = {row}.bcd_id)',
+        'tank_maintenance_records': '(SELECT inventory_item_id FROM tanks WHERE id = {row}.tank_id)',
+    }
+    for table, item_id in note_tables.items():
+        statements.append(f'''CREATE TRIGGER IF NOT EXISTS inventory_search_{table}_insert
+            AFTER INSERT ON {table} BEGIN
+            {_refresh_notes_sql(item_id.format(row='NEW'))}
+        END''')
+        statements.append(f'''CREATE TRIGGER IF NOT EXISTS inventory_search_{table}_update
+            AFTER UPDATE OF notes ON {table} BEGIN
+            {_refresh_notes_sql(item_id.format(row='NEW'))}
+        END''')
+        statements.append(f'''CREATE TRIGGER IF NOT EXISTS inventory_search_{table}_delete
+            AFTER DELETE ON {table} BEGIN
+            {_refresh_notes_sql(item_id.format(row='OLD'))}
+        END''')
+    return statements
+
+
+def search_index_exists(execute):
+    """Return True if the FTS5 table has been created"""
+    return execute(f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{SEARCH_TABLE}'").fetchone() is not None
+
+
+def create_search_index(execute):
+    """Create the FTS5 table and its triggers if they are missing
+
+    Raises the driver's OperationalError when SQLite lacks FTS5 or the
+    trigram tokenizer (SQLite < 3.34).
+    """
+    execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        serial_number, manufacturer, model, tank_number, notes,
+        tokenize = 'trigram'
+    )''')
+    for statement in _trigger_statements():
+        execute(statement)
+
+
+def rebuild_search_index(execute):
+    """Repopulate the index from the source tables"""
+    execute(f"DELETE FROM {SEARCH_TABLE}")
+    execute(f'''INSERT INTO {SEARCH_TABLE} (rowid, serial_number, manufacturer, model, tank_number, notes)
+        SELECT i.id, i.serial_number, i.manufacturer, i.model, t.tank_number, {_item_notes_sql('i.id')}
+        FROM inventory_items i LEFT JOIN tanks t ON t.inventory_item_id = i.id''')
+
+
+def match_expression(term, mode='items'):
+    """Build an FTS5 MATCH expression for a literal term in one search mode"""
+    columns = ' '.join(SEARCH_MODES[mode])
+    phrase = '"' + term.replace('"', '""') + '"'
+    return f'{{{columns}}} : {phrase}'
@@ -0,0 +1,93 @@
+# conftest.py - App, seeding and statement-counting fixtures for the test suite
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, InventoryItem, Tank, BCD, Regulator, CheckoutRecord
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App on a fresh SQLite file, seeded with the default item types and locations"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'inventory.db'}",
+        'SQLITE_CHECKPOINT_INTERVAL': 0,
+        # Check for swapped databases on every request so statement counts don't depend on timing
+        'DATABASE_SWAP_CHECK_SECONDS': 0,
+    })
+    yield app
+    app.extensions['modal_cache'].close()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@contextmanager
+def count_statements(app):
+    """Collect every SQL statement the app's engine runs inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed_equipment(app, count, now=None):
+    """Add count tanks, regulators and BCDs, all with maintenance coming due within 30 days"""
+    now = now or datetime.now()
+    with app.app_context():
+        start = db.session.query(InventoryItem).count()
+        for i in range(start, start + count):
+            anchor = now - timedelta(days=350 + i % 10)
+            for item_type_id, serial in ((7, f"T{i:05d}"), (2, f"R{i:05d}"), (1, f"B{i:05d}")):
+                item = InventoryItem(item_type_id=item_type_id, manufacturer='Make', model='Model',
+                                     serial_number=serial, location_id=1, condition_code=2, intake_date=anchor)
+                db.session.add(item)
+                db.session.flush()
+                if item_type_id == 7:
+                    db.session.add(Tank(inventory_item_id=item.id, tank_number=str(i), vip_date=anchor,
+                                        hydro_date=anchor - timedelta(days=365)))
+                elif item_type_id == 2:
+                    db.session.add(Regulator(inventory_item_id=item.id, last_service_date=anchor))
+                else:
+                    db.session.add(BCD(inventory_item_id=item.id, last_maintenance=anchor))
+        db.session.commit()
+
+
+def seed_checkouts(app, count, month_start):
+    """Add count items, each checked out and half of them checked in again during one month"""
+    with app.app_context():
+        start = db.session.query(InventoryItem).count()
+        for i in range(start, start + count):
+            item = InventoryItem(item_type_id=3, manufacturer='Make', model='Wetsuit', serial_number=f"W{i:05d}",
+                                 location_id=2, condition_code=2, intake_date=month_start)
+            db.session.add(item)
+            db.session.flush()
+            checkout_date = month_start + timedelta(days=i % 20, minutes=i)
+            checked_in = i % 2 == 0
+            db.session.add(CheckoutRecord(
+                inventory_item_id=item.id, person_name=f"Diver {i % 7}", checkout_date=checkout_date,
+                checkin_date=checkout_date + timedelta(days=2) if checked_in else None,
+                checkout_condition=2, checkin_condition=2 if checked_in else None))
+            item.currently_checked_out = not checked_in
+        db.session.commit()
@@ -0,0 +1,103 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app import create_app
+from checkouts import check_out_item
+from conftest import seed_equipment
+from models import db, InventoryItem, CheckoutRecord
+
+
+def snapshot_serials(cache, key='global_bcds'):
+    return sorted(row['serial_number'] for row in cache.get()[key])
+
+
+def test_snapshot_hit_and_miss(app):
+    seed_equipment(app, 2)
+    cache = app.extensions['modal_cache']
+    with app.app_context():
+        assert snapshot_serials(cache) == ['B00000', 'B00001']
+        assert snapshot_serials(cache) == ['B00000', 'B00001']
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['rebuilds']) == (1, 1, 1)
+    assert stats['cached']
+
+
+def test_snapshot_expires_after_max_age(app):
+    cache = app.extensions['modal_cache']
+    cache.max_age = 0
+    with app.app_context():
+        cache.get()
+        cache.get()
+    assert (cache.stats()['misses'], cache.stats()['hits']) == (2, 0)
+
+
+def test_orm_write_invalidates(app):
+    seed_equipment(app, 1)
+    cache = app.extensions['modal_cache']
+    with app.app_context():
+        cache.get()
+        invalidations = cache.invalidations
+        item = InventoryItem.query.filter_by(serial_number='B00000').one()
+        item.serial_number = 'B-RENAMED'
+        db.session.commit()
+        assert cache.invalidations == invalidations + 1
+        assert snapshot_serials(cache) == ['B-RENAMED']
+
+
+def test_core_write_invalidates(app):
+    seed_equipment(app, 1)
+    cache = app.extensions['modal_cache']
+    items = InventoryItem.__table__
+    with app.app_context():
+        cache.get()
+        with db.engine.begin() as conn:
+            conn.execute(update(items).where(items.c.serial_number == 'B00000').values(serial_number='B-CORE'))
+        assert not cache.stats()['cached']
+        assert snapshot_serials(cache) == ['B-CORE']
+
+        item_id = db.session.query(InventoryItem.id).filter_by(serial_number='B-CORE').scalar()
+        cache.get()
+        with db.engine.begin() as conn:
+            check_out_item(conn, item_id, 'Diver')
+        assert not cache.stats()['cached']
+
+
+def test_reads_rollbacks_and_other_tables_keep_snapshot(app):
+    seed_equipment(app, 1)
+    cache = app.extensions['modal_cache']
+    items = InventoryItem.__table__
+    with app.app_context():
+        cache.get()
+        invalidations = cache.invalidations
+
+        InventoryItem.query.all()
+        db.session.commit()
+        with db.engine.connect() as conn:
+            conn.execute(update(items).values(model='Rolled back'))
+            conn.rollback()
+        item_id = db.session.query(InventoryItem.id).first()[0]
+        db.session.add(CheckoutRecord(inventory_item_id=item_id, person_name='Diver', checkout_date=datetime.now()))
+        db.session.commit()
+
+        assert cache.invalidations == invalidations
+        assert cache.stats()['cached']
+
+
+def test_writes_only_invalidate_their_own_app(app, tmp_path):
+    other = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'other.db'}",
+                        'SQLITE_CHECKPOINT_INTERVAL': 0})
+    try:
+        seed_equipment(other, 1)
+        other_cache = other.extensions['modal_cache']
+        with other.app_context():
+            other_cache.get()
+        invalidations = other_cache.invalidations
+
+        seed_equipment(app, 1)
+        assert other_cache.invalidations == invalidations
+        assert other_cache.stats()['cached']
+    finally:
+        other_cache.close()
+        with other.app_context():
+            db.engine.dispose()
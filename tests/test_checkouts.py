@@ -0,0 +1,143 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import select, func
+
+from checkouts import check_out_item, check_in_item, run_checkout_stress
+from storage import DEFAULT_PRAGMAS
+from models import db, InventoryItem, CheckoutRecord
+
+checkouts = CheckoutRecord.__table__
+
+
+def add_item(app, serial, condition_code=2):
+    with app.app_context():
+        item = InventoryItem(item_type_id=3, manufacturer='Make', model='Wetsuit', serial_number=serial,
+                             location_id=1, condition_code=condition_code)
+        db.session.add(item)
+        db.session.commit()
+        return item.id
+
+
+def checkout_rows(app, item_id):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            return conn.execute(select(checkouts).where(checkouts.c.inventory_item_id == item_id)
+                                .order_by(checkouts.c.id)).all()
+
+
+def test_check_out_and_in(app):
+    item_id = add_item(app, 'W1', condition_code=2)
+    out_at = datetime(2026, 3, 1, 9)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            assert check_out_item(conn, item_id, 'Diver', 'Trip', now=out_at) is True
+        with db.engine.begin() as conn:
+            assert check_in_item(conn, item_id, 4, 'Torn cuff', now=datetime(2026, 3, 3)) is True
+        item = db.session.get(InventoryItem, item_id)
+        assert not item.currently_checked_out
+        assert item.condition_code == 4
+
+    [record] = checkout_rows(app, item_id)
+    assert (record.person_name, record.checkout_date, record.checkout_condition) == ('Diver', out_at, 2)
+    assert (record.checkin_date, record.checkin_condition) == (datetime(2026, 3, 3), 4)
+    assert record.notes == 'Trip\n\nCheck-in notes: Torn cuff'
+
+
+def test_check_out_refuses_item_already_out(app):
+    item_id = add_item(app, 'W1')
+    with app.app_context():
+        with db.engine.begin() as conn:
+            assert check_out_item(conn, item_id, 'First') is True
+        with db.engine.begin() as conn:
+            assert check_out_item(conn, item_id, 'Second') is False
+
+    assert [row.person_name for row in checkout_rows(app, item_id)] == ['First']
+
+
+def test_check_out_and_in_of_missing_item(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            assert check_out_item(conn, 999, 'Diver') is False
+            assert check_in_item(conn, 999, 2) is False
+        assert db.session.query(CheckoutRecord).count() == 0
+
+
+def test_check_in_refuses_item_not_out(app):
+    item_id = add_item(app, 'W1', condition_code=2)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            assert check_in_item(conn, item_id, 5) is False
+        assert db.session.get(InventoryItem, item_id).condition_code == 2
+    assert checkout_rows(app, item_id) == []
+
+
+def test_check_in_closes_only_the_open_checkout(app):
+    item_id = add_item(app, 'W1')
+    with app.app_context():
+        for day in (1, 5):
+            with db.engine.begin() as conn:
+                check_out_item(conn, item_id, f'Diver {day}', now=datetime(2026, 3, day))
+            with db.engine.begin() as conn:
+                check_in_item(conn, item_id, 2, now=datetime(2026, 3, day + 1))
+
+    rows = checkout_rows(app, item_id)
+    assert [row.checkin_date for row in rows] == [datetime(2026, 3, 2), datetime(2026, 3, 6)]
+
+
+def test_checkout_routes_report_conflicts(app, client):
+    item_id = add_item(app, 'W1')
+    client.post(f'/checkout/{item_id}', data={'person_name': 'First'})
+    response = client.post(f'/checkout/{item_id}', data={'person_name': 'Second'}, follow_redirects=True)
+    assert 'This item is already checked out.' in response.get_data(as_text=True)
+
+    client.post(f'/checkin/{item_id}', data={'condition_code': '2'})
+    response = client.post(f'/checkin/{item_id}', data={'condition_code': '2'}, follow_redirects=True)
+    assert 'This item is not checked out.' in response.get_data(as_text=True)
+    assert client.post('/checkout/999', data={'person_name': 'Diver'}).status_code == 404
+    assert [row.person_name for row in checkout_rows(app, item_id)] == ['First']
+
+
+def test_simultaneous_checkouts_have_one_winner(app):
+    item_id = add_item(app, 'W1')
+    workers = 12
+    start = threading.Barrier(workers)
+    results = []
+    errors = []
+
+    with app.app_context():
+        engine = db.engine
+
+    def attempt(name):
+        start.wait()
+        try:
+            with engine.begin() as conn:
+                results.append(check_out_item(conn, item_id, name))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=attempt, args=(f'Diver {i}',)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results.count(True) == 1
+    assert results.count(False) == workers - 1
+    with app.app_context():
+        with engine.connect() as conn:
+            assert conn.execute(select(func.count()).where(
+                checkouts.c.inventory_item_id == item_id, checkouts.c.checkin_date.is_(None))).scalar() == 1
+        assert db.session.get(InventoryItem, item_id).currently_checked_out
+
+
+def test_checkout_stress_stays_consistent(app):
+    add_item(app, 'W1')
+    with app.app_context():
+        database = db.engine.url.database
+    result = run_checkout_stress(database, DEFAULT_PRAGMAS, workers=8, seconds=0.5)
+    assert result['errors'] == 0
+    assert result['final_winners'] == 1
+    assert result['open_checkouts'] == 1
+    assert result['consistent']
@@ -0,0 +1,26 @@
+from conftest import count_statements, seed_equipment
+
+
+def dashboard_statements(app, client):
+    with count_statements(app) as statements:
+        response = client.get('/')
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_dashboard_statement_count_is_constant(app, client):
+    seed_equipment(app, 5)
+    small = dashboard_statements(app, client)
+
+    seed_equipment(app, 45)
+    large = dashboard_statements(app, client)
+
+    assert small == large
+    assert large <= 10
+
+
+def test_dashboard_lists_upcoming_maintenance(app, client):
+    seed_equipment(app, 3)
+    body = client.get('/').get_data(as_text=True)
+    assert 'VIP Inspection' in body
+    assert 'alert-error' not in body
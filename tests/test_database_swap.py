@@ -0,0 +1,50 @@
+import sqlite3
+
+from conftest import count_statements
+from models import db
+
+
+def bump_user_version(app, version):
+    """Stamp the database the way an import copied in by another process does"""
+    with app.app_context():
+        path = db.engine.url.database
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(f"PRAGMA user_version = {version}")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def version_reads(statements):
+    return sum('user_version' in statement for statement in statements)
+
+
+def test_unchanged_database_is_not_queried(app, client):
+    client.get('/api/quick-maintenance/items?type=tank')
+    with count_statements(app) as statements:
+        client.get('/api/quick-maintenance/items?type=tank')
+    assert version_reads(statements) == 0
+
+
+def test_stamped_database_is_reopened(app, client):
+    client.get('/')
+    invalidations = app.extensions['modal_cache'].invalidations
+    bump_user_version(app, 7)
+
+    with count_statements(app) as statements:
+        assert client.get('/').status_code == 200
+    assert version_reads(statements) >= 1
+    assert app.extensions['modal_cache'].invalidations == invalidations + 1
+
+
+def test_checks_are_throttled(app, client):
+    app.config['DATABASE_SWAP_CHECK_SECONDS'] = 3600
+    client.get('/')
+    invalidations = app.extensions['modal_cache'].invalidations
+    bump_user_version(app, 8)
+
+    with count_statements(app) as statements:
+        client.get('/')
+    assert version_reads(statements) == 0
+    assert app.extensions['modal_cache'].invalidations == invalidations
@@ -0,0 +1,32 @@
+import io
+import zipfile
+from datetime import datetime
+
+import export
+from conftest import seed_checkouts
+
+
+def test_default_export_falls_back_to_csv_without_xlsxwriter(app, client, monkeypatch):
+    monkeypatch.setattr(export, 'xlsxwriter', None)
+    seed_checkouts(app, 3, datetime(2026, 3, 1))
+
+    for url in ('/export', '/export?format=xlsx'):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers['Content-Disposition'].endswith('.zip')
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            assert 'Inventory.csv' in archive.namelist()
+            assert archive.read('Checkouts.csv').decode().count('Diver') == 3
+
+
+def test_cli_export_falls_back_to_csv_without_xlsxwriter(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, 'xlsxwriter', None)
+    monkeypatch.chdir(tmp_path)
+
+    result = app.test_cli_runner().invoke(args=['export-excel'])
+    assert result.exit_code == 0, result.output
+    assert zipfile.is_zipfile(tmp_path / 'inventory_export.zip')
+
+    result = app.test_cli_runner().invoke(args=['export-excel', '--format', 'xlsx'])
+    assert result.exit_code == 1
+    assert 'xlsxwriter' in result.output
@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from conftest import count_statements
+from models import db, InventoryItem, CheckoutRecord
+
+
+def add_items(app, count):
+    with app.app_context():
+        items = [InventoryItem(item_type_id=3, manufacturer='Make', model='Wetsuit', serial_number=f"K{i}",
+                               location_id=1, condition_code=2) for i in range(count)]
+        db.session.add_all(items)
+        db.session.commit()
+        return [item.id for item in items]
+
+
+@contextmanager
+def count_commits(app):
+    commits = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn: commits.append(True)
+    event.listen(engine, 'commit', listener)
+    try:
+        yield commits
+    finally:
+        event.remove(engine, 'commit', listener)
+
+
+def kinds(statements):
+    """First keyword of each statement, leaving out the swap check's PRAGMA user_version"""
+    return [statement.split(None, 1)[0].upper() for statement in statements if not statement.startswith('PRAGMA')]
+
+
+def state(app):
+    """Checked-out flags by serial and (serial, person, open) per checkout record"""
+    with app.app_context():
+        flags = {item.serial_number: bool(item.currently_checked_out) for item in InventoryItem.query}
+        records = sorted((record.item.serial_number, record.person_name, record.checkin_date is None)
+                         for record in CheckoutRecord.query)
+    return flags, records
+
+
+def test_kit_checkout_and_checkin(app, client):
+    add_items(app, 3)
+    response = client.post('/api/checkout/kit', json={'person_name': 'Diver', 'items': ['K0', 'K1', 'K2']})
+    assert response.status_code == 200
+    assert response.get_json()['checked_out'] == 3
+    assert state(app) == ({'K0': True, 'K1': True, 'K2': True},
+                          [('K0', 'Diver', True), ('K1', 'Diver', True), ('K2', 'Diver', True)])
+
+    response = client.post('/api/checkin/kit', json={'items': {'K0': 1, 'K1': 4, 'K2': 2}})
+    assert response.status_code == 200
+    assert response.get_json()['checked_in'] == 3
+    assert state(app)[1] == [('K0', 'Diver', False), ('K1', 'Diver', False), ('K2', 'Diver', False)]
+    with app.app_context():
+        assert [item.condition_code for item in InventoryItem.query.order_by(InventoryItem.id)] == [1, 4, 2]
+
+
+def test_kit_checkout_with_unknown_item_changes_nothing(app, client):
+    add_items(app, 2)
+    before = state(app)
+    response = client.post('/api/checkout/kit', json={'person_name': 'Diver', 'items': ['K0', 'NOPE', 'K1']})
+    assert response.status_code == 409
+    assert response.get_json()['unknown'] == ['NOPE']
+    assert state(app) == before
+
+    response = client.post('/checkout/kit', data={'person_name': 'Diver', 'items': 'K0\nNOPE'})
+    body = response.get_data(as_text=True)
+    assert 'No items found for: NOPE' in body and 'Nothing was checked out.' in body
+    assert state(app) == before
+
+
+def test_kit_checkout_with_item_already_out_changes_nothing(app, client):
+    item_ids = add_items(app, 3)
+    client.post(f'/checkout/{item_ids[1]}', data={'person_name': 'Someone else'})
+    before = state(app)
+
+    response = client.post('/api/checkout/kit', json={'person_name': 'Diver', 'items': ['K0', 'K1', 'K2']})
+    assert response.status_code == 409
+    assert [row['serial_number'] for row in response.get_json()['unavailable']] == ['K1']
+    assert state(app) == before
+
+    response = client.post('/checkout/kit', data={'person_name': 'Diver', 'items': 'K0, K1, K2'})
+    assert 'Already checked out: K1' in response.get_data(as_text=True)
+    assert state(app) == before
+
+
+def test_kit_checkin_with_item_not_out_changes_nothing(app, client):
+    item_ids = add_items(app, 2)
+    client.post(f'/checkout/{item_ids[0]}', data={'person_name': 'Diver'})
+    before = state(app)
+
+    response = client.post('/api/checkin/kit', json={'items': {'K0': 1, 'K1': 1}})
+    assert response.status_code == 409
+    assert [row['serial_number'] for row in response.get_json()['unavailable']] == ['K1']
+    response = client.post('/api/checkin/kit', json={'items': {'K0': 1, 'NOPE': 1}})
+    assert response.status_code == 409
+    assert response.get_json()['unknown'] == ['NOPE']
+
+    response = client.post('/checkin/kit', data={'item_id': item_ids, f'condition_{item_ids[0]}': '1',
+                                                 f'condition_{item_ids[1]}': '1'}, follow_redirects=True)
+    assert 'nothing was checked in' in response.get_data(as_text=True)
+    assert state(app) == before
+    with app.app_context():
+        assert db.session.get(InventoryItem, item_ids[0]).condition_code == 2
+
+
+def test_kit_repeated_tokens_check_out_once(app, client):
+    item_ids = add_items(app, 2)
+    response = client.post('/api/checkout/kit', json={
+        'person_name': 'Diver', 'items': ['K0', 'K0', f'#{item_ids[0]}', str(item_ids[1]), 'K1']})
+    assert response.status_code == 200
+    assert response.get_json()['checked_out'] == 2
+    assert state(app)[1] == [('K0', 'Diver', True), ('K1', 'Diver', True)]
+
+    response = client.post('/checkout/kit', data={'person_name': 'Other', 'items': 'K0\nK0'})
+    assert 'Already checked out: K0' in response.get_data(as_text=True)
+    assert len(state(app)[1]) == 2
+
+
+def test_kit_statements_and_commits(app, client):
+    add_items(app, 20)
+    serials = [f"K{i}" for i in range(20)]
+
+    with count_statements(app) as statements, count_commits(app) as commits:
+        response = client.post('/api/checkout/kit', json={'person_name': 'Diver', 'items': serials})
+    assert response.status_code == 200
+    assert kinds(statements) == ['SELECT', 'UPDATE', 'INSERT']
+    assert len(commits) == 1
+
+    with count_statements(app) as statements, count_commits(app) as commits:
+        response = client.post('/api/checkin/kit', json={'items': {serial: 2 for serial in serials}})
+    assert response.status_code == 200
+    assert kinds(statements) == ['SELECT', 'UPDATE', 'UPDATE']
+    assert len(commits) == 1
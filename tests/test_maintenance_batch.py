@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+
+from conftest import seed_equipment
+from maintenance_rules import get_rule
+from models import db, Tank, BCD, MaintenanceRecord, TankMaintenanceRecord
+
+# Bound parameters per statement in SQLite builds before 3.32
+SQLITE_OLD_VARIABLE_LIMIT = 999
+
+
+def test_fleet_wide_due_by_batch_stays_under_the_variable_limit(app, client):
+    seed_equipment(app, 1100)
+    largest = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            largest.append(len(parameters or ()))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        due_by = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
+        response = client.post('/api/maintenance/batch', json={
+            'item_type': 'tank', 'type': 'VIP Inspection', 'date': '2026-10-18', 'due_by': due_by})
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['recorded'] == 1100
+    assert max(largest) <= SQLITE_OLD_VARIABLE_LIMIT
+
+    expected_due = get_rule('Tank', 'vip').next_due(datetime(2026, 10, 18))
+    with app.app_context():
+        assert db.session.query(func.count(TankMaintenanceRecord.id)).scalar() == 1100
+        assert db.session.query(func.count(Tank.id)).filter(Tank.next_vip_due != expected_due).scalar() == 0
+        assert db.session.query(func.count(Tank.id)).filter(
+            Tank.next_due != func.min(Tank.next_vip_due, Tank.next_hydro_due)).scalar() == 0
+
+
+def test_bcd_batch_reports_each_item_and_keeps_counters(app, client):
+    seed_equipment(app, 3)
+    response = client.post('/api/maintenance/batch', json={
+        'item_type': 'bcd', 'type': 'Regular maintenance', 'date': '2026-10-18',
+        'items': ['B00000', 'B00001', 'T00000', 'NOPE']})
+    summary = response.get_json()
+
+    assert response.status_code == 200
+    assert summary['recorded'] == 2
+    assert [(result.get('serial_number') or result.get('token'), result['status'])
+            for result in summary['results']] == [
+        ('B00000', 'recorded'), ('B00001', 'recorded'), ('NOPE', 'unknown'), ('T00000', 'wrong_type')]
+    with app.app_context():
+        counts = {bcd.id: bcd.maintenance_count for bcd in BCD.query}
+        actual = dict(db.session.query(MaintenanceRecord.bcd_id, func.count()).group_by(MaintenanceRecord.bcd_id))
+        assert counts == {bcd_id: actual.get(bcd_id, 0) for bcd_id in counts}
+        assert BCD.query.filter(BCD.last_maintenance == datetime(2026, 10, 18)).count() == 2
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from app import create_app
+from maintenance_rules import MAINTENANCE_RULES, get_rule, add_months
+from models import db, InventoryItem, Tank
+
+
+def add_tank(app, hydro_date):
+    with app.app_context():
+        item = InventoryItem(item_type_id=7, serial_number='T1', location_id=1, condition_code=2)
+        db.session.add(item)
+        db.session.flush()
+        tank = Tank(inventory_item_id=item.id, hydro_date=hydro_date)
+        db.session.add(tank)
+        db.session.commit()
+        return tank.next_hydro_due
+
+
+def test_add_months_clamps_to_month_end():
+    assert add_months(datetime(2024, 2, 29), 12) == datetime(2025, 2, 28)
+    assert add_months(datetime(2020, 2, 29), 60) == datetime(2025, 2, 28)
+    assert add_months(datetime(2024, 1, 31), 1) == datetime(2024, 2, 29)
+
+
+def test_interval_overrides_stay_with_their_app(app, tmp_path):
+    custom = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'custom.db'}",
+        'SQLITE_CHECKPOINT_INTERVAL': 0,
+        'MAINTENANCE_INTERVALS': {'Tank.hydro': 24},
+    })
+
+    with custom.app_context():
+        assert get_rule('Tank', 'hydro').months == 24
+    with app.app_context():
+        assert get_rule('Tank', 'hydro').months == 60
+    assert get_rule('Tank', 'hydro').months == 60
+    assert [rule.months for rule in MAINTENANCE_RULES] == [12, 12, 12, 60]
+
+    assert add_tank(custom, datetime(2024, 1, 15)) == datetime(2026, 1, 15)
+    assert add_tank(app, datetime(2024, 1, 15)) == datetime(2029, 1, 15)
+
+    with custom.app_context():
+        db.engine.dispose()
+
+
+def test_startup_warns_about_due_dates_from_other_intervals(app, capsys):
+    add_tank(app, datetime(2024, 1, 15))
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+              'SQLITE_CHECKPOINT_INTERVAL': 0, 'MAINTENANCE_INTERVALS': {'Tank.hydro': 24}}
+
+    def start():
+        capsys.readouterr()
+        custom = create_app(config)
+        with custom.app_context():
+            db.engine.dispose()
+        custom.extensions['modal_cache'].close()
+        return custom, capsys.readouterr().out
+
+    custom, output = start()
+    assert "Maintenance intervals changed for <MaintenanceRule Tank.hydro every 24 months>" in output
+    assert "flask backfill-due-dates" in output
+
+    result = custom.test_cli_runner().invoke(args=['backfill-due-dates'])
+    assert result.exit_code == 0, result.output
+    with custom.app_context():
+        assert Tank.query.one().next_hydro_due == datetime(2026, 1, 15)
+        db.engine.dispose()
+
+    custom, output = start()
+    assert "Maintenance intervals changed" not in output
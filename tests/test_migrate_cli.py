@@ -0,0 +1,97 @@
+import csv
+from datetime import datetime
+
+import openpyxl
+
+import migration
+from migration import SHEET_COLUMNS
+from models import InventoryItem
+
+
+def write_workbook(path, condition_code):
+    rows = {
+        'Item_Type': [[1, 'BCD'], [7, 'Tank']],
+        'Locations': [[1, 'Tech Locker']],
+        'Inventory': [[1, 1, 'Aqualung', 'Pro HD', 'B001', datetime(2024, 1, 15), None, 1, 'Yes',
+                       condition_code, None]],
+        'Tank_Inventory': [['T001', '12', 'Luxfer', datetime(2021, 3, 1), datetime(2025, 3, 1), 'Aluminum',
+                            3000, 'Air']],
+    }
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for sheet_name, header in SHEET_COLUMNS.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(header)
+        for row in rows[sheet_name]:
+            worksheet.append(row)
+    workbook.save(path)
+
+
+def test_dry_run_passes_a_clean_workbook(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_workbook(tmp_path / 'Inventory.xlsx', condition_code=2)
+
+    result = app.test_cli_runner().invoke(args=['migrate-excel', '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert 'No problems found' in result.output
+
+
+def test_dry_run_fails_on_problems_and_writes_the_report(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_workbook(tmp_path / 'Inventory.xlsx', condition_code=9)
+    report_file = tmp_path / 'report.csv'
+
+    result = app.test_cli_runner().invoke(args=['migrate-excel', '--validate', '--report', str(report_file)])
+    assert result.exit_code == 1
+    assert '1 problems found' in result.output
+    with open(report_file, newline='') as report:
+        problems = list(csv.DictReader(report))
+    assert [problem['check'] for problem in problems] == ['condition code out of range']
+
+
+def test_dry_run_fails_on_a_missing_workbook(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = app.test_cli_runner().invoke(args=['migrate-excel', '--dry-run'])
+    assert result.exit_code == 1
+    assert 'Could not read Inventory.xlsx' in result.output
+
+
+def test_import_replaces_the_app_database(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_workbook(tmp_path / 'Inventory.xlsx', condition_code=2)
+
+    result = app.test_cli_runner().invoke(args=['migrate-excel'])
+    assert result.exit_code == 0, result.output
+    assert 'Data migration completed.' in result.output
+    with app.test_client() as client:
+        client.get('/')
+    with app.app_context():
+        assert [item.serial_number for item in InventoryItem.query.order_by(InventoryItem.serial_number)] == [
+            'B001', 'T001']
+
+
+def test_failed_import_exits_nonzero_and_keeps_the_database(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_workbook(tmp_path / 'Inventory.xlsx', condition_code=2)
+
+    def fail_validation(*args):
+        raise RuntimeError("Row count mismatch")
+    monkeypatch.setattr(migration, 'validate_import', fail_validation)
+
+    result = app.test_cli_runner().invoke(args=['migrate-excel'])
+    assert result.exit_code == 1
+    assert 'Migration failed: Row count mismatch' in result.output
+    assert 'Data migration failed' in result.output
+    assert 'Data migration completed.' not in result.output
+    with app.app_context():
+        assert InventoryItem.query.count() == 0
+
+
+def test_resume_without_an_interrupted_import_exits_nonzero(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_workbook(tmp_path / 'Inventory.xlsx', condition_code=2)
+
+    result = app.test_cli_runner().invoke(args=['migrate-excel', '--resume'])
+    assert result.exit_code == 1
+    assert 'No interrupted import to resume' in result.output
+    assert 'Data migration completed.' not in result.output
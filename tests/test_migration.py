@@ -0,0 +1,174 @@
+import re
+import sqlite3
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+import migration
+from app import create_app
+from migration import SHEET_COLUMNS, migrate_data
+from models import db, Tank
+
+ITEM_TYPES = [[1, 'BCD'], [2, 'Regulator'], [7, 'Tank']]
+LOCATIONS = [[1, 'Tech Locker']]
+
+
+def inventory_row(item_id, serial, model='Pro HD', item_type=1):
+    return [item_id, item_type, 'Aqualung', model, serial, datetime(2024, 1, 15), None, 1, 'Yes', 2, None]
+
+
+def tank_row(tank_id, hydro=datetime(2021, 3, 1), vip=datetime(2025, 3, 1), gas='Air'):
+    return [tank_id, tank_id[1:], 'Luxfer', hydro, vip, 'Aluminum', 3000, gas]
+
+
+INVENTORY = [inventory_row(i, f"B{i:03d}") for i in range(1, 6)]
+TANKS = [tank_row(f"T{i:03d}") for i in range(1, 4)]
+
+
+def write_workbook(path, inventory=INVENTORY, tanks=TANKS):
+    rows = {'Item_Type': ITEM_TYPES, 'Locations': LOCATIONS, 'Inventory': inventory, 'Tank_Inventory': tanks}
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for sheet_name, header in SHEET_COLUMNS.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(header)
+        for row in rows[sheet_name]:
+            worksheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def import_dir(tmp_path, monkeypatch):
+    # migration.py logs to migration.log in the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def run_import(capsys, workbook, db_file, **kwargs):
+    """Import and return (inserted, updated, unchanged, deleted)"""
+    capsys.readouterr()
+    assert migrate_data(workbook, str(db_file), **kwargs) is True
+    output = capsys.readouterr().out
+    match = re.search(r'Import changes: (\d+) inserted, (\d+) updated, (\d+) unchanged, (\d+) deleted', output)
+    return tuple(int(value) for value in match.groups())
+
+
+def rows(db_file, sql):
+    with sqlite3.connect(db_file) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def tanks_by_serial(db_file):
+    return {row[0]: row[1:] for row in rows(db_file, '''
+        SELECT i.serial_number, t.hydro_date, t.vip_date, t.gas_type, t.next_hydro_due, t.next_vip_due, t.next_due
+        FROM tanks t JOIN inventory_items i ON i.id = t.inventory_item_id''')}
+
+
+def items_table(db_file):
+    # Tanks get the import's date as intake date
+    return rows(db_file, '''SELECT id, item_type_id, manufacturer, model, serial_number, condition_code
+                            FROM inventory_items ORDER BY id''')
+
+
+def test_incremental_reimport_of_unchanged_workbook(import_dir, capsys):
+    workbook = write_workbook(import_dir / 'Inventory.xlsx')
+    db_file = import_dir / 'inventory.db'
+    assert run_import(capsys, workbook, db_file) == (8, 0, 0, 0)
+    before = tanks_by_serial(db_file), items_table(db_file)
+
+    assert run_import(capsys, workbook, db_file, incremental=True) == (0, 0, 8, 0)
+    assert (tanks_by_serial(db_file), items_table(db_file)) == before
+
+
+def test_incremental_reimport_updates_changed_rows(import_dir, capsys):
+    db_file = import_dir / 'inventory.db'
+    run_import(capsys, write_workbook(import_dir / 'Inventory.xlsx'), db_file)
+
+    inventory = INVENTORY[:1] + [inventory_row(2, 'B002', model='Pro HD 2')] + INVENTORY[2:]
+    tanks = TANKS[:1] + [tank_row('T002', gas='Nitrox')] + TANKS[2:]
+    workbook = write_workbook(import_dir / 'Changed.xlsx', inventory, tanks)
+    assert run_import(capsys, workbook, db_file, incremental=True) == (0, 2, 6, 0)
+
+    assert rows(db_file, "SELECT model FROM inventory_items WHERE serial_number = 'B002'") == [('Pro HD 2',)]
+    assert tanks_by_serial(db_file)['T002'][2] == 'Nitrox'
+
+
+def test_incremental_reimport_keeps_inspections_recorded_in_the_app(import_dir, capsys):
+    db_file = import_dir / 'inventory.db'
+    run_import(capsys, write_workbook(import_dir / 'Inventory.xlsx'), db_file)
+
+    # A VIP recorded in the app after the workbook was exported
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{db_file}",
+                      'SQLITE_CHECKPOINT_INTERVAL': 0})
+    with app.app_context():
+        tank = Tank.query.filter_by(tank_number='001').one()
+        tank.vip_date = datetime(2026, 2, 1)
+        db.session.commit()
+        db.engine.dispose()
+    app.extensions['modal_cache'].close()
+    recorded = tanks_by_serial(db_file)['T001']
+
+    # The sheet changes T001's gas but still has the old VIP; T002 gets a newer hydro
+    tanks = [tank_row('T001', gas='Nitrox'), tank_row('T002', hydro=datetime(2026, 1, 10)), TANKS[2]]
+    workbook = write_workbook(import_dir / 'Changed.xlsx', INVENTORY, tanks)
+    assert run_import(capsys, workbook, db_file, incremental=True) == (0, 2, 6, 0)
+
+    tanks = tanks_by_serial(db_file)
+    assert tanks['T001'][2] == 'Nitrox'
+    assert tanks['T001'][:2] == recorded[:2]
+    assert tanks['T001'][3:] == recorded[3:]
+    assert tanks['T001'][1].startswith('2026-02-01')
+    assert tanks['T002'][0].startswith('2026-01-10')
+    assert tanks['T002'][3].startswith('2031-01-10')
+    # next_due is the earlier of the hydro and VIP due dates
+    assert tanks['T002'][5] == min(tanks['T002'][3], tanks['T002'][4])
+
+
+def test_incremental_reimport_deletes_removed_rows_without_history(import_dir, capsys):
+    db_file = import_dir / 'inventory.db'
+    run_import(capsys, write_workbook(import_dir / 'Inventory.xlsx'), db_file)
+    with sqlite3.connect(db_file) as conn:
+        conn.execute('''INSERT INTO checkout_records (inventory_item_id, person_name, checkout_date)
+                        SELECT id, 'Diver', '2026-01-01 00:00:00.000000' FROM inventory_items
+                        WHERE serial_number = 'B002' ''')
+
+    workbook = write_workbook(import_dir / 'Changed.xlsx', INVENTORY[:1] + INVENTORY[2:4], TANKS[:2])
+    assert run_import(capsys, workbook, db_file, incremental=True) == (0, 0, 5, 2)
+
+    serials = {row[0] for row in rows(db_file, 'SELECT serial_number FROM inventory_items')}
+    # B002 has checkout history, so it stays
+    assert serials == {'B001', 'B002', 'B003', 'B004', 'T001', 'T002'}
+
+
+def test_workers_build_the_same_database(import_dir, capsys):
+    workbook = write_workbook(import_dir / 'Inventory.xlsx')
+    run_import(capsys, workbook, import_dir / 'serial.db')
+    assert run_import(capsys, workbook, import_dir / 'parallel.db', workers=2) == (8, 0, 0, 0)
+
+    assert items_table(import_dir / 'parallel.db') == items_table(import_dir / 'serial.db')
+    assert tanks_by_serial(import_dir / 'parallel.db') == tanks_by_serial(import_dir / 'serial.db')
+
+
+def test_resume_continues_an_interrupted_import(import_dir, capsys, monkeypatch):
+    workbook = write_workbook(import_dir / 'Inventory.xlsx')
+    run_import(capsys, workbook, import_dir / 'straight.db')
+    db_file = import_dir / 'inventory.db'
+
+    insert_tanks = migration.insert_tanks
+
+    def fail_on_tanks(*args):
+        raise RuntimeError("Interrupted")
+    monkeypatch.setattr(migration, 'insert_tanks', fail_on_tanks)
+    assert migrate_data(workbook, str(db_file), batch_size=2) is False
+    # The committed inventory batches are kept for --resume; the live database is untouched
+    assert (import_dir / 'inventory.db.import').exists()
+    assert not db_file.exists()
+
+    monkeypatch.setattr(migration, 'insert_tanks', insert_tanks)
+    changes = run_import(capsys, workbook, db_file, batch_size=2, resume=True)
+    assert sum(changes[:2]) == 8
+    assert not (import_dir / 'inventory.db.import').exists()
+    assert items_table(db_file) == items_table(import_dir / 'straight.db')
+    assert tanks_by_serial(db_file) == tanks_by_serial(import_dir / 'straight.db')
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+
+from app import create_app, QUERY_PLAN_PAGES, query_plan_page_ids, explain_page_queries, full_table_scans
+from conftest import seed_equipment, seed_checkouts
+from models import db, BCD, MaintenanceRecord
+
+
+@pytest.fixture
+def seeded_app(app):
+    now = datetime.now()
+    seed_equipment(app, 30, now)
+    seed_checkouts(app, 30, now.replace(day=1, hour=0, minute=0, second=0, microsecond=0))
+    with app.app_context():
+        db.session.add(MaintenanceRecord(bcd_id=db.session.query(BCD.id).first()[0], date=now,
+                                         maintenance_type='Annual Service'))
+        db.session.commit()
+    return app
+
+
+@pytest.mark.parametrize('page', QUERY_PLAN_PAGES)
+def test_hot_page_queries_use_indexes(seeded_app, page):
+    client = seeded_app.test_client()
+    with seeded_app.app_context():
+        response, plans = explain_page_queries(client, page.format(**query_plan_page_ids()))
+
+    assert response.status_code == 200
+    assert plans
+    for statement, plan in plans:
+        assert full_table_scans(statement, plan) == [], (
+            ' '.join(statement.split()) + '\n' + '\n'.join(row[3] for row in plan))
+
+
+def test_full_table_scans_ignores_unfiltered_statements_and_lookup_tables():
+    plan = [(2, 0, 0, 'SCAN inventory_items')]
+    assert full_table_scans('SELECT * FROM inventory_items WHERE id > 1', plan) == ['SCAN inventory_items']
+    assert full_table_scans('SELECT count(*) FROM inventory_items', plan) == []
+    assert full_table_scans('SELECT * FROM item_types WHERE id > 1', [(2, 0, 0, 'SCAN item_types')]) == []
+
+
+def test_existing_database_gets_missing_indexes_on_startup(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP INDEX ix_checkout_records_person_name')
+            conn.exec_driver_sql('DROP INDEX ix_checkout_records_open')
+        db.engine.dispose()
+
+    reopened = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI']})
+    with reopened.app_context():
+        with db.engine.connect() as conn:
+            names = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        db.engine.dispose()
+    assert {'ix_checkout_records_person_name', 'ix_checkout_records_open'} <= names
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from conftest import count_statements, seed_checkouts
+
+MONTH_START = datetime(2026, 3, 1)
+PAGES = ('/reports/monthly/2026/3', '/checkouts', '/checkouts?status=open')
+
+
+def page_statements(app, client):
+    counts = {}
+    for url in PAGES:
+        with count_statements(app) as statements:
+            response = client.get(url)
+        assert response.status_code == 200, url
+        counts[url] = len(statements)
+    return counts
+
+
+def test_report_statement_counts_are_constant(app, client):
+    seed_checkouts(app, 10, MONTH_START)
+    small = page_statements(app, client)
+
+    seed_checkouts(app, 60, MONTH_START)
+    large = page_statements(app, client)
+
+    assert small == large
+
+
+def test_monthly_report_lists_checkouts_and_checkins(app, client):
+    seed_checkouts(app, 4, MONTH_START)
+    body = client.get('/reports/monthly/2026/3').get_data(as_text=True)
+    assert all(f'Diver {i}' in body for i in range(4))
+    assert 'alert-error' not in body
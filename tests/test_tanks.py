@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+from app import TANK_COLUMNS, tank_status_table, group_tanks_by_status
+from models import db, InventoryItem, Tank
+
+
+def tank_status_reference(tanks, now, upcoming_end):
+    """Group (tank, item) pairs the way the tanks list did before tank_status_table
+
+    Evaluates the Tank maintenance methods, formats each date and sorts each
+    bucket in Python, one tank at a time.
+    """
+    def formatted(value):
+        return value.strftime('%m/%d/%Y') if value else 'Not Available'
+
+    tanks_by_status = {
+        'due': [],
+        'upcoming': [],
+        'current': []
+    }
+    for tank, item in tanks:
+        next_hydro = tank.get_next_hydro_date()
+        next_vip = tank.get_next_vip_date()
+        next_maintenance_date = tank.next_maintenance_date()
+        tank_data = {
+            'id': tank.id,
+            'inventory_id': item.id,
+            'Tank_ID': tank.id,
+            'Tank_Number': tank.tank_number,
+            'Manufacturer': item.manufacturer,
+            'Serial_Number': item.serial_number,
+            'Hydro_Date': tank.hydro_date,
+            'VIP_Date': tank.vip_date,
+            'Tank_Material': tank.tank_material,
+            'Working_Pressure': tank.working_pressure,
+            'Gas_Type': tank.gas_type,
+            'location': item.location_id,
+            'condition_code': item.condition_code,
+            'maintenance_due': tank.maintenance_due(),
+            'next_maintenance_type': tank.next_maintenance_type(),
+            'next_maintenance_date': next_maintenance_date,
+            'currently_checked_out': item.currently_checked_out,
+            'Hydro_Date_Formatted': formatted(tank.hydro_date),
+            'VIP_Date_Formatted': formatted(tank.vip_date),
+            'next_hydro_date': next_hydro,
+            'next_hydro_date_Formatted': formatted(next_hydro),
+            'next_vip_date': next_vip,
+            'next_vip_date_Formatted': formatted(next_vip),
+            'next_maintenance_date_Formatted': formatted(next_maintenance_date)
+        }
+
+        if tank_data['maintenance_due']:
+            tanks_by_status['due'].append(tank_data)
+        elif next_maintenance_date and next_maintenance_date <= upcoming_end:
+            tanks_by_status['upcoming'].append(tank_data)
+        else:
+            tanks_by_status['current'].append(tank_data)
+
+    for status in tanks_by_status:
+        tanks_by_status[status] = sorted(
+            tanks_by_status[status],
+            key=lambda x: x['next_maintenance_date'] or datetime(9999, 12, 31)
+        )
+    return tanks_by_status
+
+
+def seed_tanks(app, now):
+    """Tanks covering Feb 29 anchors, missing dates and every status bucket"""
+    anchors = [
+        (datetime(2020, 2, 29), datetime(2024, 2, 29)),         # both due, clamped to Feb 28
+        (datetime(2024, 2, 29), None),                          # hydro only, due 2029-02-28
+        (None, datetime(2016, 2, 29)),                          # VIP only, long overdue
+        (None, None),                                           # no dates at all
+        (now - timedelta(days=1820), now - timedelta(days=300)),  # hydro coming up within 30 days
+        (now - timedelta(days=400), now - timedelta(days=350)),   # VIP coming up
+        (now - timedelta(days=100), now - timedelta(days=100)),   # current
+        (now - timedelta(days=100), now - timedelta(days=100)),   # tie with the row above
+        (now - timedelta(days=1900), now - timedelta(days=10)),   # hydro overdue, VIP current
+    ]
+    with app.app_context():
+        for i, (hydro_date, vip_date) in enumerate(anchors):
+            item = InventoryItem(item_type_id=7, manufacturer='Luxfer', model='AL80', serial_number=f"T{i:03d}",
+                                 location_id=1, condition_code=2)
+            db.session.add(item)
+            db.session.flush()
+            db.session.add(Tank(inventory_item_id=item.id, tank_number=str(i), hydro_date=hydro_date,
+                                vip_date=vip_date, working_pressure=3000, gas_type='Air'))
+        db.session.commit()
+
+
+def test_tank_status_table_matches_per_row_reference(app, client):
+    now = datetime.now()
+    seed_tanks(app, now)
+    upcoming_end = now + timedelta(days=30)
+
+    with app.app_context():
+        tanks = db.session.query(Tank, InventoryItem).join(
+            InventoryItem, Tank.inventory_item_id == InventoryItem.id).order_by(Tank.id).all()
+        rows = db.session.query(*TANK_COLUMNS).join(
+            InventoryItem, Tank.inventory_item_id == InventoryItem.id
+        ).order_by(Tank.next_due.is_(None), Tank.next_due, Tank.id).all()
+
+        expected = tank_status_reference(tanks, now, upcoming_end)
+        actual = group_tanks_by_status(*tank_status_table(rows, now, upcoming_end))
+
+    assert actual == expected
+    assert [len(expected[status]) for status in ('due', 'upcoming', 'current')] == [3, 2, 4]
+    assert expected['due'][0]['next_maintenance_date'] == datetime(2017, 2, 28)
+    assert expected['current'][-2]['next_maintenance_date'] == datetime(2029, 2, 28)
+    assert expected['current'][-1]['next_maintenance_date'] is None
+
+
+def test_tanks_page_renders(app, client):
+    seed_tanks(app, datetime.now())
+    body = client.get('/tanks').get_data(as_text=True)
+    assert '02/28/2025' in body
+    assert 'alert-error' not in body